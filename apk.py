@@ -4,7 +4,11 @@
 import os
 import re
 from pathlib import Path
-from utils import CURRENT_DIR, log
+import fingerprint
+import patchplan
+from patchlog import PatchManifest, apply_once
+from pristine import write_patched
+from utils import CURRENT_DIR, log, stage
 
 def patch_verifier(file_path: Path) -> bool:
     """
@@ -68,47 +72,54 @@ def patch_verifier(file_path: Path) -> bool:
 
         # Ghi file nếu có thay đổi
         if replaced:
-            file_path.write_text("".join(new_lines), encoding="utf-8")
+            write_patched(file_path, "".join(new_lines))
             return True
         
         return False
 
     except Exception as e:
-        log(f"Lỗi khi patch {file_path.name}: {e}", "ERROR")
+        log(f"Lỗi khi patch {file_path.name}: {e}", "ERROR", file=str(file_path), method=method_key)
         return False
 
+def patch_apk(base=CURRENT_DIR) -> bool:
+    with stage("apk protection"):
+        return _patch_apk(base)
+
+def _patch_apk(base) -> bool:
+    # Class index (smali_classes4) thay đổi tùy ROM/Android Version: plans.locate tìm dex thực tế
+    plans = patchplan.PatchPlans()
+    unpack_root = base / "framework_unpacked"
+    target_file = plans.locate(unpack_root, "Landroid/util/apk/ApkSignatureVerifier;", "smali_classes4")
+    if target_file is None:
+        log("Không tìm thấy ApkSignatureVerifier.smali trong framework_unpacked", "WARN")
+        return False
+
+    # Thực hiện patch (bỏ qua nếu đã vá ở lần chạy trước)
+    manifest = PatchManifest(unpack_root)
+    patched = apply_once(manifest, target_file, patch_verifier, plans)
+    manifest.save()
+    plans.report()
+    if patched is None:
+        log("ApkSignatureVerifier.smali đã được vá từ trước", "INFO")
+        return True
+    if patched:
+        log("Đã vá thành công ApkSignatureVerifier.smali", "SUCCESS")
+        return True
+    log("Không tìm thấy method cần vá hoặc lỗi khi ghi file.", "INFO")
+    return False
+
 def main():
-    # 1. Kiểm tra biến môi trường từ GitHub Action
+    # Kiểm tra biến môi trường từ GitHub Action
     if os.getenv("ENABLE_MOD") == "false":
         log("SKIP: Apk Protection (User disabled)", "WARN")
         return
-
-    log("Thực hiện APK Protection bypass...", "PROCESS")
-
-    # 2. Đường dẫn file mục tiêu
-    # Lưu ý: Class index (smali_classes4) có thể thay đổi tùy ROM/Android Version.
-    # Code này sử dụng đường dẫn mặc định như script gốc.
-    target_file = (
-        CURRENT_DIR 
-        / "framework_unpacked" 
-        / "smali_classes4" 
-        / "android" 
-        / "util" 
-        / "apk" 
-        / "ApkSignatureVerifier.smali"
-    )
-
-    # 3. Kiểm tra file tồn tại
-    if not target_file.exists():
-        log(f"Không tìm thấy file mục tiêu: {target_file}", "WARN")
-        # Có thể thêm logic loop tìm trong các smali_classes* khác nếu cần thiết
+    reason = fingerprint.skip_reason("apk")
+    if reason:
+        log(f"SKIP: Apk Protection ({reason})", "WARN")
         return
 
-    # 4. Thực hiện patch
-    if patch_verifier(target_file):
-        log("Đã vá thành công ApkSignatureVerifier.smali", "SUCCESS")
-    else:
-        log("Không tìm thấy method cần vá hoặc lỗi khi ghi file.", "INFO")
+    log("Thực hiện APK Protection bypass...", "PROCESS")
+    patch_apk()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# batch.py
+#
+# Patch nhiều bộ framework trong một lần chạy.
+# Manifest (JSON):
+# {
+#   "sets": [
+#     {
+#       "name": "alioth",
+#       "jars": {"framework.jar": "roms/alioth/framework.jar", "services.jar": "..."},
+#       "opt_fix_bootloop": true,
+#       "opt_patch_apk": true,
+#       "opt_patch_kaori": true
+#     }
+#   ]
+# }
+# Đường dẫn jar tính tương đối theo thư mục chứa manifest.
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import apk
+import bootloop
+import events
+import fingerprint
+import kaori
+import ramspace
+import repack
+import unpack
+from cache import DecompileCache, DexCache
+from utils import CURRENT_DIR, TARGET_JARS, check_tools, log, delete_dir, ensure_dir
+
+DEFAULT_OPTIONS = {
+    "opt_fix_bootloop": True,
+    "opt_patch_apk": True,
+    "opt_patch_kaori": True,
+}
+# Bước patch (tên trong run report của fingerprint.py) -> option trong manifest
+STAGE_OPTIONS = {
+    "bootloop": "opt_fix_bootloop",
+    "apk": "opt_patch_apk",
+    "kaori": "opt_patch_kaori",
+}
+
+def load_manifest(manifest_path: Path) -> list:
+    data = json.loads(manifest_path.read_text(encoding="utf-8"))
+    sets = data["sets"] if isinstance(data, dict) else data
+    root = manifest_path.parent
+    result = []
+    seen = set()
+    for index, entry in enumerate(sets):
+        name = str(entry.get("name") or f"set{index}")
+        if name in seen:
+            raise ValueError(f"Trùng tên bộ framework: {name}")
+        seen.add(name)
+        jars = {}
+        for jar_name, jar_path in entry.get("jars", {}).items():
+            if jar_name not in TARGET_JARS:
+                raise ValueError(f"{name}: jar không hỗ trợ {jar_name}")
+            jars[jar_name] = str((root / jar_path).resolve())
+        if "framework.jar" not in jars:
+            raise ValueError(f"{name}: thiếu framework.jar")
+        options = {key: bool(entry.get(key, default)) for key, default in DEFAULT_OPTIONS.items()}
+        result.append({"name": name, "jars": jars, **options})
+    return result
+
+def process_set(job: dict, out_root: str, keep_work: bool, ram_share: int = 1) -> dict:
+    """
+    Chạy đủ 5 bước cho một bộ framework trong thư mục làm việc riêng.
+    ram_share: số process chạy song song, chia đều budget RAM workspace giữa chúng.
+    """
+    started = time.time()
+    ramspace.set_share(ram_share)
+    out_dir = Path(out_root) / job["name"]
+    work = out_dir / "work"
+    delete_dir(work)
+    ensure_dir(work)
+    result = {"name": job["name"], "ok": False, "module": None, "error": None}
+
+    try:
+        for jar_name, jar_path in job["jars"].items():
+            shutil.copy2(jar_path, work / jar_name)
+
+        # Nhận diện ROM của từng bộ: API level cho smali và các bước patch không áp dụng được
+        fingerprint.preflight(work)
+        decompile_cache = DecompileCache()
+        for jar_name in TARGET_JARS:
+            if jar_name in job["jars"] and not unpack.unpack_jar(jar_name, work, decompile_cache):
+                raise RuntimeError(f"Giải nén thất bại: {jar_name}")
+
+        selected = fingerprint.select_stages([stage for stage, option in STAGE_OPTIONS.items() if job[option]], work)
+        skipped = {stage: fingerprint.skip_reason(stage, work) for stage in STAGE_OPTIONS
+                   if job[STAGE_OPTIONS[stage]] and stage not in selected}
+        if skipped:
+            result["skipped"] = skipped
+        if "bootloop" in selected:
+            result["bootloop_fixed"] = bootloop.fix_bootloop(work)
+        if "apk" in selected:
+            result["apk_patched"] = apk.patch_apk(work)
+        if "kaori" in selected:
+            result["kaori_patched"] = kaori.patch_kaori(work)
+
+        if not repack.repack_classes(work, DexCache()):
+            raise RuntimeError("Repack classes thất bại")
+        repack.repack_jars(work)
+        result["module"] = str(repack.create_module(work, out_dir / "Module-framework-test.zip"))
+        result["ok"] = True
+    except Exception as exc:
+        result["error"] = str(exc)
+    finally:
+        if not keep_work:
+            delete_dir(work)
+        result["seconds"] = round(time.time() - started, 2)
+    return result
+
+def run_batch(jobs: list, out_root: Path, workers: int, keep_work: bool = False) -> list:
+    ensure_dir(out_root)
+    # Dựng sẵn phần tĩnh của module trước khi chia việc để các process dùng chung
+    repack.module_fragment()
+
+    results = []
+    progress = events.Progress("batch", len(jobs), "sets")
+    # Process con không in log text; ở chế độ json chúng vẫn phát sự kiện có kèm pid
+    with ProcessPoolExecutor(max_workers=workers, initializer=events.set_quiet) as pool:
+        share = max(1, min(workers, len(jobs)))
+        futures = {pool.submit(process_set, job, str(out_root), keep_work, share): job for job in jobs}
+        for future in as_completed(futures):
+            job = futures[future]
+            try:
+                res = future.result()
+            except Exception as exc:
+                res = {"name": job["name"], "ok": False, "module": None, "error": str(exc)}
+            if res["ok"]:
+                log(f"[{res['name']}] OK ({res['seconds']}s) -> {res['module']}", "SUCCESS")
+            else:
+                log(f"[{res['name']}] Lỗi: {res['error']}", "ERROR", set=res["name"])
+            events.emit("set_result", **res)
+            results.append(res)
+            progress.advance()
+
+    results.sort(key=lambda r: r["name"])
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Patch nhiều bộ framework trong một lần chạy")
+    parser.add_argument("manifest", type=Path, help="File manifest JSON")
+    parser.add_argument("-o", "--out", type=Path, default=CURRENT_DIR / "batch_out", help="Thư mục output")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Số bộ xử lý song song")
+    parser.add_argument("--keep-work", action="store_true", help="Giữ lại thư mục làm việc")
+    parser.add_argument("--events", choices=["json"], help="Xuất sự kiện tiến độ dạng JSON thay cho log text")
+    args = parser.parse_args()
+    events.configure(args.events)
+
+    if not check_tools():
+        sys.exit(1)
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (OSError, ValueError, KeyError) as exc:
+        log(f"Manifest không hợp lệ: {exc}", "ERROR")
+        sys.exit(2)
+
+    log(f"Batch: {len(jobs)} bộ framework, {args.jobs} process", "PROCESS")
+    results = run_batch(jobs, args.out, max(1, args.jobs), args.keep_work)
+
+    report = args.out / "batch_report.json"
+    report.write_text(json.dumps(results, indent=2, ensure_ascii=False), encoding="utf-8")
+    failed = [r["name"] for r in results if not r["ok"]]
+    log(f"Hoàn tất: {len(results) - len(failed)}/{len(results)} OK. Report: {report}",
+        "SUCCESS" if not failed else "WARN")
+    if failed:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+# bench.py
+#
+# Micro-benchmark các patcher và các bước quét thư mục trên smali sinh giả (smaligen.py).
+#   python bench.py                                  chạy và in bảng kết quả
+#   python bench.py --save-baseline bench_baseline.json
+#   python bench.py --baseline bench_baseline.json --threshold 0.2   (exit 1 nếu chậm hơn 20%)
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import events
+import smaligen
+from apk import patch_verifier
+from bootloop import fix_smali_content
+from cache import hash_tree
+from kaori import (
+    modify_application_package_manager_kaori, modify_instrumentation_kaori,
+    modify_keystore2_kaori, modify_android_keystore_spi_kaori,
+)
+
+PATCHERS = [
+    ("fix_smali_content", fix_smali_content, "RecordClass"),
+    ("patch_verifier", patch_verifier, "ApkSignatureVerifier"),
+    ("modify_application_package_manager_kaori", modify_application_package_manager_kaori, "ApplicationPackageManager"),
+    ("modify_instrumentation_kaori", modify_instrumentation_kaori, "Instrumentation"),
+    ("modify_keystore2_kaori", modify_keystore2_kaori, "KeyStore2"),
+    ("modify_android_keystore_spi_kaori", modify_android_keystore_spi_kaori, "AndroidKeyStoreSpi"),
+]
+
+def _measure(fn, repeat, setup=None):
+    timings = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def _result(name, timings, files, nbytes):
+    median = statistics.median(timings)
+    return {
+        "name": name,
+        "median_s": median,
+        "best_s": min(timings),
+        "files_per_s": files / median if median else 0.0,
+        "mb_per_s": nbytes / (1 << 20) / median if median else 0.0,
+        "files": files,
+        "bytes": nbytes,
+    }
+
+def bench_patchers(workdir: Path, scale: float, repeat: int, invoke_custom_sites: int) -> list:
+    results = []
+    for name, patcher, target in PATCHERS:
+        generator = smaligen.PATCH_TARGETS[target]
+        if target == "RecordClass":
+            text = generator(invoke_custom_sites=invoke_custom_sites, filler_methods=max(1, int(8 * scale)))
+        else:
+            defaults = generator.__defaults__
+            text = generator(target_bytes=int(defaults[0] * scale))
+        path = workdir / f"{target}.smali"
+        data = text.encode("utf-8")
+
+        def setup(path=path, data=data):
+            path.write_bytes(data)
+
+        timings = _measure(lambda: patcher(path), repeat, setup)
+        results.append(_result(name, timings, 1, len(data)))
+    return results
+
+def bench_scans(workdir: Path, files: int, repeat: int) -> list:
+    tree = workdir / "tree" / "smali_classes"
+    nbytes = smaligen.write_tree(tree, files=files)
+    base = tree.parent
+    scans = [
+        ("scan_os_walk", lambda: sum(len(f) for _, _, f in os.walk(tree))),
+        ("scan_rglob_smali", lambda: sum(1 for _ in tree.rglob("*.smali"))),
+        ("scan_rglob_dex", lambda: list(base.rglob("*.dex"))),
+        ("scan_smali_dirs", lambda: [c for c in base.iterdir() if c.is_dir() and c.name.startswith("smali_classes")]),
+        ("hash_tree", lambda: hash_tree(tree)),
+    ]
+    return [_result(name, _measure(fn, repeat), files, nbytes) for name, fn in scans]
+
+def compare(results, baseline, threshold) -> list:
+    old = {row["name"]: row for row in baseline.get("results", [])}
+    regressions = []
+    for row in results:
+        ref = old.get(row["name"])
+        if not ref or not ref["median_s"]:
+            row["delta"] = None
+            continue
+        row["delta"] = row["median_s"] / ref["median_s"] - 1
+        if row["delta"] > threshold:
+            regressions.append(row)
+    return regressions
+
+def print_table(results):
+    print(f"\n{'benchmark':<44} {'median ms':>10} {'best ms':>9} {'files/s':>10} {'MB/s':>8} {'Δ':>8}")
+    for row in results:
+        delta = row.get("delta")
+        delta = f"{delta * 100:+7.1f}%" if delta is not None else f"{'-':>8}"
+        print(f"{row['name']:<44} {row['median_s'] * 1000:>10.2f} {row['best_s'] * 1000:>9.2f} "
+              f"{row['files_per_s']:>10.1f} {row['mb_per_s']:>8.1f} {delta}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark patcher trên smali sinh giả")
+    parser.add_argument("--scale", type=float, default=1.0, help="Hệ số kích thước file mục tiêu")
+    parser.add_argument("--files", type=int, default=2000, help="Số file trong cây quét thư mục")
+    parser.add_argument("--invoke-custom", type=int, default=3, help="Số invoke-custom mỗi method của record class")
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--only", choices=["patchers", "scans"])
+    parser.add_argument("--baseline", type=Path, help="So sánh với baseline đã lưu")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Ngưỡng regression (0.2 = chậm hơn 20%%)")
+    parser.add_argument("--save-baseline", type=Path)
+    parser.add_argument("--json", type=Path, help="Ghi kết quả dạng JSON")
+    args = parser.parse_args()
+
+    # Patcher gọi utils.log khi lỗi; tắt text để không làm nhiễu số đo
+    events.set_quiet()
+    workdir = Path(tempfile.mkdtemp(prefix="kaori_bench_"))
+    try:
+        results = []
+        if args.only in (None, "patchers"):
+            results += bench_patchers(workdir, args.scale, args.repeat, args.invoke_custom)
+        if args.only in (None, "scans"):
+            results += bench_scans(workdir, args.files, max(1, args.repeat // 3))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    regressions = []
+    if args.baseline:
+        regressions = compare(results, json.loads(args.baseline.read_text(encoding="utf-8")), args.threshold)
+    print_table(results)
+
+    payload = {
+        "params": {"scale": args.scale, "files": args.files, "invoke_custom": args.invoke_custom, "repeat": args.repeat},
+        "results": results,
+    }
+    if args.json:
+        args.json.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(payload, indent=2), encoding="utf-8")
+        print(f"\n💾 Baseline: {args.save_baseline}")
+    if regressions:
+        print(f"\n❌ Regression > {args.threshold * 100:.0f}%: {', '.join(r['name'] for r in regressions)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
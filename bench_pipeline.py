@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+# bench_pipeline.py
+#
+# Benchmark end-to-end unpack → patch → repack → module với công cụ giả lập (standin_tools.py)
+# và jar sinh giả (smaligen.py), không cần ROM thật hay Java.
+# Tách phần chi phí phía Python (quét, copy, zip, spawn process) nhờ profiling trace.
+#   python bench_pipeline.py                         chạy theo workflow (5 script tuần tự)
+#   python bench_pipeline.py --mode dag              chạy pipeline.py
+#   python bench_pipeline.py --baseline b.json       exit 1 nếu chậm hơn ngưỡng
+
+import argparse
+import json
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import zipfile
+from collections import defaultdict
+from pathlib import Path
+
+import smaligen
+from profiling import load_events
+from standin_tools import pack_dex
+
+REPO_DIR = Path(__file__).resolve().parent
+WORKFLOW_SCRIPTS = ["unpack.py", "bootloop.py", "apk.py", "kaori.py", "repack.py"]
+
+# Vị trí các class mà patcher tìm (khớp đường dẫn cố định trong các script)
+PATCH_TARGETS = {
+    "framework.jar": {
+        "classes": {
+            "android/app/ApplicationPackageManager.smali": smaligen.application_package_manager,
+            "android/app/Instrumentation.smali": smaligen.instrumentation,
+        },
+        "classes2": {
+            "android/hardware/input/PhysicalKeyLayout$EnterKey.smali": smaligen.record_class,
+        },
+        "classes3": {
+            "android/security/KeyStore2.smali": smaligen.keystore2,
+            "android/security/keystore2/AndroidKeyStoreSpi.smali": smaligen.android_keystore_spi,
+        },
+        "classes4": {
+            "android/util/apk/ApkSignatureVerifier.smali": smaligen.apk_signature_verifier,
+        },
+    },
+    "services.jar": {
+        "classes": {
+            "com/android/server/BinaryTransparencyService$Digest.smali":
+                lambda: smaligen.record_class("com/android/server/BinaryTransparencyService$Digest"),
+        },
+    },
+}
+
+def _tree_files(files, seed):
+    tmp = Path(tempfile.mkdtemp(prefix="kaori_gen_"))
+    try:
+        smaligen.write_tree(tmp, files=files, seed=seed)
+        return {
+            path.relative_to(tmp).as_posix(): path.read_bytes()
+            for path in tmp.rglob("*.smali")
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+def make_jars(root: Path, dex_per_jar: int, files_per_dex: int, resources: int) -> dict:
+    """Sinh framework.jar / services.jar / miui-*.jar giả lập. Trả về {jar: bytes}."""
+    sizes = {}
+    for jar_index, jar_name in enumerate(["framework.jar", "services.jar", "miui-framework.jar", "miui-services.jar"]):
+        jar_path = root / jar_name
+        targets = PATCH_TARGETS.get(jar_name, {})
+        with zipfile.ZipFile(jar_path, "w", zipfile.ZIP_DEFLATED) as zf:
+            for n in range(dex_per_jar):
+                dex_name = "classes" if n == 0 else f"classes{n + 1}"
+                files = _tree_files(files_per_dex, seed=jar_index * 100 + n)
+                for rel, generator in targets.get(dex_name, {}).items():
+                    files[rel] = generator().encode("utf-8")
+                zf.writestr(f"{dex_name}.dex", pack_dex(files))
+            for n in range(resources):
+                zf.writestr(f"res/raw/res{n}.bin", random.Random(n).randbytes(256) * 8)
+            zf.writestr("META-INF/MANIFEST.MF", "Manifest-Version: 1.0\n")
+        sizes[jar_name] = jar_path.stat().st_size
+    return sizes
+
+def prepare_workspace(root: Path):
+    for name in ("USAGI", "module"):
+        (root / name).symlink_to(REPO_DIR / name, target_is_directory=True)
+    # utils.check_tools chỉ kiểm tra sự tồn tại của jar
+    (root / "smali.jar").write_bytes(b"")
+    (root / "baksmali.jar").write_bytes(b"")
+
+def run_pipeline(workspace: Path, mode: str, env: dict) -> float:
+    started = time.perf_counter()
+    if mode == "dag":
+        commands = [[sys.executable, str(REPO_DIR / "pipeline.py")]]
+    else:
+        commands = [[sys.executable, str(REPO_DIR / script)] for script in WORKFLOW_SCRIPTS]
+    for cmd in commands:
+        res = subprocess.run(cmd, cwd=workspace, env=env, capture_output=True, text=True)
+        if res.returncode != 0:
+            raise RuntimeError(f"{Path(cmd[1]).name} lỗi:\n{res.stdout}\n{res.stderr}")
+    return time.perf_counter() - started
+
+def breakdown(trace_path: Path) -> dict:
+    """Tổng thời gian theo loại span (các loại lồng nhau: stage ⊃ dex ⊃ jvm)."""
+    totals = defaultdict(float)
+    for event in load_events(trace_path):
+        totals[event["cat"]] += event["dur"] / 1e6
+    return dict(totals)
+
+def run_once(args, workspace: Path, jars_dir: Path) -> dict:
+    for jar in jars_dir.glob("*.jar"):
+        shutil.copy2(jar, workspace / jar.name)
+    for stale in ("Module-framework-test.zip", "trace.jsonl"):
+        (workspace / stale).unlink(missing_ok=True)
+
+    env = dict(os.environ)
+    env.update({
+        "KAORI_JAVA": f"{sys.executable} {REPO_DIR / 'standin_tools.py'}",
+        "KAORI_STANDIN_LATENCY_MS": str(args.latency_ms),
+        "KAORI_STANDIN_MS_PER_MB": str(args.ms_per_mb),
+        "KAORI_TRACE": str(workspace / "trace.jsonl"),
+        "KAORI_QUIET": "1",
+        # Đo chính pipeline: các lần lặp cùng jar không được trả kết quả từ build cache
+        "KAORI_BUILD_CACHE": "0",
+        "PYTHONHASHSEED": "0",
+    })
+    env.pop("KAORI_EVENTS", None)
+    wall = run_pipeline(workspace, args.mode, env)
+    cats = breakdown(workspace / "trace.jsonl")
+    return {"wall_s": wall, **{f"{cat}_s": value for cat, value in cats.items()}}
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark pipeline với công cụ smali/baksmali giả lập")
+    parser.add_argument("--mode", choices=["workflow", "dag"], default="workflow")
+    parser.add_argument("--dex", type=int, default=5, help="Số dex mỗi jar")
+    parser.add_argument("--files", type=int, default=300, help="Số class smali mỗi dex")
+    parser.add_argument("--resources", type=int, default=200, help="Số entry tài nguyên mỗi jar")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--ms-per-mb", type=float, default=0.0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument("--save-baseline", type=Path)
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix="kaori_pipe_bench_"))
+    try:
+        jars_dir = root / "inputs"
+        jars_dir.mkdir()
+        sizes = make_jars(jars_dir, args.dex, args.files, args.resources)
+        workspace = root / "ws"
+        workspace.mkdir()
+        prepare_workspace(workspace)
+
+        runs = [run_once(args, workspace, jars_dir) for _ in range(args.repeat)]
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    keys = sorted({key for run in runs for key in run})
+    result = {key: sorted(run.get(key, 0.0) for run in runs)[len(runs) // 2] for key in keys}
+    result["python_overhead_s"] = result["wall_s"] - result.get("jvm_s", 0.0)
+
+    print(f"\n🏁 Pipeline benchmark ({args.mode}, {args.dex} dex × {args.files} class, "
+          f"input {sum(sizes.values()) / (1 << 20):.1f} MB, median of {args.repeat})")
+    for key in ["wall_s", "python_overhead_s"] + [k for k in keys if k != "wall_s"]:
+        print(f"   {key:<20} {result[key]:8.3f}")
+
+    payload = {"params": vars(args) | {"baseline": None, "save_baseline": None}, "result": result}
+    if args.save_baseline:
+        args.save_baseline.write_text(json.dumps(payload, indent=2, default=str), encoding="utf-8")
+    if args.baseline:
+        old = json.loads(args.baseline.read_text(encoding="utf-8"))["result"]
+        ratio = result["python_overhead_s"] / old["python_overhead_s"] - 1 if old.get("python_overhead_s") else 0.0
+        print(f"   vs baseline: python overhead {ratio * 100:+.1f}%")
+        if ratio > args.threshold:
+            print(f"❌ Regression > {args.threshold * 100:.0f}%")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,11 @@
 # 2_fix_bootloop.py
 
 from pathlib import Path
-from utils import CURRENT_DIR, log
+import fingerprint
+import patchplan
+from patchlog import PatchManifest, apply_once
+from pristine import write_patched
+from utils import CURRENT_DIR, log, stage
 
 TARGET_FILES = {
     "framework_unpacked/smali_classes2": [
@@ -79,28 +83,50 @@ def fix_smali_content(smali_file: Path) -> bool:
                 new_lines.append(line)
 
         if modified:
-            smali_file.write_text("".join(new_lines), encoding="utf-8")
+            write_patched(smali_file, "".join(new_lines))
         return modified
     except Exception as e:
-        log(f"Lỗi file {smali_file.name}: {e}", "ERROR")
+        log(f"Lỗi file {smali_file.name}: {e}", "ERROR", file=str(smali_file))
         return False
 
-def main():
-    log("Bắt đầu Fix Bootloop (A15)...", "PROCESS")
+def fix_bootloop(base=CURRENT_DIR, unpack_dir=None) -> int:
+    with stage("bootloop", unpack_dir=unpack_dir or "*"):
+        return _fix_bootloop(base, unpack_dir)
+
+def _fix_bootloop(base, unpack_dir) -> int:
     fixed_count = 0
-    
+    plans = patchplan.PatchPlans()
+
     for rel_dir, files in TARGET_FILES.items():
-        dir_path = CURRENT_DIR / rel_dir
-        if not dir_path.exists():
+        root_name, default_dex = rel_dir.split("/")
+        if unpack_dir and root_name != unpack_dir:
             continue
-            
+        # Ở chế độ smali_store, smali_classesN chỉ xuất hiện khi có file được bung ra
+        unpack_root = base / root_name
+        if not unpack_root.exists():
+            continue
+
+        manifest = PatchManifest(unpack_root)
         for rel_file in files:
-            file_path = dir_path.joinpath(*rel_file.split("/"))
-            if file_path.exists():
-                if fix_smali_content(file_path):
+            file_path = plans.locate(unpack_root, "L" + rel_file[:-len(".smali")] + ";", default_dex)
+            if file_path:
+                fixed = apply_once(manifest, file_path, fix_smali_content, plans)
+                if fixed is None:
+                    log(f"Đã fix từ trước: {rel_file}", "INFO")
+                elif fixed:
                     log(f"Fixed: {rel_file}", "SUCCESS")
                     fixed_count += 1
-    
+        manifest.save()
+    plans.report()
+    return fixed_count
+
+def main():
+    reason = fingerprint.skip_reason("bootloop")
+    if reason:
+        log(f"SKIP: Fix Bootloop ({reason})", "WARN")
+        return
+    log("Bắt đầu Fix Bootloop (A15)...", "PROCESS")
+    fixed_count = fix_bootloop()
     log(f"Hoàn tất. Đã sửa {fixed_count} files.", "SUCCESS")
 
 if __name__ == "__main__":
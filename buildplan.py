@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+# buildplan.py
+#
+# Dry-run cho pipeline: đọc index dex trong jar (fingerprint, không decompile) và danh sách class của
+# từng patcher để báo trước class nào bị sửa, dex nào bị đụng tới, cache nào hit và thời gian ước tính
+# mỗi bước theo trace lịch sử (span của profiling.py). Không ghi gì vào thư mục làm việc.
+# Ước tính: unpack theo MB jar, assemble theo MB dex được assemble (chỉ dex bị đụng tới khi
+# KAORI_SMALI_STORE=packed), các bước còn lại theo thời gian trung bình. Các jar chạy song song nên
+# thời gian dự kiến là nhánh jar dài nhất cộng bước module.
+#   python pipeline.py --plan [--history trace.jsonl ...]
+#   python buildplan.py [trace.jsonl ...]       (mặc định đọc KAORI_TRACE nếu có)
+
+import hashlib
+import json
+import os
+import sys
+import zipfile
+from pathlib import Path
+
+import apk
+import bootloop
+import events
+import fingerprint
+import kaori
+import patchplan
+import smali_store
+from cache import DecompileCache, StoreCache
+from utils import CURRENT_DIR, TARGET_JARS, UNPACK_DIRS, log
+from ziputil import DEX_ENTRY_RE
+
+MB = 1 << 20
+# Tên span stage trong trace -> bước của plan
+STAGE_SPANS = {
+    "bootloop": "bootloop",
+    "apk protection": "apk",
+    "kaori": "kaori",
+    "assemble": "assemble",
+    "create module": "module",
+}
+PATCH_ORDER = ["bootloop", "apk", "kaori"]
+
+def _span_stage(name: str):
+    if name in STAGE_SPANS:
+        return STAGE_SPANS[name]
+    if name.startswith("unpack "):
+        return "unpack"
+    if name.startswith("repack ") and name != "repack classes":
+        return "jar"
+    return None
+
+def load_history(paths) -> dict:
+    """{bước: {"seconds", "bytes", "samples"}} gộp từ các file trace JSONL."""
+    totals = {}
+    for path in paths:
+        try:
+            handle = open(path, encoding="utf-8")
+        except OSError:
+            continue
+        with handle:
+            for line in handle:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                stage = _span_stage(record.get("name", "")) if record.get("cat") == "stage" else None
+                if stage is None or "error" in record.get("args", {}):
+                    continue
+                total = totals.setdefault(stage, {"seconds": 0.0, "bytes": 0, "samples": 0, "sized": 0.0})
+                total["seconds"] += record["dur"] / 1e6
+                total["samples"] += 1
+                nbytes = record.get("args", {}).get("bytes")
+                if nbytes:
+                    total["bytes"] += nbytes
+                    total["sized"] += record["dur"] / 1e6
+    return totals
+
+def estimate(history: dict, stage: str, nbytes=None):
+    """Giây ước tính cho một lần chạy bước, None nếu chưa có dữ liệu."""
+    total = history.get(stage)
+    if not total or not total["samples"]:
+        return None
+    if nbytes is not None and total["bytes"]:
+        return total["sized"] / total["bytes"] * nbytes
+    return total["seconds"] / total["samples"]
+
+def patch_specs() -> list:
+    """[(bước, jar, descriptor, dex mặc định, patcher)] như các patcher sẽ locate khi chạy thật."""
+    jar_of = {unpack_dir: jar for jar, unpack_dir in UNPACK_DIRS.items()}
+    specs = []
+    for rel_dir, files in bootloop.TARGET_FILES.items():
+        root_name, default_dex = rel_dir.split("/")
+        for rel in files:
+            specs.append(("bootloop", jar_of[root_name], "L" + rel[:-len(".smali")] + ";", default_dex,
+                          bootloop.fix_smali_content))
+    specs.append(("apk", "framework.jar", fingerprint.APK_TARGET[0], "smali_classes4", apk.patch_verifier))
+    for descriptor, default_dex, func in kaori.patch_targets():
+        specs.append(("kaori", "framework.jar", descriptor, default_dex, func))
+    return specs
+
+def _dex_entries(jar_path: Path) -> dict:
+    """{classesN.dex: kích thước giải nén}, kể cả dex fingerprint không parse được."""
+    with zipfile.ZipFile(jar_path) as zf:
+        return {info.filename: info.file_size for info in zf.infolist() if DEX_ENTRY_RE.match(info.filename)}
+
+def _dex_hash(jar_path: Path, name: str) -> str:
+    digest = hashlib.sha256()
+    with zipfile.ZipFile(jar_path) as zf, zf.open(name) as src:
+        for chunk in iter(lambda: src.read(MB), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def plan(base=CURRENT_DIR, stages=None, history_paths=(), build_hit=None) -> dict:
+    stages = list(stages or ["unpack", *PATCH_ORDER, "repack", "module"])
+    report = fingerprint.fingerprint(base)
+    jars = [name for name, info in report["fingerprint"]["jars"].items() if "dex" in info]
+    selection = report["selection"]
+    skipped = {}
+    if fingerprint.enabled():
+        for name, decision in selection["stages"].items():
+            if name in stages and not decision["enabled"]:
+                skipped[name] = decision["reason"]
+    enabled = [stage for stage in stages if stage not in skipped]
+
+    plans = patchplan.PatchPlans()
+    classes = {stage: [] for stage in PATCH_ORDER if stage in enabled}
+    dirty = {}
+    for stage, jar_name, descriptor, default_dex, func in patch_specs():
+        if stage not in classes or jar_name not in jars:
+            continue
+        location = selection["targets"].get(descriptor, f"{jar_name}:?")
+        if location is None:
+            classes[stage].append({"class": descriptor, "dex": None, "note": "không có trong ROM"})
+            continue
+        dex_name = location.split(":", 1)[1]
+        if dex_name == "?":
+            dex_name = default_dex[len("smali_"):] + ".dex"
+        classes[stage].append({"class": descriptor, "dex": f"{jar_name}:{dex_name}",
+                               "plan_cache": plans.cached(func, descriptor)})
+        dirty.setdefault(jar_name, set()).add(dex_name)
+    if "kaori" in classes and "framework.jar" in jars:
+        payload_dex = kaori.KAORIOS_TARGET.parts[1][len("smali_"):] + ".dex"
+        payload = sum(1 for _ in kaori.KAORIOS_SOURCE.rglob("*.smali")) if kaori.KAORIOS_SOURCE.is_dir() else 0
+        classes["kaori"].append({"class": f"{kaori.KAORIOS_PACKAGE}* ({payload} class payload, trước shrink)",
+                                 "dex": f"framework.jar:{payload_dex}"})
+        dirty.setdefault("framework.jar", set()).add(payload_dex)
+
+    packed = smali_store.enabled()
+    smali_cache = StoreCache() if packed else DecompileCache()
+    history = load_history(history_paths)
+    per_jar = {}
+    caches = {"build": build_hit, "smali": {}}
+    for jar_name in jars:
+        jar_path = base / jar_name
+        dex_sizes = _dex_entries(jar_path)
+        assembled = sorted(dirty.get(jar_name, ())) if packed else sorted(dex_sizes)
+        steps = {}
+        if "unpack" in enabled:
+            steps["unpack"] = estimate(history, "unpack", jar_path.stat().st_size)
+            for name in dex_sizes:
+                key = _dex_hash(jar_path, name)
+                hit = (smali_cache.root / f"{key}{smali_cache.suffix}").is_file() if packed else (smali_cache.root / key).is_dir()
+                caches["smali"][f"{jar_name}:{name}"] = hit
+        for stage in PATCH_ORDER:
+            if stage in classes and any(item["dex"] and item["dex"].startswith(f"{jar_name}:") for item in classes[stage]):
+                steps[stage] = estimate(history, stage)
+        if "repack" in enabled:
+            steps["assemble"] = estimate(history, "assemble", sum(dex_sizes.get(name, 0) for name in assembled))
+            steps["jar"] = estimate(history, "jar")
+        per_jar[jar_name] = {
+            "dirty_dex": sorted(dirty.get(jar_name, ())),
+            "assembled_dex": assembled,
+            "seconds": steps,
+        }
+    module = estimate(history, "module") if "module" in enabled else None
+    branches = [sum(v for v in item["seconds"].values() if v) for item in per_jar.values()]
+    known = [v for item in per_jar.values() for v in item["seconds"].values()] + ([module] if "module" in enabled else [])
+    return {
+        "profile": selection["profile"],
+        "api_level": selection["api_level"],
+        "stages": enabled,
+        "skipped": skipped,
+        "classes": classes,
+        "jars": per_jar,
+        "caches": caches,
+        "history_samples": {stage: total["samples"] for stage, total in history.items()},
+        "estimate": {
+            "module": module,
+            "total": sum(branches) + (module or 0),
+            "wall": max(branches, default=0) + (module or 0),
+            "complete": all(value is not None for value in known),
+        },
+    }
+
+def _seconds(value) -> str:
+    return "?" if value is None else f"{value:.1f}s"
+
+def announce(result: dict):
+    if events.json_mode():
+        events.emit("plan", **result)
+        return
+    log(f"Plan build (dry-run) cho {result['profile']}, API {result['api_level']}", "PROCESS")
+    if result["caches"]["build"]:
+        log("Build cache hit: cả lần build sẽ được khôi phục, các bước dưới không chạy", "SUCCESS")
+    elif result["caches"]["build"] is None:
+        log("Build cache: không rõ (tắt, không build trọn, hoặc thiếu smali/baksmali)", "INFO")
+    for stage, reason in result["skipped"].items():
+        log(f"Bỏ qua {stage}: {reason}", "WARN")
+    for stage, items in result["classes"].items():
+        cached = sum(1 for item in items if item.get("plan_cache"))
+        patched = [item for item in items if item["dex"]]
+        log(f"[{stage}] {len(patched)} class sẽ bị sửa, {cached} có plan cache", "INFO")
+        # Bảng từng class chỉ in ở chế độ text (KAORI_QUIET tắt, json đã có trong sự kiện plan)
+        if not events.text_enabled():
+            continue
+        for item in items:
+            note = item.get("note") or ("plan cache" if item.get("plan_cache") else "")
+            print(f"   {item['class']:<70} {item['dex'] or '-':<28} {note}")
+    smali = result["caches"]["smali"]
+    if smali:
+        log(f"Cache smali (decompile): {sum(smali.values())}/{len(smali)} dex hit", "INFO")
+    for jar_name, item in result["jars"].items():
+        steps = ", ".join(f"{stage} {_seconds(value)}" for stage, value in item["seconds"].items())
+        log(f"{jar_name}: dex bị đụng tới {', '.join(item['dirty_dex']) or '-'}; "
+            f"assemble {len(item['assembled_dex'])} dex; {steps}", "INFO")
+    total = result["estimate"]
+    if not result["history_samples"]:
+        log("Chưa có trace lịch sử (KAORI_TRACE / --history): không ước tính được thời gian", "WARN")
+        return
+    suffix = "" if total["complete"] else " (thiếu dữ liệu cho một số bước)"
+    log(f"Ước tính: ~{_seconds(total['wall'])} (các jar song song), cộng dồn các bước "
+        f"{_seconds(total['total'])}, module {_seconds(total['module'])}{suffix}", "INFO")
+
+def history_paths(paths=None) -> list:
+    if paths:
+        return list(paths)
+    trace = os.getenv("KAORI_TRACE")
+    return [trace] if trace and Path(trace).is_file() else []
+
+def main():
+    if not any((CURRENT_DIR / jar).exists() for jar in TARGET_JARS):
+        log("Không tìm thấy file JAR nào để lập plan.", "ERROR")
+        raise SystemExit(1)
+    announce(plan(CURRENT_DIR, history_paths=history_paths(sys.argv[1:])))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# cache.py
+
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from utils import CACHE_DIR, ensure_dir
+
+CHUNK_SIZE = 1 << 20
+
+def hash_bytes(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+def hash_file(path: Path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for chunk in iter(lambda: handle.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def hash_tree(root: Path) -> str:
+    """Hash đường dẫn tương đối + nội dung của mọi file trong cây (thứ tự cố định)."""
+    digest = hashlib.sha256()
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            file_path = Path(dirpath) / name
+            digest.update(file_path.relative_to(root).as_posix().encode("utf-8"))
+            digest.update(b"\0")
+            digest.update(bytes.fromhex(hash_file(file_path)))
+    return digest.hexdigest()
+
+class DecompileCache:
+    """Cache smali theo hash của file DEX: dex giống nhau giữa các ROM chỉ decompile một lần."""
+
+    def __init__(self, root: Path = CACHE_DIR / "smali"):
+        self.root = root
+
+    def get(self, key: str, dest: Path) -> bool:
+        entry = self.root / key
+        if not entry.is_dir():
+            return False
+        if dest.exists():
+            shutil.rmtree(dest)
+        shutil.copytree(entry, dest)
+        return True
+
+    def put(self, key: str, src: Path):
+        entry = self.root / key
+        if entry.exists():
+            return
+        ensure_dir(self.root)
+        # Copy vào thư mục tạm rồi rename để các process song song không thấy cache dở dang
+        tmp = self.root / f".{key}.{uuid.uuid4().hex}"
+        shutil.copytree(src, tmp)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+class DexCache:
+    """Cache file DEX đã assemble theo hash của cây smali nguồn."""
+
+    suffix = ".dex"
+
+    def __init__(self, root: Path = CACHE_DIR / "dex"):
+        self.root = root
+
+    def get(self, key: str, dest: Path) -> bool:
+        entry = self.root / f"{key}{self.suffix}"
+        if not entry.is_file():
+            return False
+        # Không ghi đè tại chỗ: dest có thể đang hardlink với snapshot pristine
+        tmp = dest.with_name(f".{dest.name}.{uuid.uuid4().hex}")
+        shutil.copyfile(entry, tmp)
+        os.replace(tmp, dest)
+        return True
+
+    def put(self, key: str, src: Path):
+        entry = self.root / f"{key}{self.suffix}"
+        if entry.exists():
+            return
+        ensure_dir(self.root)
+        tmp = self.root / f".{key}.{uuid.uuid4().hex}"
+        shutil.copyfile(src, tmp)
+        os.replace(tmp, entry)
+
+class StoreCache(DexCache):
+    """Cache container smali đóng gói (smali_store.py) theo hash của file DEX."""
+
+    suffix = ".zip"
+
+    def __init__(self, root: Path = CACHE_DIR / "smali_store"):
+        super().__init__(root)
+
+class BuildCache:
+    """Cache kết quả cả lần build (jar đã vá, module zip, run report) theo hash toàn bộ đầu vào."""
+
+    def __init__(self, root: Path = CACHE_DIR / "build"):
+        self.root = root
+
+    def get(self, key: str, base: Path) -> list:
+        """Chép các file đầu ra về base. Trả về tên file đã khôi phục (rỗng nếu miss)."""
+        entry = self.root / key
+        if not entry.is_dir():
+            return []
+        restored = []
+        for src in sorted(entry.iterdir()):
+            tmp = base / f".{src.name}.{uuid.uuid4().hex}"
+            shutil.copyfile(src, tmp)
+            os.replace(tmp, base / src.name)
+            restored.append(src.name)
+        return restored
+
+    def put(self, key: str, base: Path, names):
+        entry = self.root / key
+        if entry.exists():
+            return
+        ensure_dir(self.root)
+        tmp = self.root / f".{key}.{uuid.uuid4().hex}"
+        tmp.mkdir()
+        for name in names:
+            if (base / name).is_file():
+                shutil.copyfile(base / name, tmp / name)
+        try:
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
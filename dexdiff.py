@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+# dexdiff.py
+#
+# So sánh dex vừa assemble với dex gốc ở mức class/method để xác nhận phạm vi patch.
+# Hai file được mmap; mỗi method hash theo lệnh đã chuẩn hoá: index string/type/field/method
+# thay bằng giá trị tham chiếu, offset nhánh/switch đổi thành khoảng cách theo số lệnh, nên smali
+# đánh lại index khi pool thay đổi không bị tính là thay đổi. Debug info và annotation bỏ qua.
+# Dex gốc lấy từ snapshot pristine, không có thì từ jar đầu vào (chưa bị ghi đè trước bước jar).
+# Class thêm/xoá/đổi nằm ngoài plan (journal pristine, patches.json, payload kaorios) làm fail assemble.
+#   python dexdiff.py                      so sánh các *_unpacked có dex đã assemble
+#   python dexdiff.py --dex old.dex new.dex   so sánh hai file dex
+#   KAORI_DEXDIFF=1                        kiểm tra trong pipeline sau bước assemble
+
+import argparse
+import hashlib
+import json
+import os
+import struct
+import sys
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+
+import events
+import kaori
+from dexfile import (
+    FILL_ARRAY_DATA_PAYLOAD, FORMAT_UNITS, OPCODES, PACKED_SWITCH_PAYLOAD, SPARSE_SWITCH_PAYLOAD,
+    DexError, instruction_units, mapped,
+)
+from fingerprint import JarIndex
+from patchlog import PatchManifest
+from pristine import dirty_paths, pristine_dir
+from profiling import span
+from utils import CURRENT_DIR, TARGET_JARS, UNPACK_DIRS, jar_arg, log
+
+PAYLOADS = (PACKED_SWITCH_PAYLOAD, SPARSE_SWITCH_PAYLOAD, FILL_ARRAY_DATA_PAYLOAD)
+CONST_STRING_JUMBO = 0x1B
+
+def enabled() -> bool:
+    return os.getenv("KAORI_DEXDIFF", "0") == "1"
+
+def _signed(value, bits):
+    return value - (1 << bits) if value >> (bits - 1) else value
+
+# ------------------------------------------------------------------ chuẩn hoá
+def _token(dex, insns, addr, n, index):
+    unit = insns[addr]
+    op = unit & 0xFF
+    if op == 0 and unit in PAYLOADS:
+        # Nội dung payload được đưa vào token của lệnh tham chiếu tới nó
+        return ("payload",)
+    fmt, ref = OPCODES[op]
+    units = list(insns[addr:addr + FORMAT_UNITS[fmt]])
+
+    def rel(offset):
+        target = addr + offset
+        return index[target] - n if target in index else None
+
+    if ref:
+        if fmt == "31c":
+            idx = units[1] | (units[2] << 16)
+            units = [(units[0] & 0xFF00) | (0x1A if op == CONST_STRING_JUMBO else op), 0]
+        else:
+            idx, units[1] = units[1], 0
+        value = dex.resolve(ref, idx)
+        if fmt in ("45cc", "4rcc"):
+            value, units[3] = (value, dex.proto(units[3])), 0
+        return units, value
+    if fmt == "10t":
+        return [0x28], rel(_signed(unit >> 8, 8))
+    if fmt == "20t":
+        return [0x28], rel(_signed(units[1], 16))
+    if fmt == "30t":
+        return [0x28], rel(_signed(units[1] | (units[2] << 16), 32))
+    if fmt in ("21t", "22t"):
+        offset, units[1] = _signed(units[1], 16), 0
+        return units, rel(offset)
+    if fmt == "31t":
+        payload = addr + _signed(units[1] | (units[2] << 16), 32)
+        return [units[0]], _payload(insns, payload, rel)
+    return units
+
+def _payload(insns, pos, rel):
+    if pos >= len(insns):
+        return None
+    kind = insns[pos]
+    if kind == FILL_ARRAY_DATA_PAYLOAD:
+        return bytes(insns[pos:pos + instruction_units(insns, pos)])
+    size = insns[pos + 1]
+
+    def word(k):
+        return _signed(insns[pos + 2 + k * 2] | (insns[pos + 3 + k * 2] << 16), 32)
+
+    if kind == PACKED_SWITCH_PAYLOAD:
+        return ("packed", word(0), [rel(word(1 + k)) for k in range(size)])
+    if kind == SPARSE_SWITCH_PAYLOAD:
+        return ("sparse", [word(k) for k in range(size)], [rel(word(size + k)) for k in range(size)])
+    return None
+
+def method_digest(dex, code_off) -> str:
+    """Hash nội dung method không phụ thuộc thứ tự pool/offset; None nếu abstract/native."""
+    if not code_off:
+        return None
+    code = dex.code_item(code_off)
+    insns = code.insns
+    try:
+        addrs = []
+        pos = 0
+        while pos < len(insns):
+            addrs.append(pos)
+            pos += instruction_units(insns, pos)
+        index = {addr: n for n, addr in enumerate(addrs)}
+        index[len(insns)] = len(addrs)
+        digest = hashlib.sha1(f"{code.registers}:{code.ins}:{code.outs}".encode())
+        for n, addr in enumerate(addrs):
+            digest.update(repr(_token(dex, insns, addr, n, index)).encode("utf-8"))
+        for start, end, handlers in code.tries:
+            digest.update(repr((index.get(start), index.get(end),
+                                [(kind, index.get(addr)) for kind, addr in handlers])).encode("utf-8"))
+    finally:
+        insns.release()
+    return digest.hexdigest()[:20]
+
+def _member(signature: str) -> str:
+    return signature.split("->", 1)[1]
+
+def class_summary(dex) -> dict:
+    """{descriptor: {"header": hash, "methods": {name(proto): hash}}}"""
+    classes = {}
+    for cls in dex.iter_classes():
+        fields = [(_member(dex.field(idx)), flags) for idx, flags in cls.fields]
+        header = repr((cls.access, cls.superclass, cls.interfaces, fields, cls.static_values))
+        classes[cls.descriptor] = {
+            "header": hashlib.sha1(header.encode("utf-8")).hexdigest()[:20],
+            "methods": {
+                _member(dex.method(idx)): f"{flags:x}:{method_digest(dex, code_off)}"
+                for idx, flags, code_off in cls.methods
+            },
+        }
+    return classes
+
+def compare(old: dict, new: dict) -> dict:
+    changed = {}
+    for descriptor in sorted(old.keys() & new.keys()):
+        a, b = old[descriptor], new[descriptor]
+        if a == b:
+            continue
+        changed[descriptor] = {
+            "class": a["header"] != b["header"],
+            "added": sorted(b["methods"].keys() - a["methods"].keys()),
+            "removed": sorted(a["methods"].keys() - b["methods"].keys()),
+            "changed": sorted(m for m in a["methods"].keys() & b["methods"].keys()
+                              if a["methods"][m] != b["methods"][m]),
+        }
+    return {
+        "added": sorted(new.keys() - old.keys()),
+        "removed": sorted(old.keys() - new.keys()),
+        "changed": changed,
+    }
+
+# --------------------------------------------------------------------- nguồn
+@contextmanager
+def open_source(source):
+    """DexFile cho đường dẫn .dex hoặc (jar, entry); None nếu chưa có bản gốc (dex mới)."""
+    if source is None:
+        yield None
+    elif isinstance(source, (list, tuple)):
+        index = JarIndex(source[0])
+        try:
+            dex = index.dexes.get(source[1])
+            if dex is None:
+                raise DexError(index.errors.get(source[1], f"Không có {source[1]} trong {source[0]}"))
+            yield dex
+        finally:
+            index.close()
+    else:
+        with mapped(source) as dex:
+            yield dex
+
+def _summary(source) -> dict:
+    with open_source(source) as dex:
+        return class_summary(dex) if dex is not None else {}
+
+def diff_pair(original, rebuilt) -> dict:
+    """Chạy trong process con: so sánh một cặp dex."""
+    old = _summary(original)
+    new = _summary(rebuilt)
+    return compare(old, new)
+
+def original_source(base: Path, jar_name: str, dex_name: str):
+    snapshot = pristine_dir(base / UNPACK_DIRS[jar_name]) / dex_name
+    if snapshot.is_file():
+        return str(snapshot)
+    jar = base / jar_name
+    if jar.is_file():
+        with zipfile.ZipFile(jar) as zf:
+            if dex_name in zf.namelist():
+                return (str(jar), dex_name)
+    return None
+
+# ---------------------------------------------------------------------- plan
+def _descriptor(rel: str):
+    """(descriptor hoặc tiền tố package, là_thư_mục) cho đường dẫn trong *_unpacked."""
+    parts = rel.split("/", 1)
+    if len(parts) < 2 or not parts[0].startswith("smali_classes"):
+        return None, False
+    if parts[1].endswith(".smali"):
+        return f"L{parts[1][:-len('.smali')]};", False
+    return f"L{parts[1].rstrip('/')}/", True
+
+def touched_paths(base: Path, jar_name: str) -> list:
+    """Đường dẫn (tương đối trong *_unpacked) bị patch: journal pristine, patches.json, payload kaorios."""
+    unpack_root = base / UNPACK_DIRS[jar_name]
+    paths = list(dirty_paths(unpack_root)) + list(PatchManifest(unpack_root).entries)
+    if kaori.KAORIOS_TARGET.parts[0] == unpack_root.name:
+        paths.append(Path(*kaori.KAORIOS_TARGET.parts[1:]).as_posix())
+    return sorted(set(paths))
+
+def plan_scope(base: Path, jar_name: str):
+    """(class, tiền tố package) mà patch được phép đụng tới trong jar này."""
+    classes, prefixes = set(), set()
+    for rel in touched_paths(base, jar_name):
+        value, is_dir = _descriptor(rel)
+        if value:
+            (prefixes if is_dir else classes).add(value)
+    return classes, prefixes
+
+def _outer(descriptor: str) -> str:
+    return descriptor.split("$", 1)[0] + ";" if "$" in descriptor else descriptor
+
+def violations(diff: dict, classes: set, prefixes: set) -> list:
+    touched = diff["added"] + diff["removed"] + list(diff["changed"])
+    # Class lồng (Outer$Inner) nằm trong file smali riêng nhưng đi cùng patch của class ngoài
+    return [d for d in touched
+            if d not in classes and _outer(d) not in classes
+            and not any(d.startswith(prefix) for prefix in prefixes)]
+
+# ---------------------------------------------------------------------- check
+def describe(dex_name: str, diff: dict) -> str:
+    methods = sum(len(c["added"]) + len(c["removed"]) + len(c["changed"]) for c in diff["changed"].values())
+    return (f"{dex_name}: +{len(diff['added'])} class, -{len(diff['removed'])} class, "
+            f"~{len(diff['changed'])} class ({methods} method)")
+
+def diff_dexes(pairs: dict, workers=None) -> dict:
+    """{dex_name: diff} cho {dex_name: (nguồn gốc, dex mới)}, song song theo process."""
+    results = {}
+    if not pairs:
+        return results
+    workers = min(len(pairs), workers or os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=events.set_quiet) as pool:
+        futures = {name: pool.submit(diff_pair, src, str(dst)) for name, (src, dst) in pairs.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except (OSError, DexError, ValueError, struct.error, KeyError) as exc:
+                results[name] = {"error": str(exc)}
+    return results
+
+def check_jar(base: Path, jar_name: str, dex_names) -> bool:
+    """So sánh các dex vừa assemble của jar với bản gốc; False nếu có thay đổi ngoài plan."""
+    unpack_root = base / UNPACK_DIRS[jar_name]
+    pairs = {name: (original_source(base, jar_name, name), unpack_root / name) for name in dex_names}
+    with span(f"dexdiff {jar_name}", "verify", dex=len(pairs)):
+        results = diff_dexes(pairs)
+    classes, prefixes = plan_scope(base, jar_name)
+
+    ok = True
+    for name in sorted(results):
+        diff = results[name]
+        if "error" in diff:
+            log(f"dexdiff {jar_name}/{name}: không đọc được dex ({diff['error']})", "WARN", file=name)
+            continue
+        outside = violations(diff, classes, prefixes)
+        events.emit("dexdiff", jar=jar_name, dex=name, outside=outside, **diff)
+        log(f"{jar_name}/{describe(name, diff)}", "INFO")
+        for descriptor in diff["changed"]:
+            detail = diff["changed"][descriptor]
+            for kind, sign in (("added", "+"), ("removed", "-"), ("changed", "~")):
+                for method in detail[kind]:
+                    log(f"  {sign} {descriptor}->{method}", "INFO")
+        if outside:
+            ok = False
+            for descriptor in outside:
+                log(f"{jar_name}/{name}: {descriptor} thay đổi ngoài plan patch", "ERROR", file=name)
+    return ok
+
+def main():
+    parser = argparse.ArgumentParser(description="So sánh dex đã assemble với dex gốc theo class/method")
+    parser.add_argument("jars", nargs="*", type=jar_arg, metavar="JAR",
+                        help=f"Jar cần kiểm tra ({', '.join(TARGET_JARS)}; mặc định: tất cả)")
+    parser.add_argument("--dex", nargs=2, type=Path, metavar=("OLD", "NEW"), help="So sánh hai file dex")
+    args = parser.parse_args()
+    if args.dex:
+        old, new = args.dex
+        diff = diff_dexes({new.name: (str(old), new)})[new.name]
+        print(json.dumps(diff, indent=1, ensure_ascii=False))
+        sys.exit(1 if "error" in diff or diff["added"] or diff["removed"] or diff["changed"] else 0)
+
+    ok = True
+    for jar_name in args.jars or TARGET_JARS:
+        unpack_root = CURRENT_DIR / UNPACK_DIRS[jar_name]
+        dex_names = sorted(p.name for p in unpack_root.glob("classes*.dex")) if unpack_root.is_dir() else []
+        if dex_names:
+            ok = check_jar(CURRENT_DIR, jar_name, dex_names) and ok
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+# dexfile.py
+#
+# Đọc trực tiếp cấu trúc file DEX (header, string/type/method ids, class_defs) từ bytes/mmap,
+# không decompile. string_ids và type_ids đã được sắp xếp nên tra cứu bằng tìm kiếm nhị phân.
+# class_data/code_item và bảng định dạng lệnh Dalvik dùng cho dexdiff.py.
+
+import mmap
+import struct
+from collections import namedtuple
+from contextlib import contextmanager
+
+DEX_MAGIC = b"dex\n"
+ENDIAN_CONSTANT = 0x12345678
+NO_INDEX = 0xFFFFFFFF
+TYPE_CALL_SITE_ID_ITEM = 0x0007
+TYPE_METHOD_HANDLE_ITEM = 0x0008
+
+DexClass = namedtuple("DexClass", "descriptor access superclass interfaces fields methods static_values")
+CodeItem = namedtuple("CodeItem", "registers ins outs insns tries")
+
+# Định dạng lệnh Dalvik: opcode -> (format, loại index tham chiếu)
+FORMAT_UNITS = {
+    "10x": 1, "12x": 1, "11n": 1, "11x": 1, "10t": 1,
+    "20t": 2, "22x": 2, "21t": 2, "21s": 2, "21h": 2, "21c": 2, "23x": 2, "22b": 2, "22t": 2, "22s": 2, "22c": 2,
+    "30t": 3, "32x": 3, "31i": 3, "31t": 3, "31c": 3, "35c": 3, "3rc": 3,
+    "45cc": 4, "4rcc": 4, "51l": 5,
+}
+OPCODES = {}
+
+def _ops(first, last, fmt, ref=None):
+    for op in range(first, last + 1):
+        OPCODES[op] = (fmt, ref)
+
+_ops(0x00, 0xFF, "10x")
+_ops(0x01, 0x01, "12x"), _ops(0x02, 0x02, "22x"), _ops(0x03, 0x03, "32x")
+_ops(0x04, 0x04, "12x"), _ops(0x05, 0x05, "22x"), _ops(0x06, 0x06, "32x")
+_ops(0x07, 0x07, "12x"), _ops(0x08, 0x08, "22x"), _ops(0x09, 0x09, "32x")
+_ops(0x0A, 0x0D, "11x"), _ops(0x0F, 0x11, "11x")
+_ops(0x12, 0x12, "11n"), _ops(0x13, 0x13, "21s"), _ops(0x14, 0x14, "31i"), _ops(0x15, 0x15, "21h")
+_ops(0x16, 0x16, "21s"), _ops(0x17, 0x17, "31i"), _ops(0x18, 0x18, "51l"), _ops(0x19, 0x19, "21h")
+_ops(0x1A, 0x1A, "21c", "string"), _ops(0x1B, 0x1B, "31c", "string"), _ops(0x1C, 0x1C, "21c", "type")
+_ops(0x1D, 0x1E, "11x"), _ops(0x1F, 0x1F, "21c", "type"), _ops(0x20, 0x20, "22c", "type")
+_ops(0x21, 0x21, "12x"), _ops(0x22, 0x22, "21c", "type"), _ops(0x23, 0x23, "22c", "type")
+_ops(0x24, 0x24, "35c", "type"), _ops(0x25, 0x25, "3rc", "type"), _ops(0x26, 0x26, "31t")
+_ops(0x27, 0x27, "11x"), _ops(0x28, 0x28, "10t"), _ops(0x29, 0x29, "20t"), _ops(0x2A, 0x2A, "30t")
+_ops(0x2B, 0x2C, "31t"), _ops(0x2D, 0x31, "23x"), _ops(0x32, 0x37, "22t"), _ops(0x38, 0x3D, "21t")
+_ops(0x44, 0x51, "23x"), _ops(0x52, 0x5F, "22c", "field"), _ops(0x60, 0x6D, "21c", "field")
+_ops(0x6E, 0x72, "35c", "method"), _ops(0x74, 0x78, "3rc", "method")
+_ops(0x7B, 0x8F, "12x"), _ops(0x90, 0xAF, "23x"), _ops(0xB0, 0xCF, "12x")
+_ops(0xD0, 0xD7, "22s"), _ops(0xD8, 0xE2, "22b")
+_ops(0xFA, 0xFA, "45cc", "method"), _ops(0xFB, 0xFB, "4rcc", "method")
+_ops(0xFC, 0xFC, "35c", "call_site"), _ops(0xFD, 0xFD, "3rc", "call_site")
+_ops(0xFE, 0xFE, "21c", "method_handle"), _ops(0xFF, 0xFF, "21c", "proto")
+
+# Pseudo-instruction (payload) bắt đầu bằng nop: giá trị code unit đầu tiên
+PACKED_SWITCH_PAYLOAD = 0x0100
+SPARSE_SWITCH_PAYLOAD = 0x0200
+FILL_ARRAY_DATA_PAYLOAD = 0x0300
+
+def instruction_units(insns, pos) -> int:
+    """Số code unit của lệnh (hoặc payload) tại pos."""
+    unit = insns[pos]
+    if unit == PACKED_SWITCH_PAYLOAD:
+        return 4 + insns[pos + 1] * 2
+    if unit == SPARSE_SWITCH_PAYLOAD:
+        return 2 + insns[pos + 1] * 4
+    if unit == FILL_ARRAY_DATA_PAYLOAD:
+        width = insns[pos + 1]
+        size = insns[pos + 2] | (insns[pos + 3] << 16)
+        return 4 + (size * width + 1) // 2
+    return FORMAT_UNITS[OPCODES[unit & 0xFF][0]]
+
+HEADER_FIELDS = [
+    "string_ids", "type_ids", "proto_ids", "field_ids", "method_ids", "class_defs", "data",
+]
+
+class DexError(Exception):
+    pass
+
+def read_sleb128(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            if byte & 0x40:
+                result -= 1 << shift
+            return result, pos
+
+def read_uleb128(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+class DexFile:
+    def __init__(self, data):
+        self.data = data if isinstance(data, memoryview) else memoryview(data)
+        if len(self.data) < 0x70 or bytes(self.data[:4]) != DEX_MAGIC:
+            raise DexError("Không phải file DEX")
+        self.version = bytes(self.data[4:7]).decode("ascii", "replace")
+        header_size, endian = struct.unpack_from("<II", self.data, 0x24)
+        if header_size != 0x70 or endian != ENDIAN_CONSTANT:
+            raise DexError(f"Header DEX không hợp lệ (size={header_size:#x}, endian={endian:#x})")
+        self.checksum = struct.unpack_from("<I", self.data, 0x08)[0]
+        self.signature = bytes(self.data[0x0C:0x20])
+        self.file_size = struct.unpack_from("<I", self.data, 0x20)[0]
+        self.map_off = struct.unpack_from("<I", self.data, 0x34)[0]
+        values = struct.unpack_from("<14I", self.data, 0x38)
+        for n, name in enumerate(HEADER_FIELDS):
+            setattr(self, f"{name}_size", values[n * 2])
+            setattr(self, f"{name}_off", values[n * 2 + 1])
+        if self.file_size > len(self.data):
+            raise DexError("File DEX bị cắt")
+        self._class_types = None
+        self._strings = {}
+
+    # ------------------------------------------------------------------ strings
+    def string_bytes(self, idx) -> bytes:
+        off = struct.unpack_from("<I", self.data, self.string_ids_off + idx * 4)[0]
+        length, start = read_uleb128(self.data, off)
+        # MUTF-8: mỗi code unit UTF-16 tối đa 3 byte, kết thúc bằng byte 0
+        chunk = bytes(self.data[start:start + length * 3 + 1])
+        return chunk[:chunk.index(0)]
+
+    def string(self, idx) -> str:
+        value = self._strings.get(idx)
+        if value is None:
+            value = self._strings[idx] = self.string_bytes(idx).decode("utf-8", "replace")
+        return value
+
+    def find_string(self, value: str):
+        """Index của string trong bảng (đã sắp xếp), hoặc None."""
+        target = value.encode("utf-8")
+        lo, hi = 0, self.string_ids_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.string_bytes(mid)
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    # -------------------------------------------------------------------- types
+    def type_string_idx(self, type_idx) -> int:
+        return struct.unpack_from("<I", self.data, self.type_ids_off + type_idx * 4)[0]
+
+    def type_descriptor(self, type_idx) -> str:
+        return self.string(self.type_string_idx(type_idx))
+
+    def find_type(self, descriptor: str):
+        string_idx = self.find_string(descriptor)
+        if string_idx is None:
+            return None
+        lo, hi = 0, self.type_ids_size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            current = self.type_string_idx(mid)
+            if current < string_idx:
+                lo = mid + 1
+            elif current > string_idx:
+                hi = mid
+            else:
+                return mid
+        return None
+
+    # ------------------------------------------------------------------ classes
+    def class_type_ids(self) -> set:
+        if self._class_types is None:
+            self._class_types = {
+                struct.unpack_from("<I", self.data, self.class_defs_off + n * 32)[0]
+                for n in range(self.class_defs_size)
+            }
+        return self._class_types
+
+    def class_descriptors(self) -> list:
+        return [
+            self.type_descriptor(struct.unpack_from("<I", self.data, self.class_defs_off + n * 32)[0])
+            for n in range(self.class_defs_size)
+        ]
+
+    def has_class(self, descriptor: str) -> bool:
+        """Class được định nghĩa trong dex này (không chỉ được tham chiếu)."""
+        type_idx = self.find_type(descriptor)
+        return type_idx is not None and type_idx in self.class_type_ids()
+
+    def _has_member(self, offset, size, descriptor, name, match=None) -> bool:
+        """
+        field_ids/method_ids (class_idx u16, type/proto u16, name_idx u32) sắp theo class, tên rồi kiểu:
+        tìm nhị phân tới nhóm (class, tên), match(type/proto idx) lọc tiếp trong nhóm.
+        """
+        type_idx = self.find_type(descriptor)
+        name_idx = self.find_string(name)
+        if type_idx is None or name_idx is None:
+            return False
+        key = (type_idx, name_idx)
+        lo, hi = 0, size
+        while lo < hi:
+            mid = (lo + hi) // 2
+            class_idx, _, member_name = struct.unpack_from("<HHI", self.data, offset + mid * 8)
+            if (class_idx, member_name) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        while lo < size:
+            class_idx, second, member_name = struct.unpack_from("<HHI", self.data, offset + lo * 8)
+            if (class_idx, member_name) != key:
+                return False
+            if match is None or match(second):
+                return True
+            lo += 1
+        return False
+
+    def has_method(self, descriptor: str, name: str, proto: str = None) -> bool:
+        """Có method_id `name` (và đúng proto "(params)ret" nếu truyền vào) thuộc class `descriptor`."""
+        return self._has_member(self.method_ids_off, self.method_ids_size, descriptor, name,
+                                None if proto is None else lambda idx: self.proto(idx) == proto)
+
+    def has_field(self, descriptor: str, name: str, field_type: str = None) -> bool:
+        return self._has_member(self.field_ids_off, self.field_ids_size, descriptor, name,
+                                None if field_type is None else lambda idx: self.type_descriptor(idx) == field_type)
+
+    # --------------------------------------------------------------- references
+    def type_list(self, off) -> tuple:
+        if not off:
+            return ()
+        size = struct.unpack_from("<I", self.data, off)[0]
+        return tuple(self.type_descriptor(idx) for idx in struct.unpack_from(f"<{size}H", self.data, off + 4))
+
+    def proto(self, idx) -> str:
+        _, return_idx, params_off = struct.unpack_from("<III", self.data, self.proto_ids_off + idx * 12)
+        return f"({''.join(self.type_list(params_off))}){self.type_descriptor(return_idx)}"
+
+    def field(self, idx) -> str:
+        class_idx, type_idx, name_idx = struct.unpack_from("<HHI", self.data, self.field_ids_off + idx * 8)
+        return f"{self.type_descriptor(class_idx)}->{self.string(name_idx)}:{self.type_descriptor(type_idx)}"
+
+    def method(self, idx) -> str:
+        class_idx, proto_idx, name_idx = struct.unpack_from("<HHI", self.data, self.method_ids_off + idx * 8)
+        return f"{self.type_descriptor(class_idx)}->{self.string(name_idx)}{self.proto(proto_idx)}"
+
+    def map_items(self) -> dict:
+        """{type: (size, offset)} theo map_list."""
+        if not hasattr(self, "_map"):
+            count = struct.unpack_from("<I", self.data, self.map_off)[0]
+            self._map = {}
+            for n in range(count):
+                kind, _, size, offset = struct.unpack_from("<HHII", self.data, self.map_off + 4 + n * 12)
+                self._map[kind] = (size, offset)
+        return self._map
+
+    def method_handle(self, idx) -> str:
+        _, offset = self.map_items()[TYPE_METHOD_HANDLE_ITEM]
+        kind, _, target, _ = struct.unpack_from("<HHHH", self.data, offset + idx * 8)
+        # 0x00-0x03: field (static/instance put/get), còn lại: method
+        return f"{kind}:{self.field(target) if kind <= 3 else self.method(target)}"
+
+    def call_site(self, idx) -> tuple:
+        _, offset = self.map_items()[TYPE_CALL_SITE_ID_ITEM]
+        array_off = struct.unpack_from("<I", self.data, offset + idx * 4)[0]
+        return self.encoded_array(array_off)[0]
+
+    def resolve(self, kind, idx):
+        """Giá trị tham chiếu theo loại index trong lệnh (string/type/field/method/proto/...)."""
+        if kind == "string":
+            return self.string(idx)
+        if kind == "type":
+            return self.type_descriptor(idx)
+        if kind == "field":
+            return self.field(idx)
+        if kind == "method":
+            return self.method(idx)
+        if kind == "proto":
+            return self.proto(idx)
+        if kind == "method_handle":
+            return self.method_handle(idx)
+        if kind == "call_site":
+            return self.call_site(idx)
+        raise DexError(f"Loại tham chiếu không hỗ trợ: {kind}")
+
+    # ------------------------------------------------------------ encoded values
+    def encoded_value(self, pos):
+        header = self.data[pos]
+        pos += 1
+        kind, arg = header & 0x1F, header >> 5
+        if kind == 0x1C:
+            return self.encoded_array(pos)
+        if kind == 0x1D:
+            return self.encoded_annotation(pos)
+        if kind == 0x1E:
+            return None, pos
+        if kind == 0x1F:
+            return bool(arg), pos
+        size = arg + 1
+        raw = int.from_bytes(self.data[pos:pos + size], "little")
+        pos += size
+        if kind in (0x00, 0x02, 0x04, 0x06):
+            bits = size * 8
+            value = raw - (1 << bits) if raw >> (bits - 1) else raw
+            return ("int", value), pos
+        if kind == 0x03:
+            return ("char", raw), pos
+        if kind in (0x10, 0x11):
+            # float/double: byte thấp bị cắt bỏ, dồn về bên phải
+            return ("float" if kind == 0x10 else "double", raw << (8 * ((4 if kind == 0x10 else 8) - size))), pos
+        refs = {0x15: "proto", 0x16: "method_handle", 0x17: "string", 0x18: "type",
+                0x19: "field", 0x1A: "method", 0x1B: "field"}
+        if kind not in refs:
+            raise DexError(f"encoded_value không hợp lệ: {kind:#x}")
+        return (refs[kind], self.resolve(refs[kind], raw)), pos
+
+    def encoded_array(self, pos):
+        size, pos = read_uleb128(self.data, pos)
+        values = []
+        for _ in range(size):
+            value, pos = self.encoded_value(pos)
+            values.append(value)
+        return tuple(values), pos
+
+    def encoded_annotation(self, pos):
+        type_idx, pos = read_uleb128(self.data, pos)
+        size, pos = read_uleb128(self.data, pos)
+        elements = []
+        for _ in range(size):
+            name_idx, pos = read_uleb128(self.data, pos)
+            value, pos = self.encoded_value(pos)
+            elements.append((self.string(name_idx), value))
+        return ("annotation", self.type_descriptor(type_idx), tuple(elements)), pos
+
+    # --------------------------------------------------------------- class data
+    def iter_classes(self):
+        """DexClass cho từng class_def theo thứ tự trong file."""
+        for n in range(self.class_defs_size):
+            (class_idx, access, super_idx, interfaces_off, _, _, data_off,
+             static_off) = struct.unpack_from("<8I", self.data, self.class_defs_off + n * 32)
+            fields, methods = [], []
+            if data_off:
+                counts = []
+                pos = data_off
+                for _ in range(4):
+                    value, pos = read_uleb128(self.data, pos)
+                    counts.append(value)
+                for group, count in enumerate(counts):
+                    # index mã hoá dạng hiệu so với phần tử trước trong cùng danh sách
+                    index = 0
+                    for _ in range(count):
+                        diff, pos = read_uleb128(self.data, pos)
+                        flags, pos = read_uleb128(self.data, pos)
+                        index += diff
+                        if group < 2:
+                            fields.append((index, flags))
+                        else:
+                            code_off, pos = read_uleb128(self.data, pos)
+                            methods.append((index, flags, code_off))
+            yield DexClass(
+                self.type_descriptor(class_idx),
+                access,
+                self.type_descriptor(super_idx) if super_idx != NO_INDEX else None,
+                self.type_list(interfaces_off),
+                fields,
+                methods,
+                self.encoded_array(static_off)[0] if static_off else (),
+            )
+
+    # ------------------------------------------------------------------- code
+    def code_item(self, off) -> CodeItem:
+        registers, ins, outs, tries_size, _, insns_size = struct.unpack_from("<HHHHII", self.data, off)
+        insns_off = off + 16
+        insns = self.data[insns_off:insns_off + insns_size * 2].cast("H")
+        tries = []
+        if tries_size:
+            tries_off = insns_off + insns_size * 2 + (2 if insns_size % 2 else 0)
+            handlers_base = tries_off + tries_size * 8
+            for n in range(tries_size):
+                start, count, handler_off = struct.unpack_from("<IHH", self.data, tries_off + n * 8)
+                tries.append((start, start + count, self._catch_handler(handlers_base + handler_off)))
+        return CodeItem(registers, ins, outs, insns, tries)
+
+    def _catch_handler(self, pos) -> tuple:
+        size, pos = read_sleb128(self.data, pos)
+        handlers = []
+        for _ in range(abs(size)):
+            type_idx, pos = read_uleb128(self.data, pos)
+            addr, pos = read_uleb128(self.data, pos)
+            handlers.append((self.type_descriptor(type_idx), addr))
+        if size <= 0:
+            addr, pos = read_uleb128(self.data, pos)
+            handlers.append((None, addr))
+        return tuple(handlers)
+
+@contextmanager
+def mapped(path):
+    """DexFile trên mmap của một file .dex (chỉ đọc)."""
+    with open(path, "rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        view = memoryview(mm)
+        try:
+            yield DexFile(view)
+        finally:
+            view.release()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+# events.py
+#
+# Luồng sự kiện tiến độ có cấu trúc cho các wrapper/CI.
+# Bật bằng --events json (pipeline.py, batch.py, usagi.py) hoặc KAORI_EVENTS=json:
+# mỗi sự kiện là một dòng JSON trên stdout, toàn bộ output dạng text bị tắt.
+# usagi.py: chỉ các subcommand; menu tương tác luôn là text và từ chối chạy ở chế độ json.
+#   {"event": "stage_start", "stage": "...", "ts": ...}
+#   {"event": "progress", "stage": "...", "done": 3, "total": 10, "rate": 1.5, "mb_s": 4.2}
+#   {"event": "stage_end", "stage": "...", "ok": true, "seconds": 1.2}
+#   {"event": "error", "message": "...", "file": "...", "method": "..."}
+#   {"event": "log", "level": "INFO", "message": "..."}
+# Progress được giới hạn tối đa KAORI_EVENTS_RATE lần/giây cho mỗi stage (mặc định 4),
+# sự kiện cuối (done == total) luôn được gửi.
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+_mode = None
+_quiet = False
+_stream = sys.stdout
+_interval = 0.25
+_lock = threading.Lock()
+
+def configure(mode=None, stream=None, rate=None):
+    global _mode, _stream, _interval
+    _mode = mode or None
+    if stream is not None:
+        _stream = stream
+    if rate:
+        _interval = 1.0 / float(rate)
+    if _mode:
+        os.environ["KAORI_EVENTS"] = _mode
+
+def set_quiet(quiet=True):
+    """Tắt output text (dùng trong các process con của batch)."""
+    global _quiet
+    _quiet = quiet
+    if quiet:
+        os.environ["KAORI_QUIET"] = "1"
+
+def json_mode() -> bool:
+    return _mode == "json"
+
+def text_enabled() -> bool:
+    return not _quiet and not json_mode()
+
+def emit(event, **fields):
+    if not json_mode():
+        return
+    record = {"event": event, "ts": round(time.time(), 3), "pid": os.getpid(), **fields}
+    line = json.dumps(record, ensure_ascii=False, default=str)
+    with _lock:
+        _stream.write(line + "\n")
+        _stream.flush()
+
+def error(message, file=None, method=None, **fields):
+    emit("error", message=message, file=file, method=method, **fields)
+
+@contextmanager
+def stage(name, **fields):
+    started = time.monotonic()
+    emit("stage_start", stage=name, **fields)
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        emit("stage_end", stage=name, ok=ok, seconds=round(time.monotonic() - started, 3))
+
+class Progress:
+    """Đếm tiến độ done/total; phát sự kiện (hoặc dòng text) tối đa theo chu kỳ _interval."""
+
+    def __init__(self, stage, total=None, unit="items"):
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        self.done = 0
+        self.bytes = 0
+        self.started = time.monotonic()
+        self._last = self.started
+
+    def advance(self, count=1, nbytes=0):
+        self.done += count
+        self.bytes += nbytes
+        now = time.monotonic()
+        finished = self.total is not None and self.done >= self.total
+        if finished or now - self._last >= _interval:
+            self._last = now
+            self._publish(now)
+
+    def finish(self):
+        if self.total is None or self.done < self.total:
+            self._publish(time.monotonic())
+
+    def _publish(self, now):
+        elapsed = max(now - self.started, 1e-9)
+        rate = self.done / elapsed
+        mb_s = self.bytes / (1 << 20) / elapsed
+        if json_mode():
+            emit("progress", stage=self.stage, done=self.done, total=self.total,
+                 unit=self.unit, rate=round(rate, 2), mb_s=round(mb_s, 2))
+        elif text_enabled():
+            total = f"/{self.total}" if self.total is not None else ""
+            print(f"   ➕ {self.stage}: {self.done}{total} {self.unit} ({rate:.0f}/s)", flush=True)
+
+configure(os.getenv("KAORI_EVENTS"), rate=os.getenv("KAORI_EVENTS_RATE"))
+set_quiet(os.getenv("KAORI_QUIET") == "1")
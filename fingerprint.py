@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# fingerprint.py
+#
+# Preflight: nhận diện ROM từ chính các jar đầu vào, không decompile.
+# Jar được mmap, đọc central directory rồi parse header + bảng string/type/method của từng classes*.dex
+# (entry STORED đọc thẳng trên mmap, không copy). Từ đó chọn API level cho smali, các bước patch
+# áp dụng được và profile; lựa chọn ghi vào run report <base>/kaori_run.json để repack
+# và các script chạy riêng lẻ (bootloop.py, apk.py, kaori.py) dùng lại.
+#   python fingerprint.py        nhận diện và ghi report
+#   python fingerprint.py -n     chỉ in lựa chọn, không ghi report
+#   KAORI_FINGERPRINT=0          tắt tự chọn (chạy mọi bước, API mặc định)
+#   KAORI_API_LEVEL=N            ép API level cho smali
+
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import re
+import threading
+import time
+import zipfile
+
+import bootloop
+import events
+from dexfile import DexError, DexFile
+from profiling import span
+from ziputil import entry_data_offset
+from utils import CURRENT_DIR, TARGET_JARS, UNPACK_DIRS, log
+
+REPORT_NAME = "kaori_run.json"
+DEFAULT_API = 33
+_report_lock = threading.Lock()
+
+# Tên field trong Build$VERSION_CODES (framework.jar), mới nhất trước
+API_CODENAMES = [
+    (36, "BAKLAVA"),
+    (35, "VANILLA_ICE_CREAM"),
+    (34, "UPSIDE_DOWN_CAKE"),
+    (33, "TIRAMISU"),
+    (32, "S_V2"),
+]
+# Framework được build với min-api bằng API của ROM nên phiên bản dex giới hạn khoảng API
+DEX_API_RANGE = {
+    "035": (14, 23),
+    "037": (24, 25),
+    "038": (26, 27),
+    "039": (28, None),
+}
+ANDROID_VERSIONS = {36: "16", 35: "15", 34: "14", 33: "13", 32: "12L", 31: "12", 30: "11", 29: "10", 28: "9"}
+
+APK_TARGET = ("Landroid/util/apk/ApkSignatureVerifier;", "getMinimumSignatureSchemeVersionForTargetSdk")
+KAORI_TARGETS = [
+    ("Landroid/app/ApplicationPackageManager;", "hasSystemFeature"),
+    ("Landroid/app/Instrumentation;", "newApplication"),
+    ("Landroid/security/KeyStore2;", "getKeyEntry"),
+    ("Landroid/security/keystore2/AndroidKeyStoreSpi;", "engineGetCertificateChain"),
+]
+
+def enabled() -> bool:
+    return os.getenv("KAORI_FINGERPRINT", "1") != "0"
+
+def _dex_order(name: str) -> int:
+    match = re.fullmatch(r"classes(\d*)\.dex", name)
+    return int(match.group(1) or 1) if match else 0
+
+class JarIndex:
+    """Các classes*.dex của một jar, mở qua mmap cho tới khi close()."""
+
+    def __init__(self, path):
+        self.path = path
+        self.dexes = {}
+        self.errors = {}
+        self.zip_time = None
+        self._file = open(path, "rb")
+        self._mm = None
+        self._views = []
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            with zipfile.ZipFile(self._file) as zf:
+                infos = zf.infolist()
+                if infos:
+                    self.zip_time = "%04d-%02d-%02d %02d:%02d:%02d" % infos[0].date_time
+                names = [info for info in infos if _dex_order(info.filename)]
+                for info in sorted(names, key=lambda i: _dex_order(i.filename)):
+                    if info.compress_type == zipfile.ZIP_STORED:
+                        offset = entry_data_offset(self._file, info)
+                        data = memoryview(self._mm)[offset:offset + info.file_size]
+                        self._views.append(data)
+                    else:
+                        data = zf.read(info)
+                    try:
+                        self.dexes[info.filename] = DexFile(data)
+                    except DexError as exc:
+                        self.errors[info.filename] = str(exc)
+        except Exception:
+            self.close()
+            raise
+
+    def close(self):
+        self.dexes = {}
+        for view in self._views:
+            view.release()
+        self._views = []
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def find_class(self, descriptor: str):
+        """Tên dex định nghĩa class, hoặc None."""
+        for name, dex in self.dexes.items():
+            if dex.has_class(descriptor):
+                return name
+        return None
+
+    def has_method(self, descriptor: str, method: str) -> bool:
+        return any(dex.has_method(descriptor, method) for dex in self.dexes.values())
+
+    def has_string(self, value: str) -> bool:
+        return any(dex.find_string(value) is not None for dex in self.dexes.values())
+
+    def summary(self) -> dict:
+        return {
+            "zip_time": self.zip_time,
+            "dex": {
+                name: {
+                    "version": dex.version,
+                    "bytes": dex.file_size,
+                    "classes": dex.class_defs_size,
+                    "methods": dex.method_ids_size,
+                    "fields": dex.field_ids_size,
+                }
+                for name, dex in self.dexes.items()
+            },
+            "unparsed": dict(self.errors),
+        }
+
+def _select_api(framework, versions):
+    """(API level, nguồn) theo codename trong VERSION_CODES, không có thì theo phiên bản dex."""
+    forced = os.getenv("KAORI_API_LEVEL")
+    if forced:
+        return int(forced), "KAORI_API_LEVEL"
+    if framework:
+        for api, codename in API_CODENAMES:
+            if framework.has_string(codename):
+                return api, f"VERSION_CODES.{codename}"
+    if versions:
+        version = max(versions)
+        low, high = DEX_API_RANGE.get(version, (DEX_API_RANGE["039"][0], None))
+        api = max(low, DEFAULT_API if high is None else min(high, DEFAULT_API))
+        return api, f"dex {version}"
+    return DEFAULT_API, "mặc định"
+
+def _stage_bootloop(indexes, jars, locations) -> dict:
+    jar_of = {unpack_dir: jar for jar, unpack_dir in UNPACK_DIRS.items()}
+    found, unknown = 0, []
+    for rel_dir, files in bootloop.TARGET_FILES.items():
+        jar_name = jar_of[rel_dir.split("/")[0]]
+        index = indexes.get(jar_name)
+        if index is None and jar_name not in jars:
+            continue
+        if index is None or not index.dexes:
+            unknown.append(jar_name)
+            continue
+        for rel in files:
+            descriptor = "L" + rel[:-len(".smali")] + ";"
+            dex_name = index.find_class(descriptor)
+            locations[descriptor] = f"{jar_name}:{dex_name}" if dex_name else None
+            found += bool(dex_name)
+    if found:
+        return {"enabled": True, "reason": f"{found} class record có trong ROM"}
+    if unknown:
+        return {"enabled": True, "reason": f"không đọc được dex của {', '.join(sorted(set(unknown)))}"}
+    return {"enabled": False, "reason": "không có class nào trong danh sách A15"}
+
+def _stage_methods(framework, jars, targets, locations) -> dict:
+    if framework is None and "framework.jar" not in jars:
+        return {"enabled": False, "reason": "không có framework.jar"}
+    if framework is None or not framework.dexes:
+        return {"enabled": True, "reason": "không đọc được dex của framework.jar"}
+    present = []
+    for descriptor, method in targets:
+        dex_name = framework.find_class(descriptor)
+        locations[descriptor] = f"framework.jar:{dex_name}" if dex_name else None
+        if dex_name and framework.has_method(descriptor, method):
+            present.append(method)
+    if present:
+        return {"enabled": True, "reason": f"có {', '.join(present)}"}
+    return {"enabled": False, "reason": "không có method mục tiêu"}
+
+def fingerprint(base=CURRENT_DIR) -> dict:
+    indexes = {}
+    jars = {}
+    try:
+        with span("fingerprint", "stage") as sp:
+            for jar_name in TARGET_JARS:
+                path = base / jar_name
+                if not path.exists():
+                    continue
+                try:
+                    indexes[jar_name] = JarIndex(path)
+                except (OSError, ValueError, zipfile.BadZipFile) as exc:
+                    jars[jar_name] = {"error": str(exc)}
+                    continue
+                jars[jar_name] = indexes[jar_name].summary()
+
+            framework = indexes.get("framework.jar")
+            versions = [dex.version for index in indexes.values() for dex in index.dexes.values()]
+            api, api_source = _select_api(framework, versions)
+
+            signatures = hashlib.sha1()
+            for jar_name, index in indexes.items():
+                for name, dex in index.dexes.items():
+                    signatures.update(f"{jar_name}:{name}:".encode() + dex.signature)
+
+            locations = {}
+            stages = {
+                "bootloop": _stage_bootloop(indexes, jars, locations),
+                "apk": _stage_methods(framework, jars, [APK_TARGET], locations),
+                "kaori": _stage_methods(framework, jars, KAORI_TARGETS, locations),
+            }
+            vendor = "miui" if any(jar.startswith("miui-") for jar in indexes) else "aosp"
+            android = ANDROID_VERSIONS.get(api, str(api))
+            sp.set(jars=len(indexes), dex=len(versions), api=api)
+    finally:
+        for index in indexes.values():
+            index.close()
+
+    return {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "fingerprint": {
+            "jars": jars,
+            "dex_version": max(versions) if versions else None,
+            "build_id": signatures.hexdigest()[:16] if versions else None,
+        },
+        "selection": {
+            "api_level": api,
+            "api_source": api_source,
+            "android": android,
+            "profile": f"{vendor}-a{android}",
+            "stages": stages,
+            "targets": locations,
+        },
+    }
+
+def report_path(base=CURRENT_DIR):
+    return base / REPORT_NAME
+
+def load(base=CURRENT_DIR):
+    try:
+        return json.loads(report_path(base).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+def save(report, base=CURRENT_DIR):
+    path = report_path(base)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+def record(section, value, base=CURRENT_DIR, key=None):
+    """
+    Ghi một mục (vd. "multidex") vào run report, hoặc report[section][key] nếu có key;
+    các bước chạy song song theo jar dùng chung lock.
+    """
+    with _report_lock:
+        report = load(base) or {}
+        if key is None:
+            report[section] = value
+        else:
+            report.setdefault(section, {})[key] = value
+        save(report, base)
+
+def announce(report):
+    selection = report["selection"]
+    if events.json_mode():
+        events.emit("fingerprint", build_id=report["fingerprint"]["build_id"], **selection)
+        return
+    log(
+        f"ROM: {selection['profile']} (API {selection['api_level']} theo {selection['api_source']}, "
+        f"dex {report['fingerprint']['dex_version']}, build {report['fingerprint']['build_id']})",
+        "INFO",
+    )
+    for name, decision in selection["stages"].items():
+        if not decision["enabled"]:
+            log(f"Tự bỏ qua {name}: {decision['reason']}", "WARN")
+
+def preflight(base=CURRENT_DIR):
+    """Nhận diện ROM từ jar đầu vào và ghi run report. Trả về report, None nếu bị tắt."""
+    if not enabled():
+        report_path(base).unlink(missing_ok=True)
+        return None
+    report = fingerprint(base)
+    save(report, base)
+    announce(report)
+    return report
+
+def api_level(base=CURRENT_DIR) -> str:
+    forced = os.getenv("KAORI_API_LEVEL")
+    if forced:
+        return forced
+    report = load(base) if enabled() else None
+    if report and "selection" in report:
+        return str(report["selection"]["api_level"])
+    return str(DEFAULT_API)
+
+def skip_reason(stage_name, base=CURRENT_DIR):
+    """Lý do bỏ qua một bước patch theo run report, None nếu bước đó nên chạy."""
+    report = load(base) if enabled() else None
+    if not report or "selection" not in report:
+        return None
+    decision = report["selection"]["stages"].get(stage_name)
+    if decision is None or decision["enabled"]:
+        return None
+    return decision["reason"]
+
+def select_stages(stages, base=CURRENT_DIR) -> list:
+    """Bỏ các bước patch mà run report đánh dấu không áp dụng được cho ROM này."""
+    return [name for name in stages if skip_reason(name, base) is None]
+
+def main():
+    parser = argparse.ArgumentParser(description="Nhận diện ROM từ các jar trong thư mục hiện tại và chọn bước patch")
+    parser.add_argument("-n", "--dry-run", action="store_true", help=f"Chỉ in lựa chọn, không ghi {REPORT_NAME}")
+    args = parser.parse_args()
+
+    if not any((CURRENT_DIR / jar).exists() for jar in TARGET_JARS):
+        log("Không tìm thấy file JAR nào để nhận diện.", "ERROR")
+        raise SystemExit(1)
+    report = fingerprint()
+    announce(report)
+    if args.dry_run:
+        return
+    save(report)
+    log(f"Đã ghi {report_path()}", "SUCCESS")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+#!/usr/bin/env python3
+# imgread.py
+#
+# Đọc framework jar trực tiếp từ system.img / system_ext.img (ext4 hoặc EROFS) qua mmap,
+# không cần root, loop mount hay giải nén cả image. Chỉ các extent của file cần lấy được đọc.
+#   python imgread.py system.img system_ext.img          ghi các jar tìm được vào thư mục hiện tại
+#   python imgread.py system.img -o roms/alioth
+# Giới hạn: sparse image (simg) cần simg2img trước; EROFS nén (lz4/lzma) chưa hỗ trợ.
+
+import argparse
+import mmap
+import os
+import struct
+import sys
+from pathlib import Path
+from utils import CURRENT_DIR, TARGET_JARS, log
+
+SPARSE_MAGIC = 0xED26FF3A
+EXT4_MAGIC = 0xEF53
+EROFS_MAGIC = 0xE0F5E1E2
+
+S_IFMT = 0o170000
+S_IFDIR = 0o040000
+S_IFREG = 0o100000
+S_IFLNK = 0o120000
+
+# Vị trí có thể có của từng jar trong các loại image (system-as-root, system_ext gộp hoặc tách riêng)
+JAR_PATHS = {
+    "framework.jar": ["system/framework/framework.jar", "framework/framework.jar"],
+    "services.jar": ["system/framework/services.jar", "framework/services.jar"],
+    "miui-framework.jar": [
+        "system/system_ext/framework/miui-framework.jar", "system_ext/framework/miui-framework.jar",
+        "framework/miui-framework.jar",
+    ],
+    "miui-services.jar": [
+        "system/system_ext/framework/miui-services.jar", "system_ext/framework/miui-services.jar",
+        "framework/miui-services.jar",
+    ],
+}
+
+class ImageError(Exception):
+    pass
+
+class _Image:
+    """Phần chung: duyệt đường dẫn (kể cả symlink) trên các hàm inode do lớp con cài đặt."""
+
+    max_symlinks = 8
+
+    def __init__(self, mm):
+        self.mm = mm
+
+    def lookup(self, path: str):
+        """Trả về inode của file theo đường dẫn trong image, hoặc None."""
+        parts = [p for p in path.split("/") if p]
+        ino = self.root
+        hops = 0
+        while parts:
+            name = parts.pop(0)
+            entries = self.listdir(ino)
+            if name not in entries:
+                return None
+            child = entries[name]
+            if self.mode(child) & S_IFMT == S_IFLNK:
+                hops += 1
+                if hops > self.max_symlinks:
+                    raise ImageError(f"Quá nhiều symlink khi tìm {path}")
+                target = self.read(child).decode("utf-8", "replace")
+                parts = [p for p in target.split("/") if p] + parts
+                if target.startswith("/"):
+                    ino = self.root
+                continue
+            ino = child
+        return ino
+
+    def read(self, ino) -> bytes:
+        return b"".join(bytes(chunk) for chunk in self.chunks(ino))
+
+    def copy_to(self, ino, dest: Path) -> int:
+        tmp = dest.with_name(f".{dest.name}.{os.getpid()}.tmp")
+        size = 0
+        with open(tmp, "wb") as handle:
+            for chunk in self.chunks(ino):
+                handle.write(chunk)
+                size += len(chunk)
+        os.replace(tmp, dest)
+        return size
+
+class Ext4Image(_Image):
+    EXTENTS_FL = 0x80000
+    INLINE_DATA_FL = 0x10000000
+    INCOMPAT_64BIT = 0x80
+    EXTENT_MAGIC = 0xF30A
+
+    def __init__(self, mm):
+        super().__init__(mm)
+        sb = 1024
+        self.block_size = 1024 << struct.unpack_from("<I", mm, sb + 24)[0]
+        self.first_data_block = struct.unpack_from("<I", mm, sb + 20)[0]
+        self.inodes_per_group = struct.unpack_from("<I", mm, sb + 40)[0]
+        rev_level = struct.unpack_from("<I", mm, sb + 76)[0]
+        self.inode_size = struct.unpack_from("<H", mm, sb + 88)[0] if rev_level else 128
+        incompat = struct.unpack_from("<I", mm, sb + 96)[0]
+        self.is64 = bool(incompat & self.INCOMPAT_64BIT)
+        self.desc_size = struct.unpack_from("<H", mm, sb + 254)[0] if self.is64 else 32
+        self.gdt = (self.first_data_block + 1) * self.block_size
+        self.root = 2
+
+    def _inode(self, ino) -> int:
+        group, index = divmod(ino - 1, self.inodes_per_group)
+        desc = self.gdt + group * self.desc_size
+        table = struct.unpack_from("<I", self.mm, desc + 8)[0]
+        if self.is64 and self.desc_size >= 64:
+            table |= struct.unpack_from("<I", self.mm, desc + 0x28)[0] << 32
+        return table * self.block_size + index * self.inode_size
+
+    def mode(self, ino) -> int:
+        return struct.unpack_from("<H", self.mm, self._inode(ino))[0]
+
+    def size(self, ino) -> int:
+        off = self._inode(ino)
+        return struct.unpack_from("<I", self.mm, off + 4)[0] | struct.unpack_from("<I", self.mm, off + 108)[0] << 32
+
+    def _extents(self, node_off):
+        """Duyệt cây extent: yield (logical block, physical block, số block, uninit)."""
+        magic, entries, _, depth = struct.unpack_from("<HHHH", self.mm, node_off)
+        if magic != self.EXTENT_MAGIC:
+            raise ImageError("Extent header hỏng")
+        for n in range(entries):
+            entry = node_off + 12 + n * 12
+            if depth == 0:
+                lblock, length, start_hi, start_lo = struct.unpack_from("<IHHI", self.mm, entry)
+                uninit = length > 32768
+                yield lblock, start_hi << 32 | start_lo, length - 32768 if uninit else length, uninit
+            else:
+                _, leaf_lo, leaf_hi = struct.unpack_from("<IIH", self.mm, entry)
+                yield from self._extents((leaf_hi << 32 | leaf_lo) * self.block_size)
+
+    def _block_map(self, off, nblocks):
+        """ext2/3 block map: 12 block trực tiếp + gián tiếp 1/2/3 cấp."""
+        per_block = self.block_size // 4
+        pointers = struct.unpack_from("<15I", self.mm, off + 40)
+
+        def walk(block, level):
+            if level == 0:
+                yield block
+                return
+            table = struct.unpack_from(f"<{per_block}I", self.mm, block * self.block_size)
+            for child in table:
+                yield from walk(child, level - 1)
+
+        produced = 0
+        for level, roots in ((0, pointers[:12]), (1, pointers[12:13]), (2, pointers[13:14]), (3, pointers[14:15])):
+            for root in roots:
+                if produced >= nblocks:
+                    return
+                if root == 0:
+                    # Lỗ trong file thưa: block 0 được hiểu là toàn số 0
+                    span = per_block ** level
+                    for _ in range(min(span, nblocks - produced)):
+                        yield 0
+                    produced += span
+                    continue
+                for block in walk(root, level):
+                    if produced >= nblocks:
+                        return
+                    yield block
+                    produced += 1
+
+    def chunks(self, ino):
+        off = self._inode(ino)
+        size = self.size(ino)
+        flags = struct.unpack_from("<I", self.mm, off + 32)[0]
+        bs = self.block_size
+        if flags & self.INLINE_DATA_FL:
+            yield memoryview(self.mm)[off + 40: off + 40 + min(size, 60)]
+            return
+        if self.mode(ino) & S_IFMT == S_IFLNK and size < 60 and not flags & self.EXTENTS_FL:
+            # Fast symlink: đích nằm ngay trong i_block
+            yield memoryview(self.mm)[off + 40: off + 40 + size]
+            return
+        view = memoryview(self.mm)
+        pos = 0
+        if flags & self.EXTENTS_FL:
+            for lblock, pblock, length, uninit in sorted(self._extents(off + 40)):
+                start = lblock * bs
+                if start >= size:
+                    break
+                if start > pos:
+                    yield bytes(start - pos)
+                    pos = start
+                count = min(length * bs, size - start)
+                yield bytes(count) if uninit else view[pblock * bs: pblock * bs + count]
+                pos = start + count
+        else:
+            for block in self._block_map(off, (size + bs - 1) // bs):
+                count = min(bs, size - pos)
+                yield bytes(count) if block == 0 else view[block * bs: block * bs + count]
+                pos += count
+        if pos < size:
+            yield bytes(size - pos)
+
+    def listdir(self, ino) -> dict:
+        data = self.read(ino)
+        entries = {}
+        pos = 0
+        while pos + 8 <= len(data):
+            child, rec_len, name_len = struct.unpack_from("<IHB", data, pos)
+            if rec_len < 8:
+                break
+            if child:
+                entries[data[pos + 8: pos + 8 + name_len].decode("utf-8", "replace")] = child
+            pos += rec_len
+        return entries
+
+class ErofsImage(_Image):
+    FLAT_PLAIN, COMPRESSED_FULL, FLAT_INLINE, COMPRESSED_COMPACT, CHUNK_BASED = range(5)
+    CHUNK_FORMAT_BLKBITS_MASK = 0x1F
+    CHUNK_FORMAT_INDEXES = 0x20
+    NULL_ADDR = 0xFFFFFFFF
+
+    def __init__(self, mm):
+        super().__init__(mm)
+        sb = 1024
+        self.block_size = 1 << mm[sb + 12]
+        self.root = struct.unpack_from("<H", mm, sb + 14)[0]
+        self.meta_blkaddr = struct.unpack_from("<I", mm, sb + 40)[0]
+
+    def _inode(self, nid):
+        """(offset, kích thước inode + xattr, layout, mode, size, i_u)"""
+        off = self.meta_blkaddr * self.block_size + nid * 32
+        i_format, xattr_icount, mode = struct.unpack_from("<HHH", self.mm, off)
+        extended = i_format & 1
+        layout = (i_format >> 1) & 0x7
+        if extended:
+            size = struct.unpack_from("<Q", self.mm, off + 8)[0]
+            inode_size = 64
+        else:
+            size = struct.unpack_from("<I", self.mm, off + 8)[0]
+            inode_size = 32
+        i_u = struct.unpack_from("<I", self.mm, off + 16)[0]
+        xattr_size = 12 + (xattr_icount - 1) * 4 if xattr_icount else 0
+        return off, inode_size + xattr_size, layout, mode, size, i_u
+
+    def mode(self, nid) -> int:
+        return self._inode(nid)[3]
+
+    def size(self, nid) -> int:
+        return self._inode(nid)[4]
+
+    def chunks(self, nid):
+        off, meta_size, layout, _, size, i_u = self._inode(nid)
+        bs = self.block_size
+        view = memoryview(self.mm)
+        if layout in (self.COMPRESSED_FULL, self.COMPRESSED_COMPACT):
+            raise ImageError("EROFS nén chưa được hỗ trợ: giải nén image bằng fsck.erofs --extract trước")
+        if layout == self.FLAT_PLAIN:
+            yield view[i_u * bs: i_u * bs + size]
+            return
+        if layout == self.FLAT_INLINE:
+            full = size // bs * bs
+            if full:
+                yield view[i_u * bs: i_u * bs + full]
+            tail = size - full
+            if tail:
+                yield view[off + meta_size: off + meta_size + tail]
+            return
+        if layout != self.CHUNK_BASED:
+            raise ImageError(f"Layout EROFS không hỗ trợ: {layout}")
+
+        chunk_size = bs << (i_u & self.CHUNK_FORMAT_BLKBITS_MASK)
+        count = (size + chunk_size - 1) // chunk_size
+        indexes = i_u & self.CHUNK_FORMAT_INDEXES
+        table = off + meta_size
+        if indexes:
+            table = (table + 7) // 8 * 8
+        for n in range(count):
+            if indexes:
+                blkaddr = struct.unpack_from("<I", self.mm, table + n * 8 + 4)[0]
+            else:
+                blkaddr = struct.unpack_from("<I", self.mm, table + n * 4)[0]
+            length = min(chunk_size, size - n * chunk_size)
+            if blkaddr == self.NULL_ADDR:
+                yield bytes(length)
+            else:
+                yield view[blkaddr * bs: blkaddr * bs + length]
+
+    def listdir(self, nid) -> dict:
+        data = self.read(nid)
+        entries = {}
+        bs = self.block_size
+        for block in range(0, len(data), bs):
+            chunk = data[block: block + bs]
+            if len(chunk) < 12:
+                break
+            first_nameoff = struct.unpack_from("<H", chunk, 8)[0]
+            count = first_nameoff // 12
+            dirents = [struct.unpack_from("<QHBB", chunk, n * 12) for n in range(count)]
+            for n, (child, nameoff, _, _) in enumerate(dirents):
+                end = dirents[n + 1][1] if n + 1 < count else len(chunk)
+                name = chunk[nameoff:end].split(b"\0", 1)[0].decode("utf-8", "replace")
+                # Giữ "." và ".." như ext4: symlink tương đối (../../framework/x.jar) đi lên qua nid cha
+                entries[name] = child
+        return entries
+
+def open_image(path: Path):
+    """Mở image (ext4/EROFS) và trả về (mmap, reader)."""
+    with open(path, "rb") as handle:
+        # Kiểm tra trước khi mmap: mmap file rỗng báo ValueError chứ không phải ImageError
+        if os.fstat(handle.fileno()).st_size < 2048:
+            raise ImageError(f"{path.name}: file quá nhỏ")
+        mm = mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ)
+    if struct.unpack_from("<I", mm, 0)[0] == SPARSE_MAGIC:
+        mm.close()
+        raise ImageError(f"{path.name}: sparse image, chạy simg2img trước")
+    if struct.unpack_from("<I", mm, 1024)[0] == EROFS_MAGIC:
+        return mm, ErofsImage(mm)
+    if struct.unpack_from("<H", mm, 1024 + 56)[0] == EXT4_MAGIC:
+        return mm, Ext4Image(mm)
+    mm.close()
+    raise ImageError(f"{path.name}: không phải ext4 hoặc EROFS")
+
+def extract_jars(images, dest=CURRENT_DIR, jars=None) -> dict:
+    """Tìm và ghi các jar mục tiêu từ danh sách image. Trả về {jar: số byte}."""
+    found = {}
+    for image_path in images:
+        image_path = Path(image_path)
+        mm, reader = open_image(image_path)
+        try:
+            for jar_name in jars or TARGET_JARS:
+                if jar_name in found:
+                    continue
+                for candidate in JAR_PATHS[jar_name]:
+                    ino = reader.lookup(candidate)
+                    if ino is None or reader.mode(ino) & S_IFMT != S_IFREG:
+                        continue
+                    found[jar_name] = reader.copy_to(ino, dest / jar_name)
+                    log(f"{image_path.name}:/{candidate} -> {jar_name} ({found[jar_name] >> 10} KB)", "SUCCESS")
+                    break
+        finally:
+            mm.close()
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description="Lấy framework jar trực tiếp từ system/system_ext image")
+    parser.add_argument("images", nargs="+", type=Path, help="system.img, system_ext.img (ext4 hoặc EROFS)")
+    parser.add_argument("-o", "--out", type=Path, default=CURRENT_DIR, help="Thư mục ghi jar")
+    args = parser.parse_args()
+
+    args.out.mkdir(parents=True, exist_ok=True)
+    try:
+        found = extract_jars(args.images, args.out)
+    except (OSError, ImageError) as exc:
+        log(str(exc), "ERROR")
+        sys.exit(1)
+    if "framework.jar" not in found:
+        log("Không tìm thấy framework.jar trong image", "ERROR")
+        sys.exit(1)
+    missing = [jar for jar in TARGET_JARS if jar not in found]
+    if missing:
+        log(f"Không có trong image: {', '.join(missing)}", "WARN")
+
+if __name__ == "__main__":
+    main()
@@ -5,31 +5,148 @@ import os
 import shutil
 import re
 from pathlib import Path
-from utils import CURRENT_DIR, USAGI_DIR, log
+import fingerprint
+import patchplan
+import shrink
+from patchlog import PATCH_FAMILY_ATTR, PatchManifest, apply_once
+from pristine import mark_dirty, write_patched
+from profiling import span
+from utils import CURRENT_DIR, USAGI_DIR, log, stage
 
-def copy_kaorios_folder():
-    source = USAGI_DIR / "kaorios"
-    
-    target = (
-        CURRENT_DIR / "framework_unpacked" / "smali_classes5" 
-        / "com" / "android" / "internal" / "util" / "kaorios"
-    )
+# Nơi chép payload kaorios (tương đối với base); dex chứa payload là smali_classes5
+KAORIOS_SOURCE = USAGI_DIR / "kaorios"
+KAORIOS_TARGET = Path("framework_unpacked", "smali_classes5", "com", "android", "internal", "util", "kaorios")
+
+# Biến thể hook hasSystemFeature có cache theo process (KAORI_FEATURE_CACHE=1): mọi giá trị trả về của
+# hasSystemFeature(String,I) đi qua KaoriFeatureCache.hasSystemFeature(tên, version, kết quả gốc).
+# Feature không có trong bốn danh sách getFeatures*() (HashSet dựng một lần trong <clinit>) trả ngay kết quả
+# gốc, không IPC Settings; feature có trong danh sách thì quyết định của ToolboxUtils.KaoriosFeaturesV1
+# (đọc toggle qua Settings) được nhớ theo (tên, kết quả gốc) sau khi boot xong - hasSystemFeatureInternalA15
+# không dùng version. invalidate() xoá các quyết định, được gọi từ invalidateHasSystemFeatureCache().
+KAORIOS_PACKAGE = "Lcom/android/internal/util/kaorios/"
+FEATURE_CACHE_CLASS = f"{KAORIOS_PACKAGE}KaoriFeatureCache;"
+FEATURE_GETTERS = ["getFeaturesPixel", "getFeaturesPixelOthers", "getFeaturesTensor", "getFeaturesNexus"]
+# Tham số của hasSystemFeature(String,I) (this, name, version) và số register hook thêm vào method
+FEATURE_HOOK_INS = 3
+FEATURE_HOOK_REGISTERS = 3
+RETURN_RE = re.compile(r"^(\s*)return ([vp]\d+)\s*$")
+REGISTERS_RE = re.compile(r"^(\s*)\.(registers|locals) (\d+)\s*$")
+
+def feature_cache_enabled() -> bool:
+    return os.getenv("KAORI_FEATURE_CACHE", "0") == "1"
+
+def feature_cache_smali() -> str:
+    """Nội dung KaoriFeatureCache.smali (class payload sinh ra cho biến thể hook có cache)."""
+    utils = f"{KAORIOS_PACKAGE}KaoriFeaturesUtils;"
+    settings = f"{KAORIOS_PACKAGE}SettingsHelper;"
+    toolbox = f"{KAORIOS_PACKAGE}ToolboxUtils;"
+    decisions = "Ljava/util/concurrent/ConcurrentHashMap;"
+    cls = FEATURE_CACHE_CLASS
+    lines = [
+        f".class public final {cls}\n",
+        ".super Ljava/lang/Object;\n",
+        '.source "KaoriFeatureCache.java"\n\n\n',
+        "# static fields\n",
+        ".field private static final sFeatures:Ljava/util/HashSet;\n\n",
+        f".field private static final sDecisionsOn:{decisions}\n\n",
+        f".field private static final sDecisionsOff:{decisions}\n\n\n",
+        "# direct methods\n",
+        ".method static constructor <clinit>()V\n",
+        "    .registers 2\n\n",
+        "    new-instance v0, Ljava/util/HashSet;\n\n",
+        "    invoke-direct {v0}, Ljava/util/HashSet;-><init>()V\n\n",
+    ]
+    for getter in FEATURE_GETTERS:
+        lines += [
+            f"    invoke-static {{}}, {utils}->{getter}()[Ljava/lang/String;\n\n",
+            "    move-result-object v1\n\n",
+            "    invoke-static {v1}, Ljava/util/Arrays;->asList([Ljava/lang/Object;)Ljava/util/List;\n\n",
+            "    move-result-object v1\n\n",
+            "    invoke-virtual {v0, v1}, Ljava/util/HashSet;->addAll(Ljava/util/Collection;)Z\n\n",
+        ]
+    lines.append(f"    sput-object v0, {cls}->sFeatures:Ljava/util/HashSet;\n\n")
+    for field in ("sDecisionsOn", "sDecisionsOff"):
+        lines += [
+            f"    new-instance v0, {decisions}\n\n",
+            f"    invoke-direct {{v0}}, {decisions}-><init>()V\n\n",
+            f"    sput-object v0, {cls}->{field}:{decisions}\n\n",
+        ]
+    lines += [
+        "    return-void\n",
+        ".end method\n\n",
+        # p0 tên feature, p1 version, p2 kết quả gốc của framework
+        ".method public static hasSystemFeature(Ljava/lang/String;IZ)Z\n",
+        "    .registers 6\n\n",
+        "    if-eqz p0, :cond_unlisted\n\n",
+        f"    sget-object v0, {cls}->sFeatures:Ljava/util/HashSet;\n\n",
+        "    invoke-virtual {v0, p0}, Ljava/util/HashSet;->contains(Ljava/lang/Object;)Z\n\n",
+        "    move-result v0\n\n",
+        "    if-nez v0, :cond_listed\n\n",
+        "    :cond_unlisted\n",
+        "    return p2\n\n",
+        "    :cond_listed\n",
+        "    if-eqz p2, :cond_off\n\n",
+        f"    sget-object v0, {cls}->sDecisionsOn:{decisions}\n\n",
+        "    goto :goto_lookup\n\n",
+        "    :cond_off\n",
+        f"    sget-object v0, {cls}->sDecisionsOff:{decisions}\n\n",
+        "    :goto_lookup\n",
+        f"    invoke-virtual {{v0, p0}}, {decisions}->get(Ljava/lang/Object;)Ljava/lang/Object;\n\n",
+        "    move-result-object v1\n\n",
+        "    if-eqz v1, :cond_decide\n\n",
+        "    check-cast v1, Ljava/lang/Boolean;\n\n",
+        "    invoke-virtual {v1}, Ljava/lang/Boolean;->booleanValue()Z\n\n",
+        "    move-result v1\n\n",
+        "    return v1\n\n",
+        "    :cond_decide\n",
+        f"    invoke-static {{p0, p1, p2}}, {toolbox}->KaoriosFeaturesV1(Ljava/lang/String;IZ)Z\n\n",
+        "    move-result v1\n\n",
+        # Trước khi boot xong Settings chưa đọc được: không nhớ quyết định dựa trên toggle mặc định
+        f"    invoke-static {{}}, {settings}->isBootCompleted()Z\n\n",
+        "    move-result v2\n\n",
+        "    if-eqz v2, :cond_done\n\n",
+        "    invoke-static {v1}, Ljava/lang/Boolean;->valueOf(Z)Ljava/lang/Boolean;\n\n",
+        "    move-result-object v2\n\n",
+        f"    invoke-virtual {{v0, p0, v2}}, {decisions}->put(Ljava/lang/Object;Ljava/lang/Object;)Ljava/lang/Object;\n\n",
+        "    :cond_done\n",
+        "    return v1\n",
+        ".end method\n\n",
+        ".method public static invalidate()V\n",
+        "    .registers 1\n\n",
+    ]
+    for field in ("sDecisionsOn", "sDecisionsOff"):
+        lines += [
+            f"    sget-object v0, {cls}->{field}:{decisions}\n\n",
+            f"    invoke-virtual {{v0}}, {decisions}->clear()V\n\n",
+        ]
+    lines += [
+        "    return-void\n",
+        ".end method\n",
+    ]
+    return "".join(lines)
+
+def copy_kaorios_folder(base=CURRENT_DIR):
+    source = KAORIOS_SOURCE
+    target = base / KAORIOS_TARGET
     
     if not source.exists():
         log(f"Không tìm thấy thư mục nguồn {source.name}", "WARN")
         return False
     
     try:
+        mark_dirty(target)
         if target.exists():
             shutil.rmtree(target)
         target.parent.mkdir(parents=True, exist_ok=True)
         shutil.copytree(source, target)
+        if feature_cache_enabled():
+            (target / "KaoriFeatureCache.smali").write_text(feature_cache_smali(), encoding="utf-8")
         return True
     except Exception as e:
-        log(f"Lỗi copy kaorios: {e}", "ERROR")
+        log(f"Lỗi copy kaorios: {e}", "ERROR", file=str(source))
         return False
 
-def modify_application_package_manager_kaori(file_path: Path) -> bool:
+def modify_application_package_manager_kaori(file_path: Path, memoized=False) -> bool:
     try:
         lines = file_path.read_text(encoding="utf-8", errors="ignore").splitlines(True)
         new_lines = []
@@ -39,6 +156,8 @@ def modify_application_package_manager_kaori(file_path: Path) -> bool:
             "method1_replaced": False,
             "method2_modified": False,
         }
+        if memoized:
+            modifications["invalidate_hooked"] = False
 
         i = 0
         while i < len(lines):
@@ -105,9 +224,34 @@ def modify_application_package_manager_kaori(file_path: Path) -> bool:
             if stripped.startswith(".method") and "hasSystemFeature(Ljava/lang/String;I)Z" in stripped and not modifications["method2_modified"]:
                 new_lines.append(line)
                 i += 1
+                saved = None
                 while i < len(lines) and not lines[i].strip().startswith(".end method"):
                     current_line = lines[i]
                     current_stripped = current_line.strip()
+                    if memoized:
+                        # Thêm 3 register local sau các local cũ: giữ name/version từ đầu method (code gốc có thể
+                        # ghi đè p1/p2), register thứ ba nhận kết quả gốc để gọi dạng range
+                        registers = REGISTERS_RE.match(current_line)
+                        returned = RETURN_RE.match(current_line)
+                        if registers and saved is None:
+                            indent, kind, count = registers[1], registers[2], int(registers[3])
+                            saved = count - FEATURE_HOOK_INS if kind == "registers" else count
+                            new_lines.append(f"{indent}.{kind} {count + FEATURE_HOOK_REGISTERS}\n\n")
+                            new_lines.append(f"{indent}move-object/from16 v{saved}, p1\n\n")
+                            new_lines.append(f"{indent}move/from16 v{saved + 1}, p2\n")
+                            i += 1
+                            continue
+                        if returned and saved is not None:
+                            indent, register = returned[1], returned[2]
+                            new_lines.append(
+                                f"{indent}move/from16 v{saved + 2}, {register}\n\n"
+                                f"{indent}invoke-static/range {{v{saved} .. v{saved + 2}}}, "
+                                f"{FEATURE_CACHE_CLASS}->hasSystemFeature(Ljava/lang/String;IZ)Z\n\n"
+                                f"{indent}move-result {register}\n\n"
+                            )
+                        new_lines.append(current_line)
+                        i += 1
+                        continue
                     if current_stripped.startswith(".registers"):
                         new_lines.append("    .registers 12\n")
                         i += 1
@@ -140,15 +284,30 @@ def modify_application_package_manager_kaori(file_path: Path) -> bool:
                 modifications["method2_modified"] = True
                 continue
 
+            # 5. Biến thể có cache: invalidate cùng lúc với cache hasSystemFeature của framework
+            if memoized and stripped.startswith(".method") and "invalidateHasSystemFeatureCache()V" in stripped \
+                    and not modifications["invalidate_hooked"]:
+                new_lines.append(line)
+                i += 1
+                while i < len(lines) and not lines[i].strip().startswith((".registers", ".locals")):
+                    new_lines.append(lines[i])
+                    i += 1
+                if i < len(lines):
+                    new_lines.append(lines[i])
+                    new_lines.append(f"\n    invoke-static {{}}, {FEATURE_CACHE_CLASS}->invalidate()V\n")
+                    i += 1
+                modifications["invalidate_hooked"] = True
+                continue
+
             new_lines.append(line)
             i += 1
 
         if any(modifications.values()):
-            file_path.write_text("".join(new_lines), encoding="utf-8")
+            write_patched(file_path, "".join(new_lines))
             return True
         return False
     except Exception as exc:
-        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR")
+        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path), method="hasSystemFeature")
         return False
 
 def modify_instrumentation_kaori(file_path: Path) -> bool:
@@ -189,11 +348,11 @@ def modify_instrumentation_kaori(file_path: Path) -> bool:
             new_lines.append(line)
 
         if method1_patched or method2_patched:
-            file_path.write_text("".join(new_lines), encoding="utf-8")
+            write_patched(file_path, "".join(new_lines))
             return True
         return False
     except Exception as exc:
-        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR")
+        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path), method="newApplication")
         return False
 
 def modify_keystore2_kaori(file_path: Path) -> bool:
@@ -221,11 +380,11 @@ def modify_keystore2_kaori(file_path: Path) -> bool:
             new_lines.append(line)
 
         if patched:
-            file_path.write_text("".join(new_lines), encoding="utf-8")
+            write_patched(file_path, "".join(new_lines))
             return True
         return False
     except Exception as exc:
-        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR")
+        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path), method="getKeyEntry")
         return False
 
 def modify_android_keystore_spi_kaori(file_path: Path) -> bool:
@@ -254,61 +413,102 @@ def modify_android_keystore_spi_kaori(file_path: Path) -> bool:
             new_lines.append(line)
 
         if patched:
-            file_path.write_text("".join(new_lines), encoding="utf-8")
+            write_patched(file_path, "".join(new_lines))
             return True
         return False
     except Exception as exc:
-        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR")
+        log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path), method="engineGetCertificateChain")
         return False
 
-def main():
+def modify_application_package_manager_kaori_cached(file_path: Path) -> bool:
+    """
+    Biến thể KAORI_FEATURE_CACHE=1; tên riêng để plan cache không lẫn với bản thường, còn patch manifest
+    ghi chung họ với bản thường: đổi KAORI_FEATURE_CACHE trên thư mục đã vá không vá chồng hook thứ hai.
+    """
+    return modify_application_package_manager_kaori(file_path, memoized=True)
 
-    if os.getenv("ENABLE_MOD") == "false":
-        log("SKIP: Kaori Features (User disabled)", "WARN")
-        return
+setattr(modify_application_package_manager_kaori_cached, PATCH_FAMILY_ATTR,
+        modify_application_package_manager_kaori.__name__)
 
-    log("Bắt đầu Kaori Mod...", "PROCESS")
-    
-    
-    if copy_kaorios_folder():
+# (class, dex mặc định, patcher); dex thực tế do plans.locate tìm theo ROM
+PATCH_TARGETS = [
+    ("Landroid/app/ApplicationPackageManager;", "smali_classes", modify_application_package_manager_kaori),
+    ("Landroid/app/Instrumentation;", "smali_classes", modify_instrumentation_kaori),
+    ("Landroid/security/KeyStore2;", "smali_classes3", modify_keystore2_kaori),
+    ("Landroid/security/keystore2/AndroidKeyStoreSpi;", "smali_classes3", modify_android_keystore_spi_kaori),
+]
+
+def patch_targets() -> list:
+    """PATCH_TARGETS với patcher ApplicationPackageManager theo biến thể đang bật."""
+    if not feature_cache_enabled():
+        return PATCH_TARGETS
+    return [(descriptor, default_dex,
+             modify_application_package_manager_kaori_cached if func is modify_application_package_manager_kaori else func)
+            for descriptor, default_dex, func in PATCH_TARGETS]
+
+def shrink_kaorios(base=CURRENT_DIR, patched_files=None):
+    """
+    Bỏ class/method kaorios không với tới được từ các file đã vá (mặc định: các class trong PATCH_TARGETS).
+    Patch thất bại hay bị bỏ qua thì entry point của nó không còn trong file nên phần payload tương ứng bị bỏ.
+    """
+    if not shrink.enabled():
+        return None
+    if patched_files is None:
+        fw_base = base / "framework_unpacked"
+        plans = patchplan.PatchPlans()
+        located = [plans.locate(fw_base, descriptor, default_dex) for descriptor, default_dex, _ in PATCH_TARGETS]
+        patched_files = [path for path in located if path]
+    return shrink.shrink(base / KAORIOS_TARGET, patched_files)
+
+def patch_kaori(base=CURRENT_DIR) -> int:
+    with stage("kaori"):
+        return _patch_kaori(base)
+
+def _patch_kaori(base) -> int:
+    with span("copy_kaorios_folder", "patch"):
+        copied = copy_kaorios_folder(base)
+    if copied:
         log("Đã copy thư mục kaorios", "SUCCESS")
-    
-    
-    
-    fw_base = CURRENT_DIR / "framework_unpacked"
-    
-    targets = [
-        (
-            fw_base / "smali_classes" / "android" / "app" / "ApplicationPackageManager.smali",
-            modify_application_package_manager_kaori
-        ),
-        (
-            fw_base / "smali_classes" / "android" / "app" / "Instrumentation.smali",
-            modify_instrumentation_kaori
-        ),
-        (
-            fw_base / "smali_classes3" / "android" / "security" / "KeyStore2.smali",
-            modify_keystore2_kaori
-        ),
-        (
-            fw_base / "smali_classes3" / "android" / "security" / "keystore2" / "AndroidKeyStoreSpi.smali",
-            modify_android_keystore_spi_kaori
-        )
-    ]
+
+    fw_base = base / "framework_unpacked"
 
     count = 0
-    for file_path, func in targets:
-        if file_path.exists():
-            if func(file_path):
+    located = []
+    plans = patchplan.PatchPlans()
+    manifest = PatchManifest(fw_base)
+    for descriptor, default_dex, func in patch_targets():
+        file_path = plans.locate(fw_base, descriptor, default_dex)
+        if file_path:
+            located.append(file_path)
+            patched = apply_once(manifest, file_path, func, plans)
+            if patched is None:
+                log(f"Đã patch từ trước: {file_path.name}", "INFO")
+            elif patched:
                 log(f"Đã patch: {file_path.name}", "SUCCESS")
                 count += 1
             else:
                 log(f"Patch thất bại hoặc không cần thiết: {file_path.name}", "INFO")
         else:
-            log(f"Bỏ qua (Không tìm thấy): {file_path.name}", "WARN")
+            log(f"Bỏ qua (Không tìm thấy): {descriptor}", "WARN")
+    manifest.save()
+    plans.report()
+    if copied:
+        shrink_kaorios(base, located)
+    return count
+
+def main():
+
+    if os.getenv("ENABLE_MOD") == "false":
+        log("SKIP: Kaori Features (User disabled)", "WARN")
+        return
+    reason = fingerprint.skip_reason("kaori")
+    if reason:
+        log(f"SKIP: Kaori Features ({reason})", "WARN")
+        return
 
+    log("Bắt đầu Kaori Mod...", "PROCESS")
+    count = patch_kaori()
     log(f"Patch successfully ({count} file đã sửa).", "SUCCESS")
 
 if __name__ == "__main__":
     main()
-              
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+# multidex.py
+#
+# Dự đoán số method/field/type id của từng dex trước khi assemble để không đợi smali báo tràn 65536.
+# Số id = số trong header dex gốc + tham chiếu trong các file smali bị patch/thêm mà pool gốc chưa có
+# (tra trực tiếp trên bảng id của dex gốc qua dexfile, không decompile). Tham chiếu bị patch xoá không
+# được trừ nên con số là cận trên.
+# Dex dự đoán tràn: chuyển payload (thư mục được chép nguyên cụm như kaorios) rồi tới class lá
+# (class do patch thêm, không có trong dex gốc) sang dex khác đang được assemble còn chỗ, không có thì
+# tạo smali_classesN mới. Class gốc của ROM không bị di chuyển. Quyết định ghi vào run report
+# (kaori_run.json, mục "multidex").
+#   python multidex.py [jar ...]     chỉ dự đoán, không di chuyển file
+#   KAORI_MULTIDEX=0                 tắt
+#   KAORI_DEX_LIMIT=N                giới hạn id mỗi dex (mặc định 65536)
+
+import argparse
+import os
+import re
+import sys
+from contextlib import ExitStack
+from pathlib import Path
+
+import dexdiff
+import fingerprint
+from pristine import mark_dirty
+from profiling import span
+from utils import CURRENT_DIR, TARGET_JARS, UNPACK_DIRS, jar_arg, log
+
+DEX_ID_LIMIT = 65536
+KINDS = ("methods", "fields", "types")
+
+METHOD_REF_RE = re.compile(r"(L[^;\s]+;|\[[^\s,]+?)->([^\s(]+)(\([^)\s]*\)\S+)")
+FIELD_REF_RE = re.compile(r"(L[^;\s]+;)->([^\s(:]+):(\S+)")
+TYPE_RE = re.compile(r"\[*L[^;\s(]+;|\[+[ZBSCIJFD]")
+
+def enabled() -> bool:
+    return os.getenv("KAORI_MULTIDEX", "1") != "0"
+
+def limit() -> int:
+    return int(os.getenv("KAORI_DEX_LIMIT", DEX_ID_LIMIT))
+
+def dex_order(stem: str) -> int:
+    return int(stem[len("classes"):] or 1)
+
+def scan_refs(text: str) -> dict:
+    """{"methods": {(class, name, proto)}, "fields": {(class, name, type)}, "types": {descriptor}}"""
+    refs = {kind: set() for kind in KINDS}
+    owner = None
+    for line in text.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("#"):
+            continue
+        if stripped.startswith(".class"):
+            owner = stripped.split()[-1]
+        elif stripped.startswith(".method") and owner:
+            signature = stripped.split()[-1]
+            name, _, proto = signature.partition("(")
+            refs["methods"].add((owner, name, "(" + proto))
+        elif stripped.startswith(".field") and owner:
+            declaration = stripped.split(" = ", 1)[0].split()[-1]
+            name, _, field_type = declaration.partition(":")
+            refs["fields"].add((owner, name, field_type))
+        for match in METHOD_REF_RE.finditer(stripped):
+            refs["methods"].add(match.groups())
+        for match in FIELD_REF_RE.finditer(stripped):
+            refs["fields"].add(match.groups())
+        refs["types"].update(TYPE_RE.findall(stripped))
+    return refs
+
+class DexPools:
+    """Bảng id của dex gốc: base = số id sẵn có, missing() lọc tham chiếu chưa có trong pool."""
+
+    def __init__(self, dex=None):
+        self.dex = dex
+        self.base = {kind: getattr(dex, f"{kind[:-1]}_ids_size") if dex else 0 for kind in KINDS}
+        self._known = {kind: {} for kind in KINDS}
+
+    def _has(self, kind, ref) -> bool:
+        if self.dex is None:
+            return False
+        if kind == "types":
+            return self.dex.find_type(ref) is not None
+        if kind == "methods":
+            return self.dex.has_method(*ref)
+        return self.dex.has_field(*ref)
+
+    def missing(self, refs: dict) -> dict:
+        result = {}
+        for kind in KINDS:
+            known = self._known[kind]
+            for ref in refs[kind]:
+                if ref not in known:
+                    known[ref] = self._has(kind, ref)
+            result[kind] = {ref for ref in refs[kind] if not known[ref]}
+        return result
+
+    def has_class(self, descriptor: str) -> bool:
+        return self.dex is not None and self.dex.has_class(descriptor)
+
+class Planner:
+    """Kế hoạch cho một *_unpacked: đếm id từng dex, chọn class cần chuyển khi tràn."""
+
+    def __init__(self, base: Path, jar_name: str):
+        self.base = base
+        self.jar_name = jar_name
+        self.root = base / UNPACK_DIRS[jar_name]
+        self.limit = limit()
+        self.dexes = {}       # stem -> DexPools
+        self.unreadable = {}  # stem -> lỗi
+        self.files = {}       # stem -> {rel trong smali_classesN: refs}
+        self.units = {}       # stem -> [(tên, [rel])] các nhóm class được phép chuyển
+        self.moves = []
+        self._pending = []    # (dex nguồn, dex đích, [rel])
+
+    # ---------------------------------------------------------------- thu thập
+    def collect(self, sources: dict):
+        """sources: {stem: DexFile hoặc None} của các dex gốc đã mở."""
+        stems = {p.stem for p in self.root.glob("classes*.dex")}
+        stems |= {p.name[len("smali_"):] for p in self.root.glob("smali_classes*") if p.is_dir()}
+        for stem in stems:
+            self.dexes[stem] = DexPools(sources.get(stem))
+
+        for rel in dexdiff.touched_paths(self.base, self.jar_name):
+            smali_name, _, inner = rel.partition("/")
+            if not smali_name.startswith("smali_classes") or not inner:
+                continue
+            stem = smali_name[len("smali_"):]
+            path = self.root / rel
+            if path.is_dir():
+                group = [p.relative_to(self.root / smali_name).as_posix() for p in sorted(path.rglob("*.smali"))]
+                self._add_unit(stem, inner, group, payload=True)
+            elif path.is_file() and path.suffix == ".smali":
+                self._add_unit(stem, inner, [inner], payload=False)
+
+    def _add_unit(self, stem, name, rels, payload):
+        files = self.files.setdefault(stem, {})
+        new_rels = []
+        for rel in rels:
+            if rel in files:
+                continue
+            path = self.root / f"smali_{stem}" / rel
+            files[rel] = scan_refs(path.read_text(encoding="utf-8", errors="ignore"))
+            if not self.dexes.setdefault(stem, DexPools()).has_class(f"L{rel[:-len('.smali')]};"):
+                new_rels.append(rel)
+        if not new_rels:
+            return
+        units = self.units.setdefault(stem, [])
+        if payload:
+            units.insert(0, (name, new_rels))
+            return
+        # Class lồng đi cùng class ngoài
+        outer = new_rels[0].split("$", 1)[0].removesuffix(".smali")
+        for index, (unit_name, unit_rels) in enumerate(units):
+            if unit_name.split("$", 1)[0].removesuffix(".smali") == outer:
+                units[index] = (unit_name, unit_rels + new_rels)
+                return
+        units.append((name, new_rels))
+
+    # ------------------------------------------------------------------- đếm
+    def _refs(self, rels, stem) -> dict:
+        merged = {kind: set() for kind in KINDS}
+        for rel in rels:
+            for kind in KINDS:
+                merged[kind] |= self.files[stem][rel][kind] if rel in self.files.get(stem, {}) else set()
+        return merged
+
+    def counts(self, stem, extra=None) -> dict:
+        """Số id dự đoán của dex (cộng thêm tham chiếu `extra` nếu có)."""
+        pools = self.dexes[stem]
+        refs = self._refs(self.files.get(stem, {}), stem)
+        for kind in KINDS:
+            refs[kind] |= (extra or {}).get(kind, set())
+        missing = pools.missing(refs)
+        return {kind: pools.base[kind] + len(missing[kind]) for kind in KINDS}
+
+    def over(self, counts) -> list:
+        return [kind for kind in KINDS if counts[kind] > self.limit]
+
+    # ----------------------------------------------------------------- kế hoạch
+    def _targets(self, source):
+        """Dex nhận class: dex đã/ sẽ được assemble (có smali_classesN, đọc được bản gốc), rồi dex mới."""
+        stems = sorted(self.dexes, key=dex_order)
+        planned = {target for _, target, _ in self._pending}
+        ready = [s for s in stems if s != source and s not in self.unreadable
+                 and ((self.root / f"smali_{s}").is_dir() or s in planned)]
+        fresh = f"classes{max(dex_order(s) for s in stems) + 1}"
+        return ready + ([] if fresh in ready else [fresh])
+
+    def plan(self) -> bool:
+        """Lập danh sách moves cho mọi dex dự đoán tràn. False nếu không thể đưa về dưới giới hạn."""
+        ok = True
+        for stem in sorted(self.files, key=dex_order):
+            if stem in self.unreadable:
+                continue
+            counts = self.counts(stem)
+            units = list(self.units.get(stem, []))
+            while self.over(counts) and units:
+                name, rels = units.pop(0)
+                refs = self._refs(rels, stem)
+                target = self._choose(stem, name, rels, refs)
+                if target is None:
+                    continue
+                self._move_files(stem, target, rels)
+                after = self.counts(stem)
+                self.moves.append({"unit": name, "classes": len(rels), "from": f"{stem}.dex",
+                                   "to": f"{target}.dex", "before": counts, "after": after,
+                                   "target": self.counts(target)})
+                counts = after
+            if self.over(counts):
+                ok = False
+                log(f"{self.jar_name}/{stem}.dex dự đoán tràn {', '.join(self.over(counts))} "
+                    f"({counts}) và không còn class nào chuyển được", "ERROR", dex=f"{stem}.dex")
+        return ok
+
+    def _choose(self, source, name, rels, refs):
+        for target in self._targets(source):
+            pools = self.dexes.setdefault(target, DexPools())
+            if any(pools.has_class(f"L{rel[:-len('.smali')]};") for rel in rels):
+                continue
+            if not self.over(self.counts(target, refs)):
+                return target
+        log(f"{self.jar_name}: không có dex nào đủ chỗ cho {name}", "WARN")
+        return None
+
+    def _move_files(self, source, target, rels):
+        # Chỉ đổi sổ sách; apply() mới chuyển file thật
+        files = self.files[source]
+        moved = self.files.setdefault(target, {})
+        for rel in rels:
+            moved[rel] = files.pop(rel)
+        self._pending.append((source, target, rels))
+
+    def apply(self):
+        for (source, target, rels), move in zip(self._pending, self.moves):
+            for rel in rels:
+                src = self.root / f"smali_{source}" / rel
+                dst = self.root / f"smali_{target}" / rel
+                mark_dirty(src)
+                mark_dirty(dst)
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(src, dst)
+                parent = src.parent
+                while parent != self.root / f"smali_{source}" and not any(parent.iterdir()):
+                    parent.rmdir()
+                    parent = parent.parent
+            log(f"{self.jar_name}: chuyển {move['unit']} ({move['classes']} class) "
+                f"{move['from']} -> {move['to']}", "SUCCESS")
+
+    def report(self) -> dict:
+        return {
+            "limit": self.limit,
+            "dex": {f"{stem}.dex": self.counts(stem) for stem in sorted(self.dexes, key=dex_order)
+                    if stem not in self.unreadable and (stem in self.files or (self.root / f"smali_{stem}").is_dir())},
+            "unreadable": {f"{stem}.dex": error for stem, error in self.unreadable.items()},
+            "moves": self.moves,
+        }
+
+def plan_jar(base: Path, jar_name: str, apply=True):
+    """
+    Dự đoán và (nếu apply) cân bằng lại dex của một jar trước khi assemble.
+    Trả về (ok, các thư mục smali_classesN có class chuyển đi/đến).
+    """
+    planner = Planner(base, jar_name)
+    if not planner.root.is_dir():
+        return True, set()
+    stems = sorted({p.stem for p in planner.root.glob("classes*.dex")}, key=dex_order)
+    with span(f"multidex {jar_name}", "plan") as sp, ExitStack() as stack:
+        sources = {}
+        for stem in stems:
+            source = dexdiff.original_source(base, jar_name, f"{stem}.dex")
+            try:
+                sources[stem] = stack.enter_context(dexdiff.open_source(source))
+            except (OSError, ValueError, dexdiff.DexError) as exc:
+                planner.unreadable[stem] = str(exc)
+        planner.collect(sources)
+        if not planner.files:
+            return True, set()
+        ok = planner.plan()
+        result = planner.report()
+        sp.set(moves=len(planner.moves))
+    if apply:
+        planner.apply()
+    for name, counts in result["dex"].items():
+        log(f"{jar_name}/{name}: {counts['methods']} method, {counts['fields']} field, {counts['types']} type "
+            f"(giới hạn {planner.limit})", "INFO")
+    fingerprint.record("multidex", result, base, key=jar_name)
+    return ok, {f"smali_{stem}" for source, target, _ in planner._pending for stem in (source, target)}
+
+def main():
+    parser = argparse.ArgumentParser(description="Dự đoán số id mỗi dex trước khi assemble (không di chuyển file)")
+    parser.add_argument("jars", nargs="*", type=jar_arg, metavar="JAR",
+                        help=f"Jar cần dự đoán ({', '.join(TARGET_JARS)}; mặc định: tất cả)")
+    args = parser.parse_args()
+    ok = True
+    for jar_name in args.jars or TARGET_JARS:
+        ok = plan_jar(CURRENT_DIR, jar_name, apply=False)[0] and ok
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+# patchlog.py
+#
+# Ghi nhận patch đã áp dụng trong mỗi thư mục *_unpacked (<unpack_dir>/.kaori/patches.json)
+# để chạy lại bootloop/apk/kaori không vá chồng lên file đã vá.
+# Mỗi file lưu size + mtime_ns + sha256 sau khi vá: nếu stat khớp thì bỏ qua ngay (không đọc file),
+# stat lệch thì so hash; nội dung khác (unpack lại, sửa tay) thì bản ghi bị xoá và patch chạy lại.
+# Các biến thể của cùng một patch (vd. hook ApplicationPackageManager thường/có cache) khai báo chung
+# PATCH_FAMILY_ATTR: manifest ghi theo họ patch, đổi biến thể trên cùng thư mục unpack không vá chồng.
+
+import functools
+import inspect
+import json
+import os
+import types
+from pathlib import Path, PurePath
+from cache import hash_bytes, hash_file
+from profiling import span
+from utils import META_DIR, log
+
+MANIFEST_NAME = "patches.json"
+PATCH_FAMILY_ATTR = "patch_family"
+
+# Giá trị global được tính vào version khi patcher tham chiếu tới (hằng số của module)
+CONSTANT_TYPES = (str, bytes, int, float, bool, tuple, list, dict, set, frozenset, PurePath)
+
+def _referenced_names(code) -> set:
+    """Tên global mà code (kể cả lambda/hàm lồng bên trong) có thể đọc."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _referenced_names(const)
+    return names
+
+def _stable(value) -> str:
+    return json.dumps(value, sort_keys=True,
+                      default=lambda v: sorted(v, key=repr) if isinstance(v, (set, frozenset)) else repr(v))
+
+def patch_name(func) -> str:
+    """Khoá của patch trong manifest: họ patch nếu patcher khai báo, ngược lại tên hàm."""
+    return getattr(func, PATCH_FAMILY_ATTR, func.__name__)
+
+@functools.lru_cache(maxsize=None)
+def patch_version(func) -> str:
+    """
+    Fingerprint của patcher theo mã nguồn, để biết patch đã đổi kể từ lần áp dụng trước.
+    Tính cả các hàm cùng module mà patcher gọi tới (bắc cầu) và các hằng số module nó đọc:
+    wrapper một dòng như modify_application_package_manager_kaori_cached đổi version khi
+    khối hook hay FEATURE_* đổi.
+    """
+    parts = []
+    seen = set()
+    stack = [func]
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            parts.append(inspect.getsource(current))
+        except (OSError, TypeError):
+            parts.append(current.__qualname__)
+        code = getattr(current, "__code__", None)
+        if code is None:
+            continue
+        for name in sorted(_referenced_names(code)):
+            value = current.__globals__.get(name)
+            if inspect.isfunction(value) and value.__module__ == current.__module__:
+                stack.append(value)
+            elif isinstance(value, CONSTANT_TYPES):
+                parts.append(f"{name}={_stable(value)}")
+    return hash_bytes("\n".join(parts).encode("utf-8"))[:16]
+
+class PatchManifest:
+    def __init__(self, unpack_root: Path):
+        self.root = unpack_root
+        self.path = unpack_root / META_DIR / MANIFEST_NAME
+        self.dirty = False
+        try:
+            self.entries = json.loads(self.path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def key(self, file_path: Path) -> str:
+        return file_path.relative_to(self.root).as_posix()
+
+    def recorded(self, file_path: Path, patch: str):
+        """Version của `patch` đã áp dụng cho file, hoặc None nếu chưa (hoặc file đã đổi)."""
+        key = self.key(file_path)
+        entry = self.entries.get(key)
+        if not entry or patch not in entry["patches"]:
+            return None
+        st = file_path.stat()
+        if st.st_size == entry["size"] and st.st_mtime_ns == entry["mtime_ns"]:
+            return entry["patches"][patch]
+        if st.st_size == entry["size"] and hash_file(file_path) == entry["sha256"]:
+            entry["mtime_ns"] = st.st_mtime_ns
+            self.dirty = True
+            return entry["patches"][patch]
+        del self.entries[key]
+        self.dirty = True
+        return None
+
+    def record(self, file_path: Path, patch: str, version: str):
+        st = file_path.stat()
+        entry = self.entries.setdefault(self.key(file_path), {"patches": {}})
+        entry.update(size=st.st_size, mtime_ns=st.st_mtime_ns, sha256=hash_file(file_path))
+        entry["patches"][patch] = version
+        self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(self.entries, indent=1, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self.dirty = False
+
+def apply_once(manifest: PatchManifest, file_path: Path, func, runner=None):
+    """
+    Chạy func(file_path) nếu patch chưa được áp dụng cho file.
+    runner(file_path, func) thay cho lời gọi trực tiếp (vd. patchplan.PatchPlans).
+    Trả về None khi bỏ qua, ngược lại là kết quả của func.
+    """
+    name = patch_name(func)
+    version = patch_version(func)
+    recorded = manifest.recorded(file_path, name)
+    if recorded is not None:
+        if recorded != version:
+            log(f"{file_path.name}: {name} đã thay đổi từ lần vá trước, cần unpack lại để áp bản mới",
+                "WARN", file=str(file_path))
+        return None
+
+    with span(name, "patch", file=manifest.key(file_path), bytes=file_path.stat().st_size):
+        changed = runner(file_path, func) if runner else func(file_path)
+    # Chỉ ghi nhận khi file thực sự được vá: False có thể là lỗi, lần sau cần thử lại
+    if changed:
+        manifest.record(file_path, name, version)
+    return changed
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+# patchplan.py
+#
+# Plan vá dùng lại giữa các bản ROM. File smali được chia thành đoạn: từng method
+# (.method ... .end method, khoá theo dòng .method) và phần nằm giữa các method.
+# Sau khi patcher chạy đầy đủ, plan ghi lại dex chứa class, các đoạn bị sửa (hash trước khi vá,
+# nội dung sau khi vá, các dòng neo như mHasSystemFeatureCache / return-object v0) và đoạn được thêm.
+# ROM mới có đúng các đoạn đó cùng hash thì ghép thẳng nội dung đã vá; đoạn nào khác thì patcher
+# chạy lại trên file (patcher làm việc theo file) và plan mới được lưu thêm.
+# Cache: .kaori_cache/patchplan/<hash(patcher, version, hash module của patcher, class)>.json
+# Method bị sửa (do patcher hay do plan) đều qua smalicheck trước khi được giữ lại.
+
+import difflib
+import functools
+import inspect
+import json
+import os
+import time
+from pathlib import Path
+
+import fingerprint
+import smalicheck
+from cache import hash_bytes
+from patchlog import patch_version
+from pristine import write_patched
+from smali_store import descriptor_to_path, ensure, find_class
+from utils import CACHE_DIR, UNPACK_DIRS, ensure_dir, log
+
+MAX_PLANS = 8
+
+@functools.lru_cache(maxsize=None)
+def module_version(func) -> str:
+    """
+    Hash mã nguồn cả module chứa patcher: plan sống lâu trong .kaori_cache và dùng lại giữa các ROM,
+    nên sửa helper hay hằng số mà patcher dùng cũng phải làm plan cũ hết hiệu lực.
+    """
+    module = inspect.getmodule(func)
+    try:
+        source = inspect.getsource(module)
+    except (OSError, TypeError):
+        return patch_version(func)
+    return hash_bytes(source.encode("utf-8"))[:16]
+
+def split_segments(text: str) -> list:
+    """[(key, text)] theo thứ tự trong file; ghép lại các text cho đúng file ban đầu."""
+    segments = []
+    seen = {}
+    prev = "^"
+    buf = []
+    key = None
+
+    def push(name):
+        seen[name] = seen.get(name, 0) + 1
+        segments.append((name if seen[name] == 1 else f"{name}#{seen[name]}", "".join(buf)))
+
+    for line in text.splitlines(True):
+        stripped = line.strip()
+        if key is None and stripped.startswith(".method"):
+            if buf:
+                push(f"gap:{prev}")
+            buf = [line]
+            key = stripped
+            continue
+        buf.append(line)
+        if key is not None and stripped == ".end method":
+            push(key)
+            prev = segments[-1][0]
+            buf = []
+            key = None
+    if buf:
+        push(key if key is not None else f"gap:{prev}")
+    return segments
+
+def segment_hash(text: str) -> str:
+    return hash_bytes(text.encode("utf-8"))[:24]
+
+def _anchors(before: str, after: str) -> list:
+    """Dòng gốc (không rỗng) liền kề chỗ patch chèn/sửa."""
+    old = before.splitlines()
+    anchors = []
+    matcher = difflib.SequenceMatcher(None, old, after.splitlines(), autojunk=False)
+    for tag, i1, i2, _, _ in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        near = [line.strip() for line in old[max(0, i1 - 2):i2 + 1] if line.strip()]
+        anchors += [line for line in near if line not in anchors and not line.startswith(".method")]
+    return anchors[:8]
+
+def make_plan(before: list, after: list, dex: str) -> dict:
+    old = dict(before)
+    after_keys = {key for key, _ in after}
+    edits = {
+        key: {"before": segment_hash(old[key]), "after": text, "anchors": _anchors(old[key], text)}
+        for key, text in after if key in old and old[key] != text
+    }
+    removed = {key: segment_hash(text) for key, text in before if key not in after_keys}
+    added = []
+    anchor = "^"
+    for key, text in after:
+        if key in old:
+            anchor = key
+        else:
+            added.append({"anchor": anchor, "key": key, "text": text})
+    return {"dex": dex, "edits": edits, "removed": removed, "added": added,
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+def replay(plan: dict, segments: list):
+    """Nội dung file sau khi áp plan, hoặc None nếu có đoạn không khớp hash/neo."""
+    current = dict(segments)
+    for key, edit in plan["edits"].items():
+        if key not in current or segment_hash(current[key]) != edit["before"]:
+            return None
+    for key, digest in plan["removed"].items():
+        if key not in current or segment_hash(current[key]) != digest:
+            return None
+    inserts = {}
+    for item in plan["added"]:
+        if item["key"] in current or (item["anchor"] != "^" and item["anchor"] not in current):
+            return None
+        inserts.setdefault(item["anchor"], []).append(item["text"])
+
+    out = list(inserts.get("^", []))
+    for key, text in segments:
+        if key in plan["removed"]:
+            continue
+        out.append(plan["edits"][key]["after"] if key in plan["edits"] else text)
+        out += inserts.get(key, [])
+    return "".join(out)
+
+def class_location(file_path: Path):
+    """(descriptor, thư mục smali_classesN) của một file smali."""
+    for smali_dir in file_path.parents:
+        if smali_dir.name.startswith("smali_classes"):
+            rel = file_path.relative_to(smali_dir).with_suffix("").as_posix()
+            return f"L{rel};", smali_dir.name
+    return None, None
+
+class PatchPlans:
+    """Cache plan cho một lượt patch; truyền vào apply_once làm runner."""
+
+    def __init__(self, root: Path = CACHE_DIR / "patchplan"):
+        self.root = root
+        self.reused = 0
+        self.matched = 0
+        self._dexes = None
+
+    def _path(self, func, descriptor) -> Path:
+        version = f"{patch_version(func)}:{module_version(func)}"
+        return self.root / f"{hash_bytes(f'{func.__name__}:{version}:{descriptor}'.encode())[:24]}.json"
+
+    def _load(self, path: Path) -> list:
+        try:
+            return json.loads(path.read_text(encoding="utf-8"))["plans"]
+        except (OSError, ValueError, KeyError):
+            return []
+
+    def _store(self, func, descriptor, plan):
+        path = self._path(func, descriptor)
+        plans = [plan] + [old for old in self._load(path) if old["edits"] != plan["edits"] or old["added"] != plan["added"]]
+        ensure_dir(self.root)
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({"patch": func.__name__, "class": descriptor, "plans": plans[:MAX_PLANS]},
+                                  indent=1, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+
+    def cached(self, func, descriptor) -> int:
+        """Số plan đã lưu cho patcher + class này (0: patcher sẽ phải chạy thật)."""
+        return len(self._load(self._path(func, descriptor)))
+
+    def known_dexes(self, descriptor) -> list:
+        """Các dex từng chứa class này trong plan đã lưu (mọi patcher)."""
+        if self._dexes is None:
+            self._dexes = {}
+            for path in self.root.glob("*.json") if self.root.is_dir() else []:
+                try:
+                    data = json.loads(path.read_text(encoding="utf-8"))
+                except (OSError, ValueError):
+                    continue
+                dexes = self._dexes.setdefault(data.get("class"), [])
+                dexes += [plan["dex"] for plan in data["plans"] if plan["dex"] not in dexes]
+        return self._dexes.get(descriptor, [])
+
+    def __call__(self, file_path: Path, func) -> bool:
+        descriptor, dex = class_location(file_path)
+        original = file_path.read_text(encoding="utf-8", errors="ignore")
+        before = split_segments(original)
+        for plan in self._load(self._path(func, descriptor)):
+            patched = replay(plan, before)
+            if patched is not None:
+                write_patched(file_path, patched)
+                if not smalicheck.verify_patch(file_path, original, func.__name__):
+                    return False
+                self.reused += 1
+                return True
+
+        self.matched += 1
+        changed = func(file_path)
+        if changed and not smalicheck.verify_patch(file_path, original, func.__name__):
+            return False
+        if changed:
+            after = split_segments(file_path.read_text(encoding="utf-8", errors="ignore"))
+            plan = make_plan(before, after, dex)
+            # Chỉ lưu plan tái tạo đúng từng byte kết quả của patcher
+            if replay(plan, before) == "".join(text for _, text in after):
+                self._store(func, descriptor, plan)
+        return changed
+
+    def locate(self, unpack_root: Path, descriptor: str, preferred: str = None):
+        """
+        File smali của class: thử dex theo run report (fingerprint), dex mặc định, dex trong plan đã lưu,
+        cuối cùng quét mọi smali_classes*. Trả về Path hoặc None.
+        """
+        rel = descriptor_to_path(descriptor)
+        report = fingerprint.load(unpack_root.parent) if fingerprint.enabled() else None
+        targets = report.get("selection", {}).get("targets", {}) if report else {}
+        candidates = [preferred] if preferred else []
+        # Class được fingerprint theo dõi: None nghĩa là đã đọc dex và class không có trong ROM
+        absent = descriptor in targets and targets[descriptor] is None
+        hinted = targets.get(descriptor) or ""
+        jar_name = next((jar for jar, name in UNPACK_DIRS.items() if name == unpack_root.name), None)
+        if hinted.startswith(f"{jar_name}:"):
+            candidates.insert(0, "smali_" + hinted.split(":", 1)[1][:-len(".dex")])
+        candidates += self.known_dexes(descriptor)
+
+        for smali_dir in dict.fromkeys(candidates):
+            path = unpack_root / smali_dir / rel
+            if ensure(path):
+                if preferred and smali_dir != preferred:
+                    log(f"{descriptor} nằm ở {smali_dir} (mặc định {preferred})", "INFO")
+                return path
+        if absent:
+            return None
+        smali_dir = find_class(unpack_root, descriptor)
+        if smali_dir and ensure(unpack_root / smali_dir / rel):
+            log(f"{descriptor} nằm ở {smali_dir} (mặc định {preferred})", "INFO")
+            return unpack_root / smali_dir / rel
+        return None
+
+    def report(self):
+        if self.reused:
+            log(f"Patch plan: {self.reused} file dùng lại plan, {self.matched} file khớp đầy đủ", "INFO")
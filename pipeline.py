@@ -0,0 +1,387 @@
+#!/usr/bin/env python3
+# pipeline.py
+#
+# Chạy unpack → patch → assemble → jar cho từng jar độc lập theo đồ thị phụ thuộc.
+# Jar nào xong bước trước thì đi tiếp ngay, không chờ các jar khác;
+# chỉ bước zip module là điểm hội tụ.
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+
+import apk
+import bootloop
+import buildplan
+import events
+import fingerprint
+import imgread
+import kaori
+import ramspace
+import repack
+import resources
+import unpack
+from cache import BuildCache, hash_bytes, hash_file, hash_tree
+from profiling import span
+from utils import (
+    CURRENT_DIR, BAKSMALI_JAR, JAVA_CMD, MODULE_DIR, SMALI_JAR, TARGET_JARS, UNPACK_DIRS, check_tools, log
+)
+
+# Thời gian tối đa (giây) mặc định cho từng loại node
+DEFAULT_BUDGETS = {
+    "unpack": 900,
+    "patch": 120,
+    "assemble": 900,
+    "jar": 300,
+    "module": 300,
+}
+
+class Node:
+    def __init__(self, name, fn, deps=(), budget=None):
+        self.name = name
+        self.fn = fn
+        self.deps = list(deps)
+        self.budget = budget
+        self.status = "pending"
+        self.start = None
+        self.end = None
+        self.error = None
+
+    @property
+    def duration(self):
+        if self.start is None:
+            return 0.0
+        return (self.end or time.monotonic()) - self.start
+
+class DagScheduler:
+    """
+    Scheduler đơn giản trên thread pool: node được submit ngay khi mọi dependency xong.
+    Budget chỉ mang tính cảnh báo: thread Python không dừng cưỡng bức được. Node quá budget bị đánh
+    dấu timeout, các node chưa chạy bị skip (kể cả node đã submit nhưng chưa bắt đầu) và run() trả về
+    False, nhưng chỉ sau khi mọi thread đang chạy kết thúc: không có node nào còn ghi vào *_unpacked
+    sau khi pipeline đã báo lỗi. Kết quả trả về muộn của node quá budget bị bỏ qua.
+    """
+
+    def __init__(self, workers=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.nodes = {}
+
+    def add(self, name, fn, deps=(), budget=None) -> Node:
+        for dep in deps:
+            if dep not in self.nodes:
+                raise ValueError(f"{name}: dependency chưa khai báo {dep}")
+        node = Node(name, fn, deps, budget)
+        self.nodes[name] = node
+        return node
+
+    def _run_node(self, node):
+        node.start = time.monotonic()
+        resources.set_context(node.name)
+        try:
+            return node.fn()
+        finally:
+            resources.set_context(None)
+            node.end = time.monotonic()
+
+    def _skip_dependents(self, failed):
+        for node in self.nodes.values():
+            if node.status == "pending" and failed.name in node.deps:
+                node.status = "skipped"
+                node.error = f"phụ thuộc {failed.name} thất bại"
+                self._skip_dependents(node)
+
+    def _abort(self, cause, running):
+        """Dừng lập lịch: node chưa chạy bị skip, node đã submit mà chưa bắt đầu bị huỷ."""
+        for future, node in list(running.items()):
+            if future.cancel():
+                running.pop(future)
+                node.status = "skipped"
+                node.error = f"dừng vì {cause.name} vượt budget"
+        for node in self.nodes.values():
+            if node.status == "pending":
+                node.status = "skipped"
+                node.error = f"dừng vì {cause.name} vượt budget"
+
+    def run(self) -> bool:
+        running = {}
+        overdue = {}
+        aborted = False
+        progress = events.Progress("pipeline", len(self.nodes), "nodes")
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            while True:
+                for node in self.nodes.values():
+                    if aborted or node.status != "pending":
+                        continue
+                    if all(self.nodes[dep].status == "done" for dep in node.deps):
+                        node.status = "running"
+                        running[pool.submit(self._run_node, node)] = node
+
+                if not running:
+                    break
+
+                timeout = None
+                deadlines = [
+                    n.start + n.budget for n in running.values()
+                    if n.budget and n.start is not None
+                ]
+                if deadlines:
+                    timeout = max(0.0, min(deadlines) - time.monotonic())
+                if any(n.budget and n.start is None for n in running.values()):
+                    # Node còn chờ thread: kiểm tra lại định kỳ để không lỡ deadline của nó
+                    timeout = min(timeout, 1.0) if timeout is not None else 1.0
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    node = running.pop(future)
+                    progress.advance()
+                    try:
+                        ok = future.result()
+                        node.status = "done" if ok is not False else "failed"
+                    except Exception as exc:
+                        node.status = "failed"
+                        node.error = str(exc)
+                    if node.status == "failed":
+                        log(f"[{node.name}] thất bại {node.error or ''}", "ERROR")
+                        self._skip_dependents(node)
+
+                now = time.monotonic()
+                for future, node in list(running.items()):
+                    if node.budget and node.start is not None and now - node.start > node.budget:
+                        overdue[running.pop(future)] = node
+                        node.status = "timeout"
+                        node.error = f"vượt budget {node.budget}s"
+                        log(f"[{node.name}] {node.error}, dừng lập lịch các node còn lại", "ERROR")
+                        self._skip_dependents(node)
+                        if not aborted:
+                            aborted = True
+                            self._abort(node, running)
+        finally:
+            if overdue:
+                names = ", ".join(node.name for node in overdue.values())
+                log(f"Chờ node quá budget kết thúc trước khi trả kết quả: {names}", "WARN")
+            # Chờ mọi thread (kể cả node quá budget) để không còn ghi vào workspace sau khi trả về
+            pool.shutdown(wait=True, cancel_futures=True)
+
+        return all(node.status == "done" for node in self.nodes.values())
+
+    def critical_path(self) -> list:
+        """Chuỗi node có tổng thời gian lớn nhất (theo thời gian chạy thực tế)."""
+        best = {}
+
+        def longest(name):
+            if name not in best:
+                node = self.nodes[name]
+                prev = max((longest(dep) for dep in node.deps), key=lambda p: p[0], default=(0.0, []))
+                best[name] = (prev[0] + node.duration, prev[1] + [name])
+            return best[name]
+
+        paths = [longest(name) for name in self.nodes]
+        return max(paths, key=lambda p: p[0], default=(0.0, []))[1]
+
+    def report(self):
+        path = self.critical_path()
+        total = sum(self.nodes[name].duration for name in path)
+        if events.json_mode():
+            events.emit("pipeline_result", critical_path=path, critical_seconds=round(total, 3), nodes=[
+                {"name": n.name, "status": n.status, "seconds": round(n.duration, 3), "error": n.error}
+                for n in self.nodes.values()
+            ])
+            return
+
+        log("Kết quả pipeline:", "INFO")
+        for node in self.nodes.values():
+            line = f"   {node.name:<32} {node.status:<8} {node.duration:8.2f}s"
+            usage = resources.samples(node.name)
+            if usage:
+                peak = max(u["peak_rss_mb"] for u in usage)
+                cpu = sum(u["cpu_s"] for u in usage)
+                line += f"  java peak {peak:.0f} MB, cpu {cpu:.1f}s"
+            if events.text_enabled():
+                print(line)
+        log(f"Critical path ({total:.2f}s): {' → '.join(path)}", "INFO")
+
+# Các bước có thể bật/tắt; bootloop/apk/kaori gộp chung trong node patch:<jar>
+STAGES = ["unpack", "bootloop", "apk", "kaori", "repack", "module"]
+PATCH_STAGES = {"bootloop", "apk", "kaori"}
+
+def patch_jar(base, jar_name, stages):
+    unpack_dir = UNPACK_DIRS[jar_name]
+    if "bootloop" in stages:
+        bootloop.fix_bootloop(base, unpack_dir)
+    if jar_name == "framework.jar":
+        if "apk" in stages:
+            apk.patch_apk(base)
+        if "kaori" in stages:
+            kaori.patch_kaori(base)
+    return True
+
+# Mọi module .py của tool đều vào key: sửa patcher, plan cache, fingerprint, unpack/repack...
+# thì build cũ không còn đúng, và danh sách viết tay thì dễ sót
+CODE_DIR = Path(__file__).resolve().parent
+BUILD_ENV = ["KAORI_API_LEVEL", "KAORI_FINGERPRINT", "KAORI_SMALICHECK", "KAORI_MULTIDEX", "KAORI_DEX_LIMIT", "KAORI_SHRINK", "KAORI_FEATURE_CACHE"]
+
+def build_key(base, stages, workers=None):
+    """
+    Key cho cả lần build: hash jar đầu vào, payload kaorios, module/, mọi file .py của tool, smali/baksmali
+    và các bước được bật (hash song song). None nếu không build trọn từ jar gốc tới module, hoặc thiếu
+    smali/baksmali (--plan không chạy check_tools): coi như không biết, không tra cache.
+    """
+    if os.getenv("KAORI_BUILD_CACHE", "1") == "0" or not {"unpack", "module"} <= set(stages):
+        return None
+    jars = [jar for jar in TARGET_JARS if (base / jar).exists()]
+    if not jars or not all(path.is_file() for path in (SMALI_JAR, BAKSMALI_JAR)):
+        return None
+    files = {f"jar:{jar}": base / jar for jar in jars}
+    files.update({f"tool:{path.name}": path for path in (SMALI_JAR, BAKSMALI_JAR)})
+    files.update({f"code:{path.name}": path for path in sorted(CODE_DIR.glob("*.py"))})
+    trees = {"payload": kaori.KAORIOS_SOURCE, "module": MODULE_DIR}
+
+    with span("build key", "fs", jars=len(jars)):
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count() or 1) as pool:
+            futures = {name: pool.submit(hash_file, path) for name, path in files.items()}
+            futures.update({name: pool.submit(hash_tree, path) for name, path in trees.items()})
+            parts = {name: future.result() for name, future in futures.items()}
+    parts["stages"] = sorted(stages)
+    parts["java"] = JAVA_CMD
+    parts["env"] = {name: os.getenv(name) for name in BUILD_ENV}
+    return hash_bytes(json.dumps(parts, sort_keys=True).encode())
+
+def build_outputs(base) -> list:
+    """File đầu ra của một lần build trọn: jar (ghi đè lên jar gốc), module zip, run report."""
+    return [jar for jar in TARGET_JARS if (base / jar).exists()] + [repack.MODULE_ZIP, fingerprint.REPORT_NAME]
+
+def restore_build(base, stages, workers=None):
+    """(key, hit): hit khi đầu ra của đúng bộ đầu vào này đã được khôi phục từ build cache."""
+    started = time.perf_counter()
+    key = build_key(base, stages, workers)
+    if key is None:
+        return None, False
+    restored = BuildCache().get(key, base)
+    if restored:
+        log(f"Build cache hit {key[:12]}: khôi phục {', '.join(restored)} "
+            f"trong {time.perf_counter() - started:.1f}s", "SUCCESS")
+    return key, bool(restored)
+
+def store_build(base, key, outputs):
+    if key:
+        BuildCache().put(key, base, outputs)
+
+def preflight(base, stages) -> list:
+    """Nhận diện ROM khi có jar đầu vào mới, rồi bỏ các bước patch không áp dụng được."""
+    if "unpack" in stages and any((base / jar).exists() for jar in TARGET_JARS):
+        fingerprint.preflight(base)
+    return fingerprint.select_stages(stages, base)
+
+def build_graph(base=CURRENT_DIR, stages=None, workers=None, budgets=None, cache=None, dex_cache=None) -> DagScheduler:
+    """
+    Dựng đồ thị cho các bước trong `stages` (mặc định: tất cả).
+    Khi không có bước unpack, chỉ xử lý jar đã có thư mục *_unpacked từ lần chạy trước.
+    """
+    stages = set(STAGES if stages is None else stages)
+    budgets = {**DEFAULT_BUDGETS, **(budgets or {})}
+    dag = DagScheduler(workers)
+    jar_nodes = []
+
+    for jar_name in TARGET_JARS:
+        if "unpack" in stages:
+            if not (base / jar_name).exists():
+                continue
+        elif not (base / UNPACK_DIRS[jar_name]).exists():
+            continue
+
+        deps = []
+        if "unpack" in stages:
+            dag.add(f"unpack:{jar_name}", lambda j=jar_name: unpack.unpack_jar(j, base, cache),
+                    budget=budgets["unpack"])
+            deps = [f"unpack:{jar_name}"]
+        if stages & PATCH_STAGES:
+            dag.add(f"patch:{jar_name}", lambda j=jar_name: patch_jar(base, j, stages),
+                    deps, budgets["patch"])
+            deps = [f"patch:{jar_name}"]
+        if "repack" in stages:
+            dag.add(f"assemble:{jar_name}", lambda j=jar_name: repack.repack_classes(base, dex_cache, [j]),
+                    deps, budgets["assemble"])
+            dag.add(f"jar:{jar_name}", lambda j=jar_name: repack.repack_jars(base, [j]) or True,
+                    [f"assemble:{jar_name}"], budgets["jar"])
+            deps = [f"jar:{jar_name}"]
+        jar_nodes += deps
+
+    if "module" in stages and (jar_nodes or any((base / jar).exists() for jar in TARGET_JARS)):
+        dag.add("module", lambda: repack.create_module(base) and True, jar_nodes, budgets["module"])
+    return dag
+
+def parse_budgets(values):
+    budgets = {}
+    for item in values or []:
+        kind, _, seconds = item.partition("=")
+        if kind not in DEFAULT_BUDGETS or not seconds:
+            raise ValueError(f"Budget không hợp lệ: {item}")
+        budgets[kind] = float(seconds)
+    return budgets
+
+def main():
+    parser = argparse.ArgumentParser(description="Pipeline unpack → patch → repack theo từng jar")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--budget", action="append", metavar="KIND=SECONDS",
+                        help=f"Budget cho loại node ({', '.join(DEFAULT_BUDGETS)}); chỉ cảnh báo: node quá budget "
+                             "làm pipeline thất bại và dừng lập lịch, nhưng vẫn chạy nốt")
+    parser.add_argument("--no-bootloop", action="store_true")
+    parser.add_argument("--no-apk", action="store_true")
+    parser.add_argument("--no-kaori", action="store_true")
+    parser.add_argument("--image", action="append", metavar="IMG",
+                        help="Lấy jar trực tiếp từ system/system_ext image (ext4/EROFS) trước khi chạy")
+    parser.add_argument("--events", choices=["json"], help="Xuất sự kiện tiến độ dạng JSON thay cho log text")
+    parser.add_argument("--plan", action="store_true",
+                        help="Dry-run: class/dex sẽ bị sửa, cache hit và thời gian ước tính, không build")
+    parser.add_argument("--history", action="append", metavar="TRACE",
+                        help="Trace JSONL (KAORI_TRACE) của các lần chạy trước để ước tính thời gian cho --plan")
+    args = parser.parse_args()
+    events.configure(args.events)
+
+    if not args.plan and not check_tools():
+        sys.exit(1)
+    try:
+        budgets = parse_budgets(args.budget)
+    except ValueError as exc:
+        log(str(exc), "ERROR")
+        sys.exit(2)
+    if args.image:
+        try:
+            imgread.extract_jars(args.image)
+        except (OSError, imgread.ImageError) as exc:
+            log(str(exc), "ERROR")
+            sys.exit(1)
+
+    disabled = {stage for stage in PATCH_STAGES if getattr(args, f"no_{stage}")}
+    stages = [s for s in STAGES if s not in disabled]
+    if args.plan:
+        if not any((CURRENT_DIR / jar).exists() for jar in TARGET_JARS):
+            log("Không tìm thấy file JAR nào để lập plan.", "ERROR")
+            sys.exit(1)
+        key = build_key(CURRENT_DIR, stages, args.jobs)
+        build_hit = (BuildCache().root / key).is_dir() if key else None
+        buildplan.announce(buildplan.plan(CURRENT_DIR, stages, buildplan.history_paths(args.history), build_hit))
+        sys.exit(0)
+    key, hit = restore_build(CURRENT_DIR, stages, args.jobs)
+    if hit:
+        sys.exit(0)
+    outputs = build_outputs(CURRENT_DIR)
+    stages = preflight(CURRENT_DIR, stages)
+    dag = build_graph(stages=stages, workers=max(1, args.jobs), budgets=budgets)
+    if not dag.nodes:
+        log("Không tìm thấy file JAR nào để xử lý.", "ERROR")
+        sys.exit(1)
+
+    ok = dag.run()
+    dag.report()
+    ramspace.report()
+    if ok:
+        store_build(CURRENT_DIR, key, outputs)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+# pristine.py
+#
+# Bản gốc (pristine) của mỗi *_unpacked ngay sau khi unpack, nằm ở <unpack_dir>/.kaori/pristine.
+# Snapshot dùng reflink (FICLONE) nếu filesystem hỗ trợ, không thì hardlink: gần như không tốn dung lượng.
+# Patcher ghi file qua write_patched(): ghi ra file tạm rồi os.replace nên inode mới thay thế,
+# bản gốc không bị đụng tới, và đường dẫn được ghi vào journal <unpack_dir>/.kaori/dirty.
+# reset() chỉ khôi phục các file trong journal (không quét cả cây), thay cho việc chạy lại baksmali.
+#   python pristine.py                    reset mọi *_unpacked có snapshot
+#   python pristine.py framework.jar      chỉ reset framework_unpacked
+#   KAORI_PRISTINE=1                      bật snapshot khi unpack (cần cho reset và watch.py);
+#                                         mặc định tắt: snapshot nhân đôi số inode của cây smali
+
+import os
+import shutil
+import sys
+from pathlib import Path
+from patchlog import PatchManifest
+from profiling import span
+from utils import CURRENT_DIR, META_DIR, TARGET_JARS, UNPACK_DIRS, log
+
+PRISTINE_NAME = "pristine"
+JOURNAL_NAME = "dirty"
+FICLONE = 0x40049409
+
+try:
+    import fcntl
+except ImportError:  # Windows: chỉ có hardlink
+    fcntl = None
+
+def enabled() -> bool:
+    return os.getenv("KAORI_PRISTINE", "0") == "1"
+
+def _reflink(src, dst):
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+
+class _Linker:
+    """Thử reflink ở file đầu tiên; filesystem không hỗ trợ thì chuyển hẳn sang hardlink."""
+
+    def __init__(self):
+        self.mode = "reflink" if fcntl else "hardlink"
+
+    def __call__(self, src, dst):
+        if self.mode == "reflink":
+            try:
+                _reflink(src, dst)
+                return
+            except OSError:
+                Path(dst).unlink(missing_ok=True)
+                self.mode = "hardlink"
+        os.link(src, dst)
+
+def pristine_dir(unpack_root: Path) -> Path:
+    return unpack_root / META_DIR / PRISTINE_NAME
+
+def snapshot(unpack_root: Path) -> int:
+    """Tạo bản gốc cho toàn bộ cây (trừ .kaori). Trả về số file."""
+    target = pristine_dir(unpack_root)
+    shutil.rmtree(target, ignore_errors=True)
+    (unpack_root / META_DIR / JOURNAL_NAME).unlink(missing_ok=True)
+    link = _Linker()
+    count = 0
+    with span(f"snapshot {unpack_root.name}", "fs") as sp:
+        for root, dirs, files in os.walk(unpack_root):
+            if Path(root) == unpack_root and META_DIR in dirs:
+                dirs.remove(META_DIR)
+            dest = target / Path(root).relative_to(unpack_root)
+            dest.mkdir(parents=True, exist_ok=True)
+            for name in files:
+                link(os.path.join(root, name), dest / name)
+                count += 1
+        sp.set(files=count, mode=link.mode)
+    return count
+
+def _find_root(path: Path):
+    for parent in path.parents:
+        if pristine_dir(parent).is_dir():
+            return parent
+    return None
+
+def mark_dirty(path: Path):
+    """Ghi path (file hoặc thư mục) vào journal của *_unpacked chứa nó, nếu có snapshot."""
+    root = _find_root(path)
+    if root is None:
+        return
+    with open(root / META_DIR / JOURNAL_NAME, "a", encoding="utf-8") as journal:
+        journal.write(path.relative_to(root).as_posix() + "\n")
+
+def dirty_paths(unpack_root: Path) -> list:
+    """Các đường dẫn (tương đối) đã bị patch kể từ snapshot/reset gần nhất."""
+    try:
+        text = (unpack_root / META_DIR / JOURNAL_NAME).read_text(encoding="utf-8")
+    except FileNotFoundError:
+        return []
+    return sorted(set(text.split()))
+
+def write_patched(path: Path, text: str):
+    """Ghi nội dung đã vá mà không đụng tới inode cũ (có thể đang hardlink với bản gốc)."""
+    mark_dirty(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+
+def _remove(path: Path):
+    if path.is_dir() and not path.is_symlink():
+        shutil.rmtree(path)
+    else:
+        path.unlink(missing_ok=True)
+
+def _restore(src: Path, dst: Path, link):
+    if src.is_dir():
+        _remove(dst)
+        for root, _, files in os.walk(src):
+            dest = dst / Path(root).relative_to(src)
+            dest.mkdir(parents=True, exist_ok=True)
+            for name in files:
+                link(os.path.join(root, name), dest / name)
+        return
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dst.with_name(f".{dst.name}.{os.getpid()}.tmp")
+    tmp.unlink(missing_ok=True)
+    link(src, tmp)
+    os.replace(tmp, dst)
+
+def reset(unpack_root: Path):
+    """Khôi phục các file bị patch về bản gốc. Trả về số đường dẫn đã xử lý, None nếu không có snapshot."""
+    source = pristine_dir(unpack_root)
+    if not source.is_dir():
+        return None
+    journal = unpack_root / META_DIR / JOURNAL_NAME
+    dirty = dirty_paths(unpack_root)
+
+    link = _Linker()
+    with span(f"reset {unpack_root.name}", "fs", files=len(dirty)):
+        for rel in dirty:
+            src = source / rel
+            dst = unpack_root / rel
+            if src.exists():
+                _restore(src, dst, link)
+                continue
+            # File/thư mục do patch tạo thêm: xoá, kèm các thư mục cha rỗng không có trong bản gốc
+            _remove(dst)
+            parent = dst.parent
+            while parent != unpack_root and not (source / parent.relative_to(unpack_root)).exists():
+                try:
+                    parent.rmdir()
+                except OSError:
+                    break
+                parent = parent.parent
+
+        manifest = PatchManifest(unpack_root)
+        for key in list(manifest.entries):
+            if any(key == rel or key.startswith(rel + "/") for rel in dirty):
+                del manifest.entries[key]
+                manifest.dirty = True
+        manifest.save()
+    journal.unlink(missing_ok=True)
+    return len(dirty)
+
+def reset_jars(base=CURRENT_DIR, jars=None) -> bool:
+    found = False
+    for jar_name in jars or TARGET_JARS:
+        unpack_root = base / UNPACK_DIRS[jar_name]
+        restored = reset(unpack_root) if unpack_root.exists() else None
+        if restored is None:
+            continue
+        found = True
+        log(f"Reset {unpack_root.name}: khôi phục {restored} đường dẫn", "SUCCESS")
+    if not found:
+        log("Không có thư mục *_unpacked nào có snapshot gốc (unpack với KAORI_PRISTINE=1).", "ERROR")
+    return found
+
+def main():
+    jars = sys.argv[1:] or None
+    for jar_name in jars or []:
+        if jar_name not in UNPACK_DIRS:
+            log(f"Jar không hỗ trợ: {jar_name}", "ERROR")
+            sys.exit(2)
+    if not reset_jars(jars=jars):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
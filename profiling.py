@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+# profiling.py
+#
+# Đo thời gian theo span (stage, dex, JVM call, patch, zip entry).
+# Bật bằng biến môi trường:
+#   KAORI_TRACE=trace.jsonl          ghi mỗi span một dòng JSON (append, dùng chung giữa các bước)
+#   KAORI_TRACE_CHROME=trace.json    xuất thêm Chrome trace-event (mở bằng chrome://tracing / Perfetto)
+# Khi không bật, span() trả về một object rỗng dùng chung nên chi phí gần như bằng 0.
+
+import atexit
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+import events
+
+_enabled = False
+_owner_pid = None
+_jsonl_path = None
+_chrome_path = None
+_handle = None
+_handle_pid = None
+_lock = threading.Lock()
+_started_at = time.time_ns() // 1000
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+_NULL_SPAN = _NullSpan()
+
+class Span:
+    __slots__ = ("name", "cat", "attrs", "ts", "_start")
+
+    def __init__(self, name, cat, attrs):
+        self.name = name
+        self.cat = cat
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.ts = time.time_ns() // 1000
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        dur = (time.perf_counter_ns() - self._start) // 1000
+        if exc_type is not None:
+            self.attrs["error"] = f"{exc_type.__name__}: {exc}"
+        _emit({
+            "name": self.name,
+            "cat": self.cat,
+            "ts": self.ts,
+            "dur": dur,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": self.attrs,
+        })
+        return False
+
+def enabled() -> bool:
+    return _enabled
+
+def span(name, cat="stage", **attrs):
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, cat, attrs)
+
+def _emit(event):
+    global _handle, _handle_pid
+    line = json.dumps(event, ensure_ascii=False, default=str) + "\n"
+    with _lock:
+        # Process con (batch/ProcessPool) mở handle riêng để không ghi chồng buffer của process cha
+        if _handle is None or _handle_pid != os.getpid():
+            _handle = open(_jsonl_path, "a", encoding="utf-8")
+            _handle_pid = os.getpid()
+        _handle.write(line)
+        _handle.flush()
+
+def configure(jsonl=None, chrome=None):
+    global _enabled, _owner_pid, _jsonl_path, _chrome_path
+    if not jsonl:
+        return
+    _jsonl_path = str(jsonl)
+    _chrome_path = str(chrome) if chrome else None
+    _owner_pid = os.getpid()
+    _enabled = True
+    atexit.register(finish)
+
+def load_events(path):
+    events = []
+    try:
+        with open(path, "r", encoding="utf-8") as handle:
+            for line in handle:
+                line = line.strip()
+                if line:
+                    try:
+                        events.append(json.loads(line))
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return events
+
+def write_chrome_trace(events, path):
+    trace = [dict(event, ph="X") for event in events]
+    with open(path, "w", encoding="utf-8") as handle:
+        json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, handle)
+
+def summarize(events, since=None):
+    rows = defaultdict(lambda: [0, 0, 0, 0])
+    for event in events:
+        if since is not None and event["ts"] < since:
+            continue
+        key = (event.get("cat", ""), event["name"])
+        row = rows[key]
+        row[0] += 1
+        row[1] += event["dur"]
+        row[2] = max(row[2], event["dur"])
+        row[3] += int(event.get("args", {}).get("bytes", 0) or 0)
+    return rows
+
+def print_summary(rows, limit=25):
+    if not rows:
+        return
+    if events.json_mode():
+        events.emit("profile_summary", rows=[
+            {"cat": cat, "name": name, "count": count, "total_s": round(total / 1e6, 3),
+             "max_s": round(peak / 1e6, 3), "bytes": nbytes}
+            for (cat, name), (count, total, peak, nbytes) in rows.items()
+        ])
+        return
+    if not events.text_enabled():
+        return
+    print("\n⏱️  Profiling summary")
+    print(f"   {'cat':<8} {'name':<48} {'n':>5} {'total s':>9} {'max s':>8} {'MB':>9} {'MB/s':>8}")
+    ordered = sorted(rows.items(), key=lambda item: item[1][1], reverse=True)
+    for (cat, name), (count, total, peak, nbytes) in ordered[:limit]:
+        seconds = total / 1e6
+        mb = nbytes / (1 << 20)
+        rate = f"{mb / seconds:8.1f}" if nbytes and seconds else f"{'-':>8}"
+        print(f"   {cat:<8} {name[-48:]:<48} {count:>5} {seconds:9.3f} {peak / 1e6:8.3f} {mb:9.2f} {rate}")
+
+def finish():
+    global _handle
+    if not _enabled or os.getpid() != _owner_pid:
+        return
+    with _lock:
+        if _handle is not None:
+            _handle.close()
+            _handle = None
+    events = load_events(_jsonl_path)
+    if _chrome_path:
+        write_chrome_trace(events, _chrome_path)
+    print_summary(summarize(events, since=_started_at))
+
+configure(os.getenv("KAORI_TRACE"), os.getenv("KAORI_TRACE_CHROME"))
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# ramspace.py
+#
+# Workspace trên RAM: đặt các thư mục *_unpacked (smali, dex trung gian) lên tmpfs (/dev/shm)
+# rồi để <base>/<x>_unpacked là symlink trỏ tới đó. Quyết định theo từng jar:
+# footprint ước tính vượt phần budget còn lại thì jar đó dùng thư mục trên đĩa như cũ (spill).
+#   KAORI_RAM_WORKSPACE=1     bật
+#   KAORI_RAM_DIR=/dev/shm    thư mục tmpfs
+#   KAORI_RAM_LIMIT_MB=N      budget cố định (mặc định: 50% MemAvailable lúc bắt đầu)
+# batch.py chạy nhiều process song song: mỗi process chỉ nhận 1/N budget (set_share).
+
+import hashlib
+import os
+import shutil
+import threading
+import zipfile
+from pathlib import Path
+
+import events
+from ziputil import DEX_ENTRY_RE
+
+RAM_MARKER = ".kaori-ram"
+# Smali sau baksmali lớn hơn dex khoảng 3-4 lần
+SMALI_PER_DEX = 4.0
+
+_lock = threading.Lock()
+_budget = None
+_share = 1
+_reserved = {}
+_kept = {}
+_spilled = {}
+
+def tmpfs_dir():
+    path = Path(os.getenv("KAORI_RAM_DIR", "/dev/shm"))
+    if path.is_dir() and os.access(path, os.W_OK):
+        return path
+    return None
+
+def enabled() -> bool:
+    return os.getenv("KAORI_RAM_WORKSPACE", "0") == "1" and tmpfs_dir() is not None
+
+def mem_available() -> int:
+    try:
+        with open("/proc/meminfo", "r") as handle:
+            for line in handle:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def set_share(processes: int):
+    """Budget của process này = 1/processes budget chung (các process cùng đọc một MemAvailable)."""
+    global _budget, _share
+    with _lock:
+        _share = max(1, processes)
+        _budget = None
+
+def _limit() -> int:
+    limit_mb = os.getenv("KAORI_RAM_LIMIT_MB")
+    if limit_mb:
+        return int(float(limit_mb) * (1 << 20)) // _share
+    return mem_available() // 2 // _share
+
+def estimate(jar_path: Path) -> int:
+    """Footprint ước tính của *_unpacked: dex giải nén + smali + dex assemble lại (resource ở lại trong jar)."""
+    with zipfile.ZipFile(jar_path, "r") as zf:
+        infos = zf.infolist()
+    dex = sum(info.file_size for info in infos if DEX_ENTRY_RE.match(info.filename))
+    return int(dex + dex * SMALI_PER_DEX + dex)
+
+def _root(base: Path) -> Path:
+    digest = hashlib.sha1(str(base.resolve()).encode("utf-8")).hexdigest()[:12]
+    uid = os.getuid() if hasattr(os, "getuid") else 0
+    return tmpfs_dir() / f"kaori-{uid}-{digest}"
+
+def place(out_dir: Path, jar_path: Path):
+    """
+    Nếu đủ budget, tạo thư mục trên tmpfs và symlink out_dir tới đó.
+    Trả về (target hoặc None, footprint ước tính, budget còn lại). out_dir phải chưa tồn tại.
+    """
+    global _budget
+    footprint = estimate(jar_path)
+    with _lock:
+        if _budget is None:
+            _budget = _limit()
+        left = _budget - sum(_reserved.values())
+        if footprint > left:
+            _spilled[out_dir.name] = footprint
+            return None, footprint, left
+        _reserved[out_dir.name] = footprint
+
+    root = _root(out_dir.parent)
+    root.mkdir(parents=True, exist_ok=True)
+    (root / RAM_MARKER).touch()
+    target = root / out_dir.name
+    shutil.rmtree(target, ignore_errors=True)
+    target.mkdir()
+    out_dir.symlink_to(target, target_is_directory=True)
+    return target, footprint, left - footprint
+
+def release(link: Path):
+    """Xoá symlink workspace; thư mục đích chỉ bị xoá khi là thư mục RAM do ramspace tạo."""
+    target = Path(os.readlink(link))
+    link.unlink()
+    root = target.parent
+    if not (root / RAM_MARKER).exists():
+        return
+    shutil.rmtree(target, ignore_errors=True)
+    with _lock:
+        _reserved.pop(target.name, None)
+    if [entry.name for entry in root.iterdir()] == [RAM_MARKER]:
+        shutil.rmtree(root, ignore_errors=True)
+
+def account(out_dir: Path) -> int:
+    """Ghi nhận dung lượng thực của một workspace trên RAM (hardlink chỉ tính một lần)."""
+    if not out_dir.is_symlink():
+        return 0
+    seen = set()
+    total = 0
+    for root, _, files in os.walk(out_dir):
+        for name in files:
+            st = os.lstat(os.path.join(root, name))
+            if st.st_ino not in seen:
+                seen.add(st.st_ino)
+                total += st.st_size
+    with _lock:
+        _kept[out_dir.name] = total
+    return total
+
+def report():
+    """Tổng kết số byte đã giữ trên RAM thay vì ghi xuống đĩa."""
+    if not _kept and not _spilled:
+        return
+    kept = sum(_kept.values())
+    if events.json_mode():
+        events.emit("ram_workspace", kept_bytes=kept, ram=dict(_kept), spilled=dict(_spilled))
+        return
+    if not events.text_enabled():
+        return
+    print(f"🧠 RAM workspace: {kept / (1 << 20):.1f} MB giữ trên RAM ({len(_kept)} thư mục)")
+    for name, footprint in _spilled.items():
+        print(f"   {name:<28} spill ra đĩa (ước tính {footprint / (1 << 20):.1f} MB)")
@@ -1,92 +1,192 @@
 #!/usr/bin/env python3
 # 5_repack.py
 
-import subprocess
-import shutil
+import contextlib
 import zipfile
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import dexdiff
+import fingerprint
+import multidex
+import shard
+from cache import hash_bytes, hash_tree
+from events import Progress
+from profiling import span
+from smali_store import prepare_assembly
+from ziputil import (
+    DEX_ENTRY_RE, ZIP_EPOCH, copy_entries_raw, read_raw_entry, sorted_files, walk_order, write_file, write_raw_entry,
+)
 from utils import (
-    CURRENT_DIR, SMALI_JAR, MODULE_DIR, 
-    log, delete_dir, ensure_dir
+    CURRENT_DIR, SMALI_JAR, MODULE_DIR, CACHE_DIR, META_DIR, TARGET_JARS, UNPACK_DIRS,
+    log, delete_dir, ensure_dir, stage
 )
 
-def repack_classes():
+MODULE_ZIP = "Module-framework-test.zip"
+
+MODULE_JARS = {
+    "framework.jar": "system/framework/framework.jar",
+    "services.jar": "system/framework/services.jar",
+    "miui-framework.jar": "system/system_ext/framework/miui-framework.jar",
+    "miui-services.jar": "system/system_ext/framework/miui-services.jar",
+}
+
+def assemble_dex(directory, output, cache=None, api=None) -> bool:
+    api = api or fingerprint.api_level()
+    with span(f"{directory.parent.name}/{output.name}", "dex") as sp:
+        key = None
+        if cache:
+            key = hash_bytes(f"{hash_tree(directory)}:api{api}".encode())
+            if cache.get(key, output):
+                sp.set(cache="hit", bytes=output.stat().st_size)
+                log(f"Cache hit {directory.name}", "SUCCESS")
+                return True
+
+        # Ghi ra file tạm rồi os.replace: classesN.dex cũ có thể đang hardlink với snapshot pristine
+        tmp = output.with_name(f".{output.name}.{os.getpid()}.tmp")
+        res = shard.run_java(SMALI_JAR, ["a", directory, "-o", tmp, "--api", api],
+                             capture_output=True, text=True)
+        if res.returncode != 0:
+            tmp.unlink(missing_ok=True)
+            log(f"Lỗi repack {directory.name}: {res.stderr}", "ERROR", file=str(directory))
+            return False
+        os.replace(tmp, output)
+        sp.set(bytes=output.stat().st_size)
+        if cache:
+            cache.put(key, output)
+        return True
+
+def repack_classes(base=CURRENT_DIR, cache=None, jars=None) -> bool:
     log("Repack classes (Smali -> Dex)...", "PROCESS")
+    with stage("repack classes", jars=",".join(jars or TARGET_JARS)):
+        return _repack_classes(base, cache, jars)
+
+def _repack_classes(base, cache, jars) -> bool:
+    ok = True
     smali_dirs = []
-    for folder in ["framework_unpacked", "services_unpacked", "miui_framework_unpacked", "miui_services_unpacked"]:
-        base = CURRENT_DIR / folder
-        if base.exists():
-            for child in base.iterdir():
+    for jar_name in jars or TARGET_JARS:
+        folder_path = base / UNPACK_DIRS[jar_name]
+        if folder_path.exists():
+            # Dự đoán tràn 65536 id trước khi smali chạy; có thể chuyển payload sang dex khác
+            if multidex.enabled() and not multidex.plan_jar(base, jar_name)[0]:
+                ok = False
+                continue
+            # smali_store: bung nốt các dex đã bị patch; dex còn nguyên giữ classesN.dex gốc
+            prepare_assembly(folder_path)
+            for child in folder_path.iterdir():
                 if child.is_dir() and child.name.startswith("smali_classes"):
                     smali_dirs.append(child)
 
-    for directory in smali_dirs:
-        dex_name = directory.name.replace("smali_", "") + ".dex"
-        output = directory.parent / dex_name
-        cmd = [
-            "java", "-jar", str(SMALI_JAR), 
-            "a", str(directory), 
-            "-o", str(output), "--api", "33"
-        ]
-        res = subprocess.run(cmd, capture_output=True, text=True)
-        if res.returncode == 0:
-            log(f"Repacked {directory.name}", "SUCCESS")
-            delete_dir(directory)
-        else:
-            log(f"Lỗi repack {directory.name}: {res.stderr}", "ERROR")
-
-def repack_jars():
+    api = fingerprint.api_level(base)
+    assembled = {}
+    progress = Progress("assemble", len(smali_dirs), "dex")
+    # Dung lượng dex gốc của các dex được assemble: buildplan.py ước tính thời gian theo MB
+    outputs = [directory.parent / (directory.name.replace("smali_", "") + ".dex") for directory in smali_dirs]
+    dex_bytes = sum(output.stat().st_size for output in outputs if output.exists())
+
+    def assemble(directory):
+        return assemble_dex(directory, directory.parent / (directory.name.replace("smali_", "") + ".dex"), cache, api)
+
+    # Có worker shard thì các dex được gửi đi song song, không thì tuần tự như cũ
+    with span("assemble", "stage", jars=",".join(jars or TARGET_JARS), dex=len(smali_dirs), bytes=dex_bytes), \
+            ThreadPoolExecutor(max_workers=shard.parallel()) as pool:
+        for directory, built in zip(smali_dirs, pool.map(assemble, smali_dirs)):
+            dex_name = directory.name.replace("smali_", "") + ".dex"
+            if built:
+                log(f"Repacked {directory.name}", "SUCCESS")
+                delete_dir(directory)
+                assembled.setdefault(directory.parent.name, []).append(dex_name)
+            else:
+                ok = False
+            progress.advance()
+
+    if ok and dexdiff.enabled():
+        for jar_name in jars or TARGET_JARS:
+            if UNPACK_DIRS[jar_name] in assembled:
+                ok = dexdiff.check_jar(base, jar_name, assembled[UNPACK_DIRS[jar_name]]) and ok
+    return ok
+
+def repack_jars(base=CURRENT_DIR, jars=None):
     log("Repack JAR files...", "PROCESS")
-    candidates = [
-        ("framework.jar", "framework_unpacked"),
-        ("services.jar", "services_unpacked"),
-        ("miui-framework.jar", "miui_framework_unpacked"),
-        ("miui-services.jar", "miui_services_unpacked"),
-    ]
-
-    for jar_name, directory in candidates:
-        dir_path = CURRENT_DIR / directory
+    for jar_name in jars or TARGET_JARS:
+        dir_path = base / UNPACK_DIRS[jar_name]
         if not dir_path.exists():
             continue
-        output_jar = CURRENT_DIR / jar_name
-        with zipfile.ZipFile(output_jar, 'w', zipfile.ZIP_DEFLATED) as zf:
-            for root, _, files in os.walk(dir_path):
-                for file in files:
-                    file_path = Path(root) / file
-                    arcname = file_path.relative_to(dir_path)
-                    zf.write(file_path, arcname)
-        
+        output_jar = base / jar_name
+        with stage(f"repack {jar_name}") as sp:
+            progress = Progress(f"repack {jar_name}", unit="files")
+            files = list(sorted_files(dir_path, exclude={META_DIR}))
+            replaced = {arcname for _, arcname in files}
+            # Resource/META-INF chưa từng được giải nén: copy raw từ jar gốc (timestamp đặt lại ZIP_EPOCH),
+            # chỉ dex trong thư mục unpack bị nén lại. Mọi entry ghi theo thứ tự của sorted_files như khi
+            # giải nén cả jar. Ghi ra file tạm rồi os.replace vì jar gốc đang là nguồn đọc.
+            tmp = output_jar.with_name(f".{output_jar.name}.{os.getpid()}.tmp")
+            try:
+                with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zf, \
+                        contextlib.ExitStack() as stack:
+                    entries = [(arcname, file_path) for file_path, arcname in files]
+                    if output_jar.exists():
+                        src = stack.enter_context(zipfile.ZipFile(output_jar, "r"))
+                        entries += [(info.filename, info) for info in src.infolist()
+                                    if not info.is_dir() and info.filename not in replaced
+                                    and not DEX_ENTRY_RE.match(info.filename)]
+                    else:
+                        log(f"Không còn {jar_name} gốc, jar mới chỉ có các file trong {dir_path.name}",
+                            "WARN", file=jar_name)
+                    for arcname, entry in sorted(entries, key=lambda item: walk_order(item[0])):
+                        if isinstance(entry, zipfile.ZipInfo):
+                            write_raw_entry(zf, entry, read_raw_entry(src, entry), date_time=ZIP_EPOCH)
+                            progress.advance(1)
+                            continue
+                        size = entry.stat().st_size
+                        with span(f"deflate {jar_name}", "zip", entry=arcname, bytes=size):
+                            write_file(zf, entry, arcname)
+                        progress.advance(1, size)
+                os.replace(tmp, output_jar)
+            finally:
+                tmp.unlink(missing_ok=True)
+            progress.finish()
+            sp.set(bytes=output_jar.stat().st_size)
+
         log(f"Đã tạo {jar_name}", "SUCCESS")
         delete_dir(dir_path)
 
-def create_module():
+def module_fragment() -> Path:
+    """
+    Zip phần tĩnh của module/ (script, prop, priv-app...) một lần và cache theo hash,
+    các lần tạo module sau chỉ copy raw các entry này thay vì nén lại.
+    """
+    skip = set(MODULE_JARS.values())
+    fragment = CACHE_DIR / "module" / f"{hash_tree(MODULE_DIR)}.zip"
+    if fragment.exists():
+        return fragment
+
+    ensure_dir(fragment.parent)
+    tmp = fragment.with_suffix(f".{os.getpid()}.tmp")
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_DEFLATED) as zipf:
+        for file_path, arcname in sorted_files(MODULE_DIR):
+            if arcname not in skip:
+                write_file(zipf, file_path, arcname)
+    os.replace(tmp, fragment)
+    return fragment
+
+def create_module(base=CURRENT_DIR, zip_path=None) -> Path:
     log("Tạo Magisk Module...", "PROCESS")
-    framework_dir = MODULE_DIR / "system" / "framework"
-    system_ext_dir = MODULE_DIR / "system" / "system_ext" / "framework"
-    ensure_dir(framework_dir)
-    ensure_dir(system_ext_dir)
-
-    copies = [
-        (CURRENT_DIR / "framework.jar", framework_dir / "framework.jar"),
-        (CURRENT_DIR / "services.jar", framework_dir / "services.jar"),
-        (CURRENT_DIR / "miui-framework.jar", system_ext_dir / "miui-framework.jar"),
-        (CURRENT_DIR / "miui-services.jar", system_ext_dir / "miui-services.jar"),
-    ]
-
-    for src, dst in copies:
-        if src.exists():
-            shutil.copy2(src, dst)
-
-    zip_path = CURRENT_DIR / "Module-framework-test.zip"
-    with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
-        for root, _, files in os.walk(MODULE_DIR):
-            for file in files:
-                file_path = Path(root) / file
-                arcname = file_path.relative_to(MODULE_DIR)
-                zipf.write(file_path, arcname)
-    
+    zip_path = zip_path or base / MODULE_ZIP
+
+    with stage("create module") as sp:
+        with zipfile.ZipFile(module_fragment(), "r") as fragment, \
+                zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
+            copy_entries_raw(fragment, zipf)
+            for jar_name, arcname in MODULE_JARS.items():
+                src = base / jar_name
+                if src.exists():
+                    with span("deflate module", "zip", entry=arcname, bytes=src.stat().st_size):
+                        write_file(zipf, src, arcname)
+        sp.set(bytes=zip_path.stat().st_size)
+
     log(f"Module saved: {zip_path}", "SUCCESS")
+    return zip_path
 
 def main():
     repack_classes()
@@ -95,4 +195,4 @@ def main():
 
 if __name__ == "__main__":
     main()
-  
+
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# resources.py
+#
+# Lấy mẫu RSS / CPU / wall time từ /proc cho các process java con và cho chính driver.
+# Bật bằng KAORI_SAMPLE_MS=<chu kỳ lấy mẫu, ms> (ví dụ 100).
+# Kết quả gắn vào span profiling, vào bảng kết quả pipeline và in ra khi thoát.
+
+import atexit
+import json
+import os
+import resource
+import subprocess
+import threading
+import time
+
+import events
+
+CLK_TCK = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+_interval = None
+_samples = []
+_lock = threading.Lock()
+_context = threading.local()
+_driver = None
+
+def read_proc(pid):
+    """Trả về (rss_kb, hwm_kb, cpu_s) của pid, hoặc None nếu process đã thoát."""
+    try:
+        with open(f"/proc/{pid}/status", "r") as handle:
+            status = handle.read()
+        with open(f"/proc/{pid}/stat", "r") as handle:
+            stat = handle.read()
+    except OSError:
+        return None
+    rss = hwm = 0
+    for line in status.splitlines():
+        if line.startswith("VmRSS:"):
+            rss = int(line.split()[1])
+        elif line.startswith("VmHWM:"):
+            hwm = int(line.split()[1])
+    # Tên process nằm trong ngoặc và có thể chứa khoảng trắng: tách sau dấu ')' cuối
+    fields = stat[stat.rfind(")") + 2:].split()
+    cpu = (int(fields[11]) + int(fields[12])) / CLK_TCK
+    return rss, hwm, cpu
+
+class ProcSampler:
+    def __init__(self, pid, interval):
+        self.pid = pid
+        self.interval = interval
+        self.peak_rss_kb = 0
+        self.cpu_s = 0.0
+        self.samples = 0
+        self.started = time.monotonic()
+        self.wall_s = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        reading = read_proc(self.pid)
+        if reading is None:
+            return False
+        rss, hwm, cpu = reading
+        self.peak_rss_kb = max(self.peak_rss_kb, rss, hwm)
+        self.cpu_s = max(self.cpu_s, cpu)
+        self.samples += 1
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self._sample():
+                return
+            self._stop.wait(self.interval)
+
+    def stop(self) -> dict:
+        self._sample()
+        self._stop.set()
+        self._thread.join()
+        self.wall_s = time.monotonic() - self.started
+        return self.usage()
+
+    def usage(self) -> dict:
+        return {
+            "peak_rss_mb": round(self.peak_rss_kb / 1024, 1),
+            "cpu_s": round(self.cpu_s, 2),
+            "wall_s": round(self.wall_s or time.monotonic() - self.started, 2),
+            "samples": self.samples,
+        }
+
+def enabled() -> bool:
+    return _interval is not None
+
+def set_context(label):
+    """Gắn nhãn (vd: tên node pipeline) cho các mẫu được ghi trong thread hiện tại."""
+    _context.label = label
+
+def current_context():
+    return getattr(_context, "label", None)
+
+def run_sampled(cmd, target, check=False, capture_output=False, timeout=None, **kwargs):
+    """Tương đương subprocess.run nhưng lấy mẫu tài nguyên của process con; trả về (result, usage)."""
+    if capture_output:
+        kwargs["stdout"] = subprocess.PIPE
+        kwargs["stderr"] = subprocess.PIPE
+    with subprocess.Popen(cmd, **kwargs) as proc:
+        sampler = ProcSampler(proc.pid, _interval).start()
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except BaseException:
+            proc.kill()
+            raise
+        finally:
+            # Process đã được reap nên mẫu cuối có thể trễ tối đa một chu kỳ;
+            # VmHWM vẫn cho peak RSS tính đến lần đọc gần nhất.
+            usage = sampler.stop()
+        returncode = proc.poll()
+
+    jar = cmd.index("-jar") + 1
+    record = {"cmd": f"{os.path.splitext(os.path.basename(str(cmd[jar])))[0]} {cmd[jar + 1]}", "target": target,
+              "stage": current_context(), "returncode": returncode, **usage}
+    with _lock:
+        _samples.append(record)
+    if check and returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, stdout, stderr)
+    return subprocess.CompletedProcess(cmd, returncode, stdout, stderr), usage
+
+def samples(stage=None) -> list:
+    with _lock:
+        return [s for s in _samples if stage is None or s["stage"] == stage]
+
+def driver_usage() -> dict:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    result = {
+        "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),
+        "cpu_s": round(usage.ru_utime + usage.ru_stime, 2),
+        "children_cpu_s": round(children.ru_utime + children.ru_stime, 2),
+        "children_peak_rss_mb": round(children.ru_maxrss / 1024, 1),
+    }
+    if _driver is not None:
+        result["sampled_peak_rss_mb"] = round(_driver.peak_rss_kb / 1024, 1)
+        result["wall_s"] = round(time.monotonic() - _driver.started, 2)
+    return result
+
+def report():
+    if not enabled():
+        return
+    children = samples()
+    driver = driver_usage()
+    path = os.getenv("KAORI_RESOURCES_REPORT")
+    if path:
+        with open(path, "w", encoding="utf-8") as handle:
+            json.dump({"driver": driver, "children": children}, handle, indent=2)
+    if events.json_mode():
+        events.emit("resources", driver=driver, children=children)
+        return
+    if not events.text_enabled():
+        return
+
+    print("\n🧠 Resource usage")
+    print(f"   {'stage':<28} {'cmd':<12} {'target':<28} {'peak MB':>9} {'cpu s':>8} {'wall s':>8}")
+    for record in sorted(children, key=lambda r: r["peak_rss_mb"], reverse=True):
+        print(f"   {str(record['stage'] or '-')[:28]:<28} {record['cmd'][:12]:<12} {record['target'][:28]:<28} "
+              f"{record['peak_rss_mb']:>9.1f} {record['cpu_s']:>8.2f} {record['wall_s']:>8.2f}")
+    print(f"   driver: peak {driver['peak_rss_mb']} MB, cpu {driver['cpu_s']}s, wall {driver.get('wall_s', 0)}s"
+          f" | children total cpu {driver['children_cpu_s']}s")
+    if children:
+        peak = max(children, key=lambda r: r["peak_rss_mb"])
+        print(f"   peak child: {peak['target']} ({peak['peak_rss_mb']} MB)")
+
+def configure(interval_ms):
+    global _interval, _driver
+    if not interval_ms:
+        return
+    _interval = max(1, int(interval_ms)) / 1000
+    _driver = ProcSampler(os.getpid(), _interval).start()
+    atexit.register(report)
+
+configure(os.getenv("KAORI_SAMPLE_MS"))
@@ -0,0 +1,611 @@
+#!/usr/bin/env python3
+# shard.py
+#
+# Chia job baksmali/smali của unpack/repack cho nhiều máy build (coordinator/worker).
+# Dữ liệu chuyển theo nội dung (sha256): dex gửi nguyên file, cây smali gửi dạng archive zip STORED
+# tất định (thứ tự cố định, không mtime) nên cùng nội dung luôn cùng hash. Worker giữ blob và kết quả
+# theo hash: job đã chạy (cùng tool, input, api) trả lại ngay, blob đã có thì không gửi lại.
+# Job mang sha256 của smali.jar/baksmali.jar bên gửi (nằm trong khoá job): worker có jar khác phiên bản
+# từ chối job, coordinator bỏ worker đó thay vì nhận dex/smali của tool khác.
+# Hai kiểu kết nối:
+#   - TCP: mỗi message là một dòng JSON, kèm `size` byte dữ liệu nếu có (has/put/run/get). Không xác thực,
+#     không mã hoá: chỉ dùng trong mạng tin cậy; worker mặc định chỉ nghe 127.0.0.1
+#   - thư mục dùng chung: blob trong <dir>/blobs, job ghi vào <dir>/jobs, worker nhận job bằng rename
+#     sang <dir>/running rồi ghi kết quả vào <dir>/done. Worker giữ heartbeat <dir>/workers/<id> (mtime);
+#     không còn heartbeat mới thì mọi slot chuyển về chạy local ngay. Job trong running của worker đã
+#     mất heartbeat được trả lại jobs, job/kết quả quá KAORI_SHARD_TIMEOUT không ai nhận bị xoá
+#   python shard.py worker --listen :7878            worker TCP trên 127.0.0.1 (chạy trong thư mục có smali.jar/baksmali.jar)
+#   python shard.py worker --listen 0.0.0.0:7878     ... nhận kết nối từ máy khác (chỉ trong mạng tin cậy)
+#   python shard.py worker --dir /mnt/kaori-shard    worker qua thư mục dùng chung
+#   KAORI_SHARD=host1:7878,host2:7878                unpack/repack gửi job tới các worker TCP
+#   KAORI_SHARD=dir:/mnt/kaori-shard                 ... qua thư mục dùng chung
+#   KAORI_SHARD_SLOTS=N                              số job gửi đồng thời ở chế độ thư mục (mặc định 8)
+#   KAORI_SHARD_TIMEOUT=S                            thời gian chờ tối đa một job (mặc định 1800)
+#   KAORI_SHARD_MAX_BLOB=N                           worker TCP từ chối blob lớn hơn N byte (mặc định 1 GiB)
+#   KAORI_SHARD_HEARTBEAT=S                          heartbeat cũ hơn S giây coi như worker đã chết (mặc định 30)
+# Worker không kết nối được bị bỏ khỏi danh sách; hết worker thì job chạy local như cũ.
+
+import argparse
+import functools
+import json
+import os
+import queue
+import re
+import shutil
+import socket
+import socketserver
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+import zipfile
+from pathlib import Path
+
+from cache import hash_bytes, hash_file
+from utils import BAKSMALI_JAR, CACHE_DIR, SMALI_JAR, ensure_dir, log, run_java as run_local
+
+DEFAULT_PORT = 7878
+DEFAULT_SLOTS = 8
+CHUNK_SIZE = 1 << 20
+ARCHIVE_TIME = (1980, 1, 1, 0, 0, 0)
+HEARTBEAT_INTERVAL = 5
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_MAX_BLOB = 1 << 30
+HASH_RE = re.compile(r"[0-9a-f]{64}")
+TOOL_JARS = {"baksmali": BAKSMALI_JAR, "smali": SMALI_JAR}
+
+class NoWorkers(ConnectionError):
+    """Thư mục dùng chung không còn worker sống: mọi slot của nó cùng bị bỏ."""
+
+def enabled() -> bool:
+    return bool(os.getenv("KAORI_SHARD"))
+
+def timeout() -> float:
+    return float(os.getenv("KAORI_SHARD_TIMEOUT", "1800"))
+
+def heartbeat_stale() -> float:
+    return float(os.getenv("KAORI_SHARD_HEARTBEAT", "30"))
+
+def max_blob() -> int:
+    return int(os.getenv("KAORI_SHARD_MAX_BLOB", DEFAULT_MAX_BLOB))
+
+@functools.lru_cache(maxsize=None)
+def _jar_hash(path: Path, mtime_ns: int, size: int) -> str:
+    return hash_file(path)
+
+def tool_hash(jar: Path):
+    """sha256 của tool jar (cache theo mtime/size), None nếu không có jar."""
+    try:
+        st = os.stat(jar)
+    except OSError:
+        return None
+    return _jar_hash(Path(jar), st.st_mtime_ns, st.st_size)
+
+def tool_hashes() -> dict:
+    return {tool: tool_hash(jar) for tool, jar in TOOL_JARS.items()}
+
+def pack_tree(root: Path, archive: Path):
+    """Archive tất định của cây thư mục (để hash theo nội dung)."""
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames.sort()
+            for name in sorted(filenames):
+                file_path = Path(dirpath) / name
+                info = zipfile.ZipInfo(file_path.relative_to(root).as_posix(), ARCHIVE_TIME)
+                with open(file_path, "rb") as src, zf.open(info, "w") as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+def unpack_tree(archive: Path, root: Path):
+    ensure_dir(root)
+    with zipfile.ZipFile(archive) as zf:
+        zf.extractall(root)
+
+class BlobStore:
+    """Blob theo sha256 (<root>/blobs/ab/<hash>) và kết quả job (<root>/results/<khoá job>)."""
+
+    def __init__(self, root: Path):
+        self.root = root
+
+    def path(self, digest: str) -> Path:
+        return self.root / "blobs" / digest[:2] / digest
+
+    def has(self, digest: str) -> bool:
+        return self.path(digest).is_file()
+
+    def _commit(self, tmp: Path, digest: str) -> str:
+        dest = self.path(digest)
+        ensure_dir(dest.parent)
+        os.replace(tmp, dest)
+        return digest
+
+    def put_file(self, src: Path) -> str:
+        digest = hash_file(src)
+        if not self.has(digest):
+            tmp = self.temp_path()
+            shutil.copyfile(src, tmp)
+            self._commit(tmp, digest)
+        return digest
+
+    def put_tree(self, root: Path) -> str:
+        tmp = self.temp_path()
+        pack_tree(root, tmp)
+        digest = hash_file(tmp)
+        if self.has(digest):
+            tmp.unlink()
+            return digest
+        return self._commit(tmp, digest)
+
+    def put_stream(self, stream, size: int, digest: str) -> bool:
+        """Nhận `size` byte từ stream; chỉ giữ lại nếu đúng hash."""
+        tmp = self.temp_path()
+        with open(tmp, "wb") as dst:
+            _copy_exact(stream, dst, size)
+        if hash_file(tmp) != digest:
+            tmp.unlink()
+            return False
+        self._commit(tmp, digest)
+        return True
+
+    def temp_path(self) -> Path:
+        ensure_dir(self.root / "tmp")
+        return self.root / "tmp" / uuid.uuid4().hex
+
+    def result(self, key: str):
+        try:
+            return json.loads((self.root / "results" / key).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def save_result(self, key: str, result: dict):
+        ensure_dir(self.root / "results")
+        tmp = self.temp_path()
+        tmp.write_text(json.dumps(result), encoding="utf-8")
+        os.replace(tmp, self.root / "results" / key)
+
+def _copy_exact(src, dst, size: int):
+    left = size
+    while left:
+        chunk = src.read(min(CHUNK_SIZE, left))
+        if not chunk:
+            raise ConnectionError("kết nối đóng giữa chừng")
+        dst.write(chunk)
+        left -= len(chunk)
+
+def job_key(job: dict) -> str:
+    return hash_bytes(json.dumps(job, sort_keys=True).encode())
+
+def rejection(job: dict):
+    """Lý do worker không nhận job (tool lạ hoặc jar khác phiên bản bên gửi), None nếu nhận được."""
+    if job.get("tool") not in TOOL_JARS:
+        return f"tool không hỗ trợ: {job.get('tool')}"
+    if not HASH_RE.fullmatch(str(job.get("input"))):
+        return "hash input không hợp lệ"
+    local = tool_hash(TOOL_JARS[job["tool"]])
+    if local != job.get("tool_hash"):
+        return f"{job['tool']} khác phiên bản (worker {(local or 'không có jar')[:12]}, job {str(job.get('tool_hash'))[:12]})"
+    return None
+
+def execute(store: BlobStore, job: dict) -> dict:
+    """
+    Chạy một job trên worker. Trả về {"returncode", "output" (hash) hoặc "stderr"};
+    job bị từ chối có thêm "rejected" (không được cache).
+    """
+    reason = rejection(job)
+    if reason:
+        return {"returncode": 2, "stderr": reason, "rejected": True}
+    key = job_key(job)
+    done = store.result(key)
+    if done:
+        return {**done, "cached": True}
+    ensure_dir(store.root / "tmp")
+    with tempfile.TemporaryDirectory(dir=store.root / "tmp") as tmp:
+        tmp = Path(tmp)
+        if job["tool"] == "baksmali":
+            dex = tmp / "classes.dex"
+            shutil.copyfile(store.path(job["input"]), dex)
+            out = tmp / "smali"
+            res = run_local(BAKSMALI_JAR, ["d", dex, "-o", out], capture_output=True, text=True)
+            output = store.put_tree(out) if res.returncode == 0 else None
+        elif job["tool"] == "smali":
+            src = tmp / "smali"
+            unpack_tree(store.path(job["input"]), src)
+            out = tmp / "classes.dex"
+            res = run_local(SMALI_JAR, ["a", src, "-o", out, "--api", job["api"]], capture_output=True, text=True)
+            output = store.put_file(out) if res.returncode == 0 else None
+    if output is None:
+        return {"returncode": res.returncode or 1, "stderr": res.stderr}
+    result = {"returncode": 0, "output": output}
+    store.save_result(key, result)
+    return result
+
+# --- Worker ---
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        store = self.server.store
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            request = json.loads(line)
+            op = request.get("op")
+            if op in ("has", "put", "get") and not HASH_RE.fullmatch(str(request.get("hash"))):
+                self._reply({"ok": False, "error": "hash không hợp lệ"})
+                return
+            if op == "has":
+                self._reply({"ok": True, "has": store.has(request["hash"])})
+            elif op == "put":
+                size = request.get("size")
+                if not isinstance(size, int) or not 0 <= size <= max_blob():
+                    # Dữ liệu của put đã theo sau trong stream: đóng kết nối thay vì đọc bỏ
+                    self._reply({"ok": False, "error": f"blob vượt giới hạn {max_blob()} byte"})
+                    return
+                self._reply({"ok": store.put_stream(self.rfile, size, request["hash"])})
+            elif op == "run":
+                result = execute(store, request["job"])
+                if result.get("rejected"):
+                    log(f"Từ chối job: {result['stderr']}", "WARN")
+                    self._reply({"ok": False, "error": result["stderr"]})
+                    continue
+                if not result.get("cached"):
+                    log(f"{request['job']['tool']} {request['job']['input'][:12]} -> rc {result['returncode']}", "INFO")
+                self._reply({"ok": True, **result})
+            elif op == "get":
+                path = store.path(request["hash"])
+                if not path.is_file():
+                    self._reply({"ok": False, "error": "không có blob"})
+                    continue
+                self._reply({"ok": True, "size": path.stat().st_size})
+                with open(path, "rb") as src:
+                    shutil.copyfileobj(src, self.wfile, CHUNK_SIZE)
+                self.wfile.flush()
+            else:
+                self._reply({"ok": False, "error": f"op không hợp lệ: {op}"})
+
+    def _reply(self, message: dict):
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+class WorkerServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, store: BlobStore):
+        super().__init__(address, _Handler)
+        self.store = store
+
+def live_workers(shared: Path) -> dict:
+    """{id: hash tool jar} của các worker thư mục có heartbeat mới hơn heartbeat_stale()."""
+    cutoff = time.time() - heartbeat_stale()
+    live = {}
+    for beat in (shared / "workers").glob("*"):
+        try:
+            if beat.stat().st_mtime >= cutoff:
+                live[beat.name] = json.loads(beat.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+    return live
+
+def recover(shared: Path) -> int:
+    """
+    Trả job trong running của worker đã mất heartbeat về jobs; xoá job và kết quả cũ hơn timeout()
+    (coordinator đã bỏ cuộc hoặc đã chết). Trả về số job được trả lại.
+    """
+    live = live_workers(shared)
+    requeued = 0
+    for job_file in (shared / "running").glob("*.json"):
+        # <job_id>.<worker_id>.json: job_id là uuid hex, worker_id có thể chứa dấu chấm
+        job_id, _, worker_id = job_file.stem.partition(".")
+        if worker_id in live:
+            continue
+        try:
+            os.rename(job_file, shared / "jobs" / f"{job_id}.json")
+        except OSError:
+            continue
+        requeued += 1
+    cutoff = time.time() - timeout()
+    for name in ("jobs", "done"):
+        for stale in (shared / name).glob("*.json"):
+            try:
+                if stale.stat().st_mtime < cutoff:
+                    stale.unlink()
+            except OSError:
+                continue
+    return requeued
+
+def _write_beat(path: Path):
+    tmp = path.with_name(f".{path.name}.tmp")
+    tmp.write_text(json.dumps(tool_hashes()), encoding="utf-8")
+    os.replace(tmp, path)
+
+def _beat(path: Path, stop: threading.Event):
+    while not stop.wait(HEARTBEAT_INTERVAL):
+        _write_beat(path)
+
+def serve_dir(shared: Path, poll=0.2):
+    """Worker thư mục dùng chung: nhận job bằng rename (chỉ một worker rename được)."""
+    store = BlobStore(shared)
+    jobs, running, done, workers = (shared / name for name in ("jobs", "running", "done", "workers"))
+    for directory in (jobs, running, done, workers):
+        ensure_dir(directory)
+    worker_id = f"{socket.gethostname()}.{os.getpid()}"
+    # Heartbeat chạy riêng một thread để job smali dài không làm worker trông như đã chết
+    beat = workers / worker_id
+    _write_beat(beat)
+    stop = threading.Event()
+    threading.Thread(target=_beat, args=(beat, stop), daemon=True).start()
+    try:
+        _serve_dir(store, shared, worker_id, poll)
+    finally:
+        stop.set()
+        beat.unlink(missing_ok=True)
+
+def _serve_dir(store: BlobStore, shared: Path, worker_id: str, poll: float):
+    jobs, running, done = (shared / name for name in ("jobs", "running", "done"))
+    next_recover = 0
+    # Job của tool khác phiên bản: trả lại cho worker khác và không nhận lại
+    rejected = set()
+    while True:
+        if time.monotonic() >= next_recover:
+            requeued = recover(shared)
+            if requeued:
+                log(f"Trả lại {requeued} job của worker đã mất heartbeat", "WARN")
+            next_recover = time.monotonic() + HEARTBEAT_INTERVAL
+        claimed = None
+        for job_file in sorted(jobs.glob("*.json")):
+            if job_file.stem in rejected:
+                continue
+            target = running / f"{job_file.stem}.{worker_id}.json"
+            try:
+                os.rename(job_file, target)
+            except OSError:
+                continue
+            claimed = (job_file.stem, target)
+            break
+        if claimed is None:
+            time.sleep(poll)
+            continue
+        job_id, target = claimed
+        try:
+            job = json.loads(target.read_text(encoding="utf-8"))
+            reason = rejection(job)
+            if reason:
+                log(f"Từ chối job {job_id}: {reason}", "WARN")
+                rejected.add(job_id)
+                os.rename(target, jobs / f"{job_id}.json")
+                continue
+            result = execute(store, job)
+        except Exception as exc:
+            result = {"returncode": 1, "stderr": f"{worker_id}: {exc}"}
+        tmp = store.temp_path()
+        tmp.write_text(json.dumps(result), encoding="utf-8")
+        os.replace(tmp, done / f"{job_id}.json")
+        target.unlink(missing_ok=True)
+
+# --- Coordinator ---
+
+class TcpWorker:
+    def __init__(self, address: str):
+        host, _, port = address.rpartition(":")
+        self.address = (host or address, int(port) if host else DEFAULT_PORT)
+        self.name = address
+        self._sock = None
+        self._file = None
+
+    def _connect(self):
+        if self._sock is None:
+            self._sock = socket.create_connection(self.address, timeout=timeout())
+            self._file = self._sock.makefile("rwb")
+
+    def close(self):
+        if self._sock is not None:
+            self._file.close()
+            self._sock.close()
+            self._sock = self._file = None
+
+    def _call(self, message: dict, payload: Path = None) -> dict:
+        self._connect()
+        self._file.write(json.dumps(message).encode() + b"\n")
+        if payload is not None:
+            with open(payload, "rb") as src:
+                shutil.copyfileobj(src, self._file, CHUNK_SIZE)
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError(f"{self.name} đóng kết nối")
+        return json.loads(line)
+
+    def run(self, job: dict, input_path: Path, output_path: Path) -> dict:
+        if not self._call({"op": "has", "hash": job["input"]})["has"]:
+            if not self._call({"op": "put", "hash": job["input"], "size": input_path.stat().st_size}, input_path)["ok"]:
+                raise ConnectionError(f"{self.name} nhận blob sai hash")
+        result = self._call({"op": "run", "job": job})
+        if not result["ok"]:
+            raise ConnectionError(f"{self.name}: {result['error']}")
+        if result["returncode"] == 0:
+            header = self._call({"op": "get", "hash": result["output"]})
+            if not header["ok"]:
+                raise ConnectionError(f"{self.name}: {header.get('error')}")
+            with open(output_path, "wb") as dst:
+                _copy_exact(self._file, dst, header["size"])
+        return result
+
+class DirQueue:
+    def __init__(self, shared: Path):
+        self.store = BlobStore(shared)
+        self.shared = shared
+        self.name = f"dir:{shared}"
+
+    def close(self):
+        pass
+
+    def _check_workers(self, job: dict):
+        tools = live_workers(self.shared).values()
+        if not any(item.get(job["tool"]) == job["tool_hash"] for item in tools):
+            raise NoWorkers(f"không worker nào cùng phiên bản {job['tool']} có heartbeat "
+                            f"trong {heartbeat_stale():.0f}s qua")
+
+    def _abandon(self, job_id: str):
+        (self.shared / "jobs" / f"{job_id}.json").unlink(missing_ok=True)
+        for claimed in (self.shared / "running").glob(f"{job_id}.*.json"):
+            claimed.unlink(missing_ok=True)
+
+    def run(self, job: dict, input_path: Path, output_path: Path) -> dict:
+        self._check_workers(job)
+        if not self.store.has(job["input"]):
+            tmp = self.store.temp_path()
+            shutil.copyfile(input_path, tmp)
+            self.store._commit(tmp, job["input"])
+        job_id = uuid.uuid4().hex
+        jobs = self.shared / "jobs"
+        ensure_dir(jobs)
+        tmp = self.store.temp_path()
+        tmp.write_text(json.dumps(job), encoding="utf-8")
+        os.replace(tmp, jobs / f"{job_id}.json")
+        done = self.shared / "done" / f"{job_id}.json"
+        deadline = time.monotonic() + timeout()
+        next_check = time.monotonic() + HEARTBEAT_INTERVAL
+        while not done.exists():
+            now = time.monotonic()
+            if now > deadline:
+                self._abandon(job_id)
+                raise TimeoutError(f"không worker nào xong job {job_id} trong {timeout():.0f}s")
+            if now >= next_check:
+                try:
+                    self._check_workers(job)
+                except NoWorkers:
+                    self._abandon(job_id)
+                    raise
+                recover(self.shared)
+                next_check = now + HEARTBEAT_INTERVAL
+            time.sleep(0.1)
+        result = json.loads(done.read_text(encoding="utf-8"))
+        done.unlink()
+        if result["returncode"] == 0:
+            shutil.copyfile(self.store.path(result["output"]), output_path)
+        return result
+
+class Coordinator:
+    """Phân job cho các worker rảnh; worker lỗi kết nối bị bỏ, hết worker thì trả None (chạy local)."""
+
+    def __init__(self, spec: str):
+        self._free = queue.Queue()
+        self._lock = threading.Lock()
+        self.alive = 0
+        if spec.startswith("dir:"):
+            shared = Path(spec[len("dir:"):])
+            for _ in range(int(os.getenv("KAORI_SHARD_SLOTS", DEFAULT_SLOTS))):
+                self._add(DirQueue(shared))
+        else:
+            for address in filter(None, (item.strip() for item in spec.split(","))):
+                self._add(TcpWorker(address))
+        self.slots = self.alive
+
+    def _add(self, worker):
+        self._free.put(worker)
+        self.alive += 1
+
+    def run(self, job: dict, input_path: Path, output_path: Path):
+        while True:
+            with self._lock:
+                if not self.alive:
+                    return None
+            try:
+                worker = self._free.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                result = worker.run(job, input_path, output_path)
+            except NoWorkers as exc:
+                # Các slot còn lại cùng thư mục sẽ chờ vô ích: bỏ hết một lần, không đợi từng slot hết giờ
+                worker.close()
+                with self._lock:
+                    dropped, self.alive = self.alive, 0
+                if dropped:
+                    log(f"Bỏ {dropped} slot {worker.name}: {exc}", "WARN")
+                continue
+            except (OSError, ValueError) as exc:
+                worker.close()
+                with self._lock:
+                    self.alive = max(0, self.alive - 1)
+                log(f"Bỏ worker {worker.name}: {exc}", "WARN")
+                continue
+            self._free.put(worker)
+            return result
+
+_coordinator = None
+_coordinator_lock = threading.Lock()
+
+def coordinator():
+    global _coordinator
+    with _coordinator_lock:
+        if _coordinator is None and enabled():
+            _coordinator = Coordinator(os.environ["KAORI_SHARD"])
+        return _coordinator
+
+def parallel() -> int:
+    """Số job dex nên chạy đồng thời: số worker khi bật shard, 1 khi chạy local."""
+    pool = coordinator()
+    return max(1, pool.alive) if pool else 1
+
+def run_java(jar: Path, args, **kwargs):
+    """
+    Như utils.run_java cho `baksmali d <dex> -o <dir>` và `smali a <dir> -o <dex> --api N`,
+    nhưng chạy trên worker. Lệnh khác hoặc không còn worker thì chạy local.
+    """
+    pool = coordinator()
+    command, source, _, dest = (list(args) + [None] * 4)[:4]
+    if pool is None or command not in ("d", "a"):
+        return run_local(jar, args, **kwargs)
+    source, dest = Path(source), Path(dest)
+    cmd = [Path(jar).name, *[str(arg) for arg in args]]
+    with tempfile.TemporaryDirectory(dir=dest.parent) as tmp:
+        tmp = Path(tmp)
+        if command == "d":
+            job = {"tool": "baksmali", "tool_hash": tool_hash(jar), "input": hash_file(source)}
+            input_path, output_path = source, tmp / "smali.zip"
+        else:
+            input_path = tmp / "smali.zip"
+            pack_tree(source, input_path)
+            job = {"tool": "smali", "tool_hash": tool_hash(jar), "input": hash_file(input_path),
+                   "api": str(args[args.index("--api") + 1])}
+            output_path = dest
+        result = pool.run(job, input_path, output_path)
+        if result is None:
+            return run_local(jar, args, **kwargs)
+        if result["returncode"] == 0 and command == "d":
+            unpack_tree(output_path, dest)
+    completed = subprocess.CompletedProcess(cmd, result["returncode"], "", result.get("stderr", ""))
+    if kwargs.get("check"):
+        completed.check_returncode()
+    return completed
+
+def main():
+    parser = argparse.ArgumentParser(description="Worker baksmali/smali cho build phân tán")
+    sub = parser.add_subparsers(dest="command", required=True)
+    worker = sub.add_parser("worker")
+    group = worker.add_mutually_exclusive_group(required=True)
+    group.add_argument("--listen", metavar="[HOST]:PORT", help=f"Mặc định HOST là {DEFAULT_HOST}; "
+                       "giao thức không xác thực, chỉ nghe địa chỉ khác trong mạng tin cậy")
+    group.add_argument("--dir", type=Path, metavar="SHARED_DIR")
+    worker.add_argument("--store", type=Path, default=CACHE_DIR / "shard", help="Nơi giữ blob của worker TCP")
+    args = parser.parse_args()
+
+    try:
+        if args.dir:
+            log(f"Worker nhận job từ {args.dir}", "PROCESS")
+            serve_dir(args.dir)
+        else:
+            host, _, port = args.listen.rpartition(":")
+            host = host or DEFAULT_HOST
+            with WorkerServer((host, int(port)), BlobStore(args.store)) as server:
+                log(f"Worker nghe tại {host}:{port} (blob: {args.store})", "PROCESS")
+                if host != DEFAULT_HOST:
+                    log("Kết nối TCP không xác thực: chỉ mở worker trong mạng tin cậy", "WARN")
+                server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+# shrink.py
+#
+# Tree shaking payload kaorios: chỉ giữ class/method với tới được từ các entry point mà patcher thật sự
+# chèn vào framework (vd. hook keystore tắt thì ToolboxUtils->KaoriosKeybox và mọi thứ chỉ nó dùng bị bỏ).
+# Entry point = tham chiếu tới package payload trong các file smali đã vá. Với tới được tính trên smali:
+# class được tham chiếu (kiểu, field, method, super/interface) thì giữ file và <clinit>; method được gọi
+# thì giữ cùng các override trong class con đã giữ (CHA). Class có supertype ngoài payload (InputStream,
+# Enumeration...) giữ nguyên mọi method vì framework có thể gọi/reflect vào; class chỉ kế thừa Object
+# thì giữ thêm các override của Object. Payload không dùng reflection theo tên nên không cần keep rule.
+# Class con nhận lời gọi virtual/interface mà không tự khai báo method thì giữ bản kế thừa từ superclass.
+# Entry point gọi method không có trong payload (patcher và payload lệch phiên bản) thì không shrink.
+#   python shrink.py <thư mục payload> <file smali đã vá ...>   chỉ báo cáo, không sửa file
+#   KAORI_SHRINK=1                                              bật khi patch (mặc định tắt: ship nguyên payload)
+
+import os
+import re
+import sys
+from collections import deque
+from pathlib import Path
+
+from profiling import span
+from utils import log
+
+METHOD_REF_RE = re.compile(r"(L[^;\s]+;)->([^\s(:]+\([^)\s]*\)\S+)")
+TYPE_RE = re.compile(r"L[^;\s(]+;")
+OBJECT = "Ljava/lang/Object;"
+OBJECT_METHODS = {
+    "toString()Ljava/lang/String;",
+    "equals(Ljava/lang/Object;)Z",
+    "hashCode()I",
+    "finalize()V",
+    "clone()Ljava/lang/Object;",
+}
+
+def enabled() -> bool:
+    return os.getenv("KAORI_SHRINK", "0") == "1"
+
+class SmaliClass:
+    """Một file smali của payload: supertype, method và tham chiếu của từng method."""
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.lines = path.read_text(encoding="utf-8").splitlines(True)
+        self.descriptor = None
+        self.superclass = None
+        self.supers = []
+        self.refs = set()       # kiểu tham chiếu ngoài method (field, annotation...)
+        self.methods = {}       # chữ ký -> (dòng bắt đầu, dòng kết thúc, direct?)
+        self.method_types = {}
+        self.method_calls = {}
+        signature = None
+        for n, line in enumerate(self.lines):
+            stripped = line.strip()
+            if signature is None:
+                if stripped.startswith(".method"):
+                    words = stripped.split()
+                    signature, start = words[-1], n
+                    direct = "static" in words or "private" in words or "constructor" in words
+                    self.method_types[signature] = set()
+                    self.method_calls[signature] = set()
+                    continue
+                if stripped.startswith(".class"):
+                    self.descriptor = stripped.split()[-1]
+                elif stripped.startswith((".super", ".implements")):
+                    self.supers.append(stripped.split()[-1])
+                    if stripped.startswith(".super"):
+                        self.superclass = self.supers[-1]
+                elif not stripped.startswith("#"):
+                    self.refs.update(TYPE_RE.findall(stripped))
+            elif stripped == ".end method":
+                self.methods[signature] = (start, n, direct)
+                signature = None
+            elif stripped and not stripped.startswith("#"):
+                self.method_types[signature].update(TYPE_RE.findall(stripped))
+                self.method_calls[signature].update(METHOD_REF_RE.findall(stripped))
+
+    def is_direct(self, signature) -> bool:
+        return self.methods[signature][2]
+
+    def without(self, signatures) -> str:
+        """Nội dung file sau khi bỏ các method (kèm một dòng trống ngay sau mỗi method)."""
+        drop = set()
+        for signature in signatures:
+            start, end, _ = self.methods[signature]
+            if end + 1 < len(self.lines) and not self.lines[end + 1].strip():
+                end += 1
+            drop.update(range(start, end + 1))
+        return "".join(line for n, line in enumerate(self.lines) if n not in drop)
+
+class Shrinker:
+    def __init__(self, payload_dir: Path):
+        self.payload_dir = payload_dir
+        self.classes = {}
+        for path in sorted(payload_dir.rglob("*.smali")):
+            cls = SmaliClass(path)
+            if cls.descriptor:
+                self.classes[cls.descriptor] = cls
+        self.subclasses = {}
+        for cls in self.classes.values():
+            for parent in cls.supers:
+                self.subclasses.setdefault(parent, []).append(cls.descriptor)
+        self.reached = set()
+        self.kept = set()       # (class, chữ ký) method được giữ
+        self.dispatched = {}    # class -> chữ ký có thể là đích của lời gọi virtual/interface
+        self.unresolved = []    # (class, chữ ký) entry point không khai báo trong payload
+        self._called = set()
+        self._queue = deque()
+
+    def ancestors(self, descriptor) -> set:
+        """Mọi supertype (bắc cầu), kể cả supertype ngoài payload."""
+        seen = set()
+        stack = list(self.classes[descriptor].supers) if descriptor in self.classes else []
+        while stack:
+            parent = stack.pop()
+            if parent not in seen:
+                seen.add(parent)
+                stack.extend(self.classes[parent].supers if parent in self.classes else ())
+        return seen
+
+    def external(self, descriptor) -> bool:
+        return any(parent not in self.classes and parent != OBJECT for parent in self.ancestors(descriptor))
+
+    def resolves(self, descriptor, signature) -> bool:
+        """Method có khai báo ở class hoặc supertype trong payload (hay có thể kế thừa từ ngoài payload)."""
+        if self.external(descriptor) or signature in OBJECT_METHODS:
+            return True
+        return any(signature in self.classes[owner].methods
+                   for owner in {descriptor, *self.ancestors(descriptor)} if owner in self.classes)
+
+    def entry_points(self, texts) -> int:
+        """Đưa các tham chiếu tới payload trong các file đã vá vào hàng đợi. Trả về số entry point."""
+        count = 0
+        for text in texts:
+            for descriptor in set(TYPE_RE.findall(text)):
+                if descriptor in self.classes:
+                    self._queue.append(("class", descriptor))
+                    count += 1
+            for descriptor, signature in set(METHOD_REF_RE.findall(text)):
+                if descriptor in self.classes:
+                    if not self.resolves(descriptor, signature):
+                        self.unresolved.append((descriptor, signature))
+                    self._queue.append(("call", (descriptor, signature)))
+                    count += 1
+        return count
+
+    def run(self):
+        while self._queue:
+            kind, item = self._queue.popleft()
+            if kind == "class":
+                self._reach_class(item)
+            else:
+                self._reach_call(*item)
+
+    def _keep(self, descriptor, signature):
+        if (descriptor, signature) in self.kept:
+            return
+        self.kept.add((descriptor, signature))
+        cls = self.classes[descriptor]
+        self._queue.extend(("class", ref) for ref in sorted(cls.method_types[signature]))
+        self._queue.extend(("call", ref) for ref in sorted(cls.method_calls[signature]))
+
+    def _reach_class(self, descriptor):
+        cls = self.classes.get(descriptor)
+        if cls is None or descriptor in self.reached:
+            return
+        self.reached.add(descriptor)
+        self._queue.extend(("class", ref) for ref in cls.supers + sorted(cls.refs))
+        keep_all = self.external(descriptor)
+        dispatched = self.dispatched.get(descriptor, set())
+        for signature in cls.methods:
+            if keep_all or signature.startswith("<clinit>("):
+                self._keep(descriptor, signature)
+            elif not cls.is_direct(signature) and (signature in OBJECT_METHODS or signature in dispatched):
+                self._keep(descriptor, signature)
+        for signature in sorted(dispatched - cls.methods.keys()):
+            self._inherit(descriptor, signature)
+
+    def _reach_call(self, descriptor, signature):
+        cls = self.classes.get(descriptor)
+        if cls is None or (descriptor, signature) in self._called:
+            return
+        self._called.add((descriptor, signature))
+        self._reach_class(descriptor)
+        if signature in cls.methods:
+            self._keep(descriptor, signature)
+            if cls.is_direct(signature):
+                return
+        else:
+            # Method kế thừa: giữ bản khai báo ở supertype trong payload
+            self._queue.extend(("call", (parent, signature)) for parent in cls.supers)
+        self._dispatch(descriptor, signature)
+
+    def _dispatch(self, descriptor, signature):
+        """Đánh dấu chữ ký trên cả cây class con; override trong class con đã với tới được giữ ngay."""
+        if signature in self.dispatched.get(descriptor, ()):
+            return
+        self.dispatched.setdefault(descriptor, set()).add(signature)
+        for child in self.subclasses.get(descriptor, ()):
+            cls = self.classes[child]
+            if child in self.reached:
+                if signature not in cls.methods:
+                    self._inherit(child, signature)
+                elif not cls.is_direct(signature):
+                    self._keep(child, signature)
+            self._dispatch(child, signature)
+
+    def _inherit(self, descriptor, signature):
+        """
+        Class nhận lời gọi virtual/interface nhưng không khai báo method: giữ bản gần nhất theo chuỗi superclass
+        (vd. Impl extends Base implements Iface, Base.run() là bản thực thi Iface.run()).
+        """
+        parent = self.classes[descriptor].superclass
+        while parent in self.classes:
+            cls = self.classes[parent]
+            if signature in cls.methods and not cls.is_direct(signature):
+                self._reach_class(parent)
+                self._keep(parent, signature)
+                return
+            parent = cls.superclass
+
+    def result(self) -> dict:
+        """{"drop": [class], "trim": {class: [chữ ký]}} sau run()."""
+        drop, trim = [], {}
+        for descriptor, cls in self.classes.items():
+            if descriptor not in self.reached:
+                drop.append(descriptor)
+                continue
+            unused = [sig for sig in cls.methods if (descriptor, sig) not in self.kept]
+            if unused:
+                trim[descriptor] = unused
+        return {"drop": drop, "trim": trim}
+
+def shrink(payload_dir: Path, patched_files, apply=True):
+    """
+    Bỏ class/method payload không với tới được từ các file đã vá. Trả về thống kê,
+    None nếu không tìm thấy entry point nào (payload giữ nguyên).
+    """
+    with span("shrink", "patch", payload=payload_dir.name) as sp:
+        shrinker = Shrinker(payload_dir)
+        texts = [Path(path).read_text(encoding="utf-8", errors="ignore") for path in patched_files]
+        if not shrinker.entry_points(texts):
+            log(f"Không có file nào tham chiếu tới payload {payload_dir.name}, giữ nguyên", "WARN")
+            return None
+        if shrinker.unresolved:
+            missing = ", ".join(f"{descriptor}->{signature}" for descriptor, signature in shrinker.unresolved[:3])
+            log(f"Entry point không có trong payload {payload_dir.name} ({missing}), giữ nguyên", "WARN")
+            return None
+        shrinker.run()
+        result = shrinker.result()
+        before = sum(cls.path.stat().st_size for cls in shrinker.classes.values())
+        removed = 0
+        for descriptor in result["drop"]:
+            path = shrinker.classes[descriptor].path
+            removed += path.stat().st_size
+            if apply:
+                path.unlink()
+        for descriptor, signatures in result["trim"].items():
+            cls = shrinker.classes[descriptor]
+            text = cls.without(signatures).encode("utf-8")
+            removed += cls.path.stat().st_size - len(text)
+            if apply:
+                cls.path.write_bytes(text)
+        stats = {
+            "classes": len(shrinker.classes),
+            "kept": len(shrinker.reached),
+            "methods_removed": sum(len(signatures) for signatures in result["trim"].values()),
+            "bytes": before,
+            "bytes_removed": removed,
+        }
+        sp.set(**stats)
+    log(
+        f"Shrink {payload_dir.name}: giữ {stats['kept']}/{stats['classes']} class, "
+        f"bỏ {stats['methods_removed']} method, {before // 1024} KB -> {(before - removed) // 1024} KB",
+        "INFO",
+    )
+    return {**stats, **result}
+
+def main():
+    if len(sys.argv) < 3:
+        log("Cách dùng: python shrink.py <thư mục payload> <file smali đã vá ...>", "ERROR")
+        raise SystemExit(1)
+    result = shrink(Path(sys.argv[1]), sys.argv[2:], apply=False)
+    if result is None:
+        raise SystemExit(1)
+    for descriptor in result["drop"]:
+        print(f"  - {descriptor}")
+    for descriptor, signatures in result["trim"].items():
+        for signature in signatures:
+            print(f"  ~ {descriptor}->{signature}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# smali_store.py
+#
+# Workspace smali đóng gói (bật bằng KAORI_SMALI_STORE=packed).
+# Sau khi decompile, cây smali của mỗi dex được gom vào một container
+# <unpack_dir>/.kaori/store/classesN.zip (STORED, central directory làm index theo đường dẫn class)
+# thay vì để hàng trăm nghìn file nhỏ trên đĩa. File chỉ được bung ra khi cần:
+#   - patcher: ensure(path) bung đúng file đó vào smali_classesN/
+#   - repack: dex nào có thư mục smali_classesN (đã bị đụng tới) thì bung phần còn lại rồi assemble;
+#     dex không bị đụng tới giữ nguyên classesN.dex gốc, không cần smali.
+
+import os
+import shutil
+import zipfile
+from pathlib import Path
+from pristine import mark_dirty
+from utils import META_DIR
+
+STORE_NAME = "store"
+
+def enabled() -> bool:
+    return os.getenv("KAORI_SMALI_STORE", "") == "packed"
+
+def store_dir(unpack_root: Path) -> Path:
+    return unpack_root / META_DIR / STORE_NAME
+
+def container_path(unpack_root: Path, dex_stem: str) -> Path:
+    return store_dir(unpack_root) / f"{dex_stem}.zip"
+
+def descriptor_to_path(descriptor: str) -> str:
+    """Landroid/app/Foo; -> android/app/Foo.smali"""
+    return descriptor[1:-1] + ".smali"
+
+class SmaliStore:
+    """Đọc ngẫu nhiên một container theo class descriptor hoặc đường dẫn tương đối."""
+
+    def __init__(self, container: Path):
+        self.container = container
+        self.zf = zipfile.ZipFile(container, "r")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.zf.close()
+
+    def names(self):
+        return self.zf.namelist()
+
+    def has(self, rel: str) -> bool:
+        return rel in self.zf.NameToInfo
+
+    def read(self, descriptor: str) -> str:
+        return self.zf.read(descriptor_to_path(descriptor)).decode("utf-8")
+
+    def extract(self, rel: str, smali_dir: Path) -> Path:
+        dest = smali_dir.joinpath(*rel.split("/"))
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        with self.zf.open(rel) as src, open(dest, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        return dest
+
+def pack(smali_dir: Path, container: Path) -> int:
+    """Gom cây smali vào container (ghi file tạm rồi rename). Trả về số file."""
+    container.parent.mkdir(parents=True, exist_ok=True)
+    tmp = container.with_suffix(f".{os.getpid()}.tmp")
+    count = 0
+    with zipfile.ZipFile(tmp, "w", zipfile.ZIP_STORED) as zf:
+        for root, dirs, files in os.walk(smali_dir):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = Path(root) / name
+                zf.write(file_path, file_path.relative_to(smali_dir).as_posix())
+                count += 1
+    os.replace(tmp, container)
+    return count
+
+def _locate(path: Path):
+    """(container, đường dẫn trong container) cho một file trong smali_classesN/, hoặc None."""
+    for smali_dir in path.parents:
+        if smali_dir.name.startswith("smali_classes"):
+            container = container_path(smali_dir.parent, smali_dir.name[len("smali_"):])
+            if container.is_file():
+                return container, path.relative_to(smali_dir).as_posix()
+            return None
+    return None
+
+def ensure(path: Path) -> bool:
+    """Như path.exists(), nhưng bung file từ container nếu nó chưa có trên đĩa."""
+    if path.exists():
+        return True
+    located = _locate(path)
+    if not located:
+        return False
+    container, rel = located
+    with SmaliStore(container) as store:
+        if not store.has(rel):
+            return False
+        store.extract(rel, path.parents[len(rel.split("/")) - 1])
+    # File bung ra không có trong bản gốc: reset sẽ xoá để dex trở lại trạng thái chưa đụng tới
+    mark_dirty(path)
+    return True
+
+def find_class(unpack_root: Path, descriptor: str):
+    """Tìm dex chứa class: trả về tên thư mục smali_classesN hoặc None."""
+    rel = descriptor_to_path(descriptor)
+    for smali_dir in sorted(unpack_root.glob("smali_classes*")):
+        if (smali_dir / rel).exists():
+            return smali_dir.name
+    root = store_dir(unpack_root)
+    for container in sorted(root.glob("*.zip")) if root.is_dir() else []:
+        with SmaliStore(container) as store:
+            if store.has(rel):
+                return f"smali_{container.stem}"
+    return None
+
+def prepare_assembly(unpack_root: Path) -> int:
+    """
+    Bung phần còn lại của các dex đã bị đụng tới để assemble đầy đủ.
+    Dex không có thư mục smali_classesN được giữ nguyên. Trả về số file đã bung.
+    """
+    root = store_dir(unpack_root)
+    if not root.is_dir():
+        return 0
+    count = 0
+    for container in sorted(root.glob("*.zip")):
+        smali_dir = unpack_root / f"smali_{container.stem}"
+        if not smali_dir.is_dir():
+            continue
+        with SmaliStore(container) as store:
+            for rel in store.names():
+                if not smali_dir.joinpath(*rel.split("/")).exists():
+                    store.extract(rel, smali_dir)
+                    count += 1
+    return count
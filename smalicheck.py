@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# smalicheck.py
+#
+# Kiểm tra tĩnh các method smali bị patch trước khi assemble: số register, register tham số,
+# kiểu giá trị truyền vào invoke/return, move-result khớp kiểu trả về của lệnh invoke trước đó.
+# Lỗi loại này smali vẫn assemble được nhưng máy chạy sẽ VerifyError (bootloop), nên bắt sớm ở bước patch.
+# Phân tích tuyến tính theo dòng: sau mỗi label, register đã bị ghi trong method coi như chưa rõ kiểu
+# (không dựng CFG), nên chỉ báo lỗi khi chắc chắn.
+#   python smalicheck.py <file.smali|thư mục> ...   kiểm tra mọi method, exit 1 nếu có lỗi
+#   KAORI_SMALICHECK=0                               tắt kiểm tra ở bước patch (patchplan)
+#   KAORI_SMALICHECK=warn                            chỉ log, không hoàn tác patch lỗi
+
+import os
+import re
+import sys
+from pathlib import Path
+
+from pristine import write_patched
+from utils import log
+
+REGISTER_RE = re.compile(r"^[vp]\d+$")
+METHOD_REF_RE = re.compile(r"->([^(]+)\(([^)]*)\)(\S+)")
+TYPE_RE = re.compile(r"\[*(?:[ZBSCIFV]|[JD]|L[^;]+;)")
+SKIPPED_BLOCKS = {".annotation": ".end annotation", ".packed-switch": ".end packed-switch",
+                  ".sparse-switch": ".end sparse-switch", ".array-data": ".end array-data"}
+
+# Loại giá trị trong register
+REF, NARROW, WIDE, WIDE_HI, ZERO, UNKNOWN = "ref", "narrow", "wide", "wide-hi", "zero", None
+
+# Lệnh không ghi register đầu tiên
+NO_DEST = ("iput", "sput", "aput", "if-", "return", "throw", "monitor-", "packed-switch",
+           "sparse-switch", "fill-array-data", "invoke-", "filled-new-array", "goto", "nop")
+
+def mode() -> str:
+    return os.getenv("KAORI_SMALICHECK", "1")
+
+def enabled() -> bool:
+    return mode() != "0"
+
+def parse_types(text: str) -> list:
+    return TYPE_RE.findall(text)
+
+def kind_of(descriptor: str):
+    if descriptor == "V":
+        return None
+    if descriptor in ("J", "D"):
+        return WIDE
+    if descriptor[0] in "L[":
+        return REF
+    return NARROW
+
+def _words(types) -> int:
+    return sum(2 if t in ("J", "D") else 1 for t in types)
+
+def _compatible(actual, expected) -> bool:
+    if actual is UNKNOWN or expected is UNKNOWN:
+        return True
+    if actual == ZERO:
+        return expected in (REF, NARROW)
+    return actual == expected
+
+def _dest_kind(op: str, stripped: str):
+    """Loại giá trị lệnh ghi vào register đầu tiên (UNKNOWN nếu không xác định được)."""
+    if op.startswith("const-wide") or op.startswith("move-wide") or op == "move-result-wide":
+        return WIDE
+    if op.startswith("const-string") or op in ("const-class", "new-instance", "new-array", "check-cast",
+                                                "move-exception", "move-result-object",
+                                                "const-method-handle", "const-method-type"):
+        return REF
+    if op.startswith("move-object"):
+        return REF
+    if op.startswith("const"):
+        # const 0 vừa là số 0 vừa là null
+        value = stripped.split(",", 1)[1].strip() if "," in stripped else ""
+        return ZERO if re.fullmatch(r"-?0x0+|0", value) else NARROW
+    if op.startswith(("iget", "sget", "aget")):
+        suffix = op.split("-", 1)[1] if "-" in op else ""
+        if suffix.startswith("wide"):
+            return WIDE
+        if suffix.startswith("object"):
+            return REF
+        return NARROW
+    if op in ("move", "move/from16", "move/16", "move-result", "instance-of", "array-length"):
+        return NARROW
+    if op.startswith("cmp"):
+        return NARROW
+    base = op.split("/", 1)[0]
+    if "-to-" in base:
+        return WIDE if base.rsplit("-to-", 1)[1] in ("long", "double") else NARROW
+    if base.endswith(("-long", "-double")):
+        return WIDE
+    if base.endswith(("-int", "-float")):
+        return NARROW
+    return UNKNOWN
+
+def _operands(stripped: str):
+    """(opcode, các register đứng đầu danh sách toán hạng)"""
+    op, _, rest = stripped.partition(" ")
+    operands = []
+    for token in (t.strip() for t in rest.split(",")):
+        if not REGISTER_RE.match(token):
+            break
+        operands.append(token)
+    return op, operands
+
+class MethodCheck:
+    """Kiểm tra một method: lines là các dòng từ .method tới .end method."""
+
+    def __init__(self, lines: list, first_line: int = 1):
+        self.lines = lines
+        self.first_line = first_line
+        self.issues = []
+        header = lines[0].split()
+        self.signature = header[-1]
+        self.static = "static" in header
+        match = re.match(r"([^(]+)\(([^)]*)\)(\S+)", self.signature)
+        self.params = ([] if self.static else ["this"]) + parse_types(match[2])
+        self.returns = match[3]
+        self.ins = _words(["L" if p == "this" else p for p in self.params])
+        self.total = None
+
+    def issue(self, level, line_no, message):
+        self.issues.append((level, self.first_line + line_no, message))
+
+    def _number(self, token) -> int:
+        number = int(token[1:])
+        return self.total - self.ins + number if token[0] == "p" else number
+
+    def register(self, token, line_no):
+        """Số register thực (vN) của token vN/pN, hoặc None nếu vượt giới hạn."""
+        number = int(token[1:])
+        if token[0] == "p":
+            if number >= self.ins:
+                self.issue("ERROR", line_no, f"{token} vượt số register tham số ({self.ins})")
+                return None
+            return self.total - self.ins + number
+        if number >= self.total:
+            self.issue("ERROR", line_no, f"{token} vượt .registers {self.total}")
+            return None
+        return number
+
+    def _initial_state(self) -> dict:
+        """{register: (loại, dòng ghi gần nhất)}; tham số được nạp sẵn từ đầu method."""
+        state = {}
+        self.param_types = {}
+        reg = self.total - self.ins
+        for param in self.params:
+            if param == "this" or param[0] in "L[":
+                state[reg] = (REF, 0)
+            elif param in ("J", "D"):
+                state[reg] = (WIDE, 0)
+                state[reg + 1] = (WIDE_HI, 0)
+                self.param_types[reg + 1] = param
+            else:
+                state[reg] = (NARROW, 0)
+            self.param_types[reg] = param
+            reg += _words([param]) if param != "this" else 1
+        return state
+
+    def _expect(self, state, reg, expected, line_no, what):
+        if reg is None:
+            return
+        actual, written = state.get(reg, (UNKNOWN, 0))
+        if not _compatible(actual, expected):
+            name = self.name(reg)
+            if written and reg in self.param_types:
+                detail = f"{name} ({self.param_types[reg]}) bị ghi đè ở dòng {self.first_line + written}"
+            else:
+                detail = f"{name} đang là {actual}"
+            self.issue("ERROR", line_no, f"{what} cần {expected}, nhưng {detail}")
+
+    def name(self, reg) -> str:
+        first_param = self.total - self.ins
+        return f"p{reg - first_param}" if reg >= first_param else f"v{reg}"
+
+    def run(self) -> list:
+        body = self.lines[1:]
+        for n, line in enumerate(body, 1):
+            stripped = line.strip()
+            if stripped.startswith(".registers"):
+                self.total = int(stripped.split()[1], 0)
+                break
+            if stripped.startswith(".locals"):
+                self.total = int(stripped.split()[1], 0) + self.ins
+                break
+        if self.total is None:
+            # abstract/native: không có code
+            return self.issues
+        if self.total < self.ins:
+            self.issue("ERROR", 0, f".registers {self.total} nhỏ hơn số register tham số ({self.ins})")
+            return self.issues
+
+        instructions = list(self._instructions(body))
+        # Register bị ghi ở bất kỳ đâu trong method: tại label (có thể nhảy tới từ phía sau) không còn chắc kiểu
+        written = set()
+        for _, stripped in instructions:
+            if stripped.startswith(":"):
+                continue
+            op, operands = _operands(stripped)
+            if operands and not op.startswith(NO_DEST) and REGISTER_RE.match(operands[0]):
+                reg = self._number(operands[0])
+                written.update((reg, reg + 1) if _dest_kind(op, stripped) == WIDE else (reg,))
+
+        state = self._initial_state()
+        last_invoke = None
+        for n, stripped in instructions:
+            if stripped.startswith(":"):
+                for reg in written:
+                    state[reg] = (UNKNOWN, 0)
+                last_invoke = None
+                continue
+            self._instruction(stripped, n, state, last_invoke)
+            last_invoke = stripped if stripped.startswith(("invoke-", "filled-new-array")) else None
+        return self.issues
+
+    def _instructions(self, body):
+        """(số dòng, lệnh hoặc label) bỏ qua directive, comment và các khối dữ liệu/annotation."""
+        skip_until = None
+        for n, line in enumerate(body, 1):
+            stripped = line.strip()
+            if skip_until:
+                if stripped.startswith(skip_until):
+                    skip_until = None
+                continue
+            if not stripped or stripped.startswith("#"):
+                continue
+            directive = stripped.split()[0]
+            if directive in SKIPPED_BLOCKS:
+                skip_until = SKIPPED_BLOCKS[directive]
+                continue
+            if not stripped.startswith("."):
+                yield n, stripped
+
+    def _instruction(self, stripped, n, state, last_invoke):
+        op, operands = _operands(stripped)
+        if op.startswith(("invoke-", "filled-new-array")):
+            self._invoke(op, stripped.partition(" ")[2], n, state)
+            return
+        regs = [self.register(token, n) for token in operands]
+
+        if op.startswith("move-result"):
+            self._move_result(op, n, last_invoke)
+        if op.startswith("return"):
+            self._return(op, regs, n, state)
+            return
+        if op.startswith(("iget", "iput", "aget", "aput")) and len(regs) >= 2:
+            self._expect(state, regs[1], REF, n, f"{op} (object/array)")
+        if op.startswith(("iput", "sput", "aput")) and regs:
+            suffix = op.split("-", 1)[1] if "-" in op else ""
+            expected = REF if suffix.startswith("object") else WIDE if suffix.startswith("wide") else NARROW
+            self._expect(state, regs[0], expected, n, f"giá trị của {op}")
+
+        if not regs or op.startswith(NO_DEST):
+            return
+        dest = regs[0]
+        if dest is None:
+            return
+        kind = _dest_kind(op, stripped)
+        if kind == WIDE and dest + 1 >= self.total:
+            self.issue("ERROR", n, f"{op} ghi cặp {operands[0]}/v{dest + 1} vượt .registers {self.total}")
+            return
+        # Ghi đè một nửa cặp wide làm hỏng cả cặp
+        if state.get(dest, (None,))[0] == WIDE_HI:
+            state[dest - 1] = (UNKNOWN, n)
+        if kind != WIDE and state.get(dest, (None,))[0] == WIDE:
+            state[dest + 1] = (UNKNOWN, n)
+        state[dest] = (kind, n)
+        if kind == WIDE:
+            if state.get(dest + 1, (None,))[0] == WIDE:
+                state[dest + 2] = (UNKNOWN, n)
+            state[dest + 1] = (WIDE_HI, n)
+
+    def _invoke(self, op, rest, n, state):
+        match = re.match(r"\{([^}]*)\},\s*(\S+)", rest)
+        if not match:
+            return
+        inner = match[1].strip()
+        if ".." in inner:
+            first, last = (t.strip() for t in inner.split(".."))
+            start, end = self.register(first, n), self.register(last, n)
+            if start is None or end is None:
+                return
+            regs = list(range(start, end + 1))
+        else:
+            tokens = [t.strip() for t in inner.split(",") if t.strip()]
+            regs = [self.register(t, n) for t in tokens]
+            if len(tokens) > 5:
+                self.issue("ERROR", n, f"{op} không-range chỉ nhận tối đa 5 register ({len(tokens)})")
+            for token, reg in zip(tokens, regs):
+                if reg is not None and reg >= 16:
+                    self.issue("ERROR", n, f"{op} không-range chỉ dùng được v0-v15 ({token} = v{reg})")
+        if op.startswith("filled-new-array") or op.startswith(("invoke-custom", "invoke-polymorphic")):
+            return
+
+        ref = METHOD_REF_RE.search(match[2])
+        if not ref:
+            return
+        owner = match[2].split("->", 1)[0]
+        expected = ([] if op.startswith("invoke-static") else [owner]) + parse_types(ref[2])
+        if len(regs) != _words(expected):
+            self.issue("ERROR", n, f"{op} truyền {len(regs)} register, {ref[1]}({ref[2]}) cần {_words(expected)}")
+            return
+        pos = 0
+        for index, descriptor in enumerate(expected):
+            self._expect(state, regs[pos], kind_of(descriptor), n, f"tham số {index} của {ref[1]}")
+            if descriptor in ("J", "D"):
+                self._expect(state, regs[pos + 1], WIDE_HI, n, f"tham số {index} của {ref[1]}")
+                pos += 2
+            else:
+                pos += 1
+
+    def _move_result(self, op, n, last_invoke):
+        if last_invoke is None:
+            self.issue("ERROR", n, f"{op} không đứng ngay sau invoke/filled-new-array")
+            return
+        if last_invoke.startswith("filled-new-array"):
+            returns = "["
+        else:
+            ref = METHOD_REF_RE.search(last_invoke)
+            if not ref:
+                return
+            returns = ref[3]
+        expected = {"move-result": NARROW, "move-result-wide": WIDE, "move-result-object": REF}.get(op)
+        actual = kind_of(returns)
+        if actual is None:
+            self.issue("ERROR", n, f"{op} sau lời gọi trả về void")
+        elif actual != expected:
+            self.issue("ERROR", n, f"{op} không khớp kiểu trả về {returns}")
+
+    def _return(self, op, regs, n, state):
+        expected = kind_of(self.returns)
+        wanted = {None: "return-void", NARROW: "return", WIDE: "return-wide", REF: "return-object"}[expected]
+        if op != wanted:
+            self.issue("ERROR", n, f"{op} trong method trả về {self.returns} (cần {wanted})")
+            return
+        if regs:
+            self._expect(state, regs[0], expected, n, op)
+            if expected == WIDE and regs[0] is not None and regs[0] + 1 >= self.total:
+                self.issue("ERROR", n, f"{op} đọc cặp register vượt .registers {self.total}")
+
+def iter_methods(text: str):
+    """(dòng .method đã strip, các dòng của method, số dòng bắt đầu)"""
+    lines = text.splitlines()
+    start = None
+    for n, line in enumerate(lines, 1):
+        stripped = line.strip()
+        if start is None and stripped.startswith(".method"):
+            start = n
+        elif start is not None and stripped == ".end method":
+            yield lines[start - 1].strip(), lines[start - 1:n], start
+            start = None
+
+def check_text(text: str, only=None) -> list:
+    """[(level, dòng, method, thông báo)] cho các method (hoặc chỉ những method có khoá trong only)."""
+    issues = []
+    for key, lines, start in iter_methods(text):
+        if only is not None and key not in only:
+            continue
+        checker = MethodCheck(lines, start)
+        for level, line_no, message in checker.run():
+            issues.append((level, line_no, checker.signature, message))
+    return issues
+
+def changed_methods(before: str, after: str) -> set:
+    old = {}
+    for key, lines, _ in iter_methods(before):
+        old.setdefault(key, lines)
+    return {key for key, lines, _ in iter_methods(after) if old.get(key) != lines}
+
+def verify_patch(file_path: Path, before: str, patch: str) -> bool:
+    """
+    Kiểm tra các method vừa bị `patch` sửa. Có lỗi: log và (trừ chế độ warn) trả file về nội dung cũ.
+    Trả về False khi patch bị hoàn tác.
+    """
+    if not enabled():
+        return True
+    after = file_path.read_text(encoding="utf-8", errors="ignore")
+    issues = check_text(after, changed_methods(before, after))
+    errors = [item for item in issues if item[0] == "ERROR"]
+    for level, line_no, method, message in issues:
+        log(f"{file_path.name}:{line_no} {method}: {message}", level,
+            file=str(file_path), method=method, line=line_no, patch=patch)
+    if errors and mode() != "warn":
+        write_patched(file_path, before)
+        log(f"Hoàn tác {patch} trên {file_path.name}: smali không qua kiểm tra register/kiểu", "ERROR",
+            file=str(file_path), patch=patch)
+        return False
+    return True
+
+def main():
+    paths = [Path(arg) for arg in sys.argv[1:]]
+    if not paths:
+        print("Usage: python smalicheck.py <file.smali|thư mục> ...")
+        sys.exit(2)
+    errors = 0
+    for path in paths:
+        files = sorted(path.rglob("*.smali")) if path.is_dir() else [path]
+        for file_path in files:
+            for level, line_no, method, message in check_text(file_path.read_text(encoding="utf-8", errors="ignore")):
+                log(f"{file_path}:{line_no} {method}: {message}", level, file=str(file_path), method=method)
+                errors += level == "ERROR"
+    sys.exit(1 if errors else 0)
+
+if __name__ == "__main__":
+    main()
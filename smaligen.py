@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+# smaligen.py
+#
+# Sinh smali giả lập (đúng cấu trúc baksmali) để benchmark các patcher
+# mà không cần ROM thật. Kích thước điều khiển bằng số method / số file.
+
+import random
+from pathlib import Path
+
+def _filler_method(index, body_lines, rng):
+    lines = [
+        f".method public filler{index}(Ljava/lang/String;I)I\n",
+        f"    .registers {6 + index % 4}\n",
+        "\n",
+        f"    .line {100 + index}\n",
+    ]
+    for n in range(body_lines):
+        kind = rng.randrange(5)
+        if kind == 0:
+            lines.append(f"    const/4 v{n % 4}, 0x{n % 8:x}\n")
+        elif kind == 1:
+            lines.append(f"    invoke-virtual {{p0, p1}}, Landroid/app/Foo{index % 17};->bar{n % 9}(Ljava/lang/String;)V\n")
+        elif kind == 2:
+            lines.append(f"    iget-object v{n % 4}, p0, Landroid/app/ApplicationPackageManager;->mField{n % 13}:Ljava/lang/Object;\n")
+        elif kind == 3:
+            lines.append(f"    if-eqz v{n % 4}, :cond_{n}\n")
+            lines.append(f"    :cond_{n}\n")
+        else:
+            lines.append("    move-result-object v1\n")
+        lines.append("\n")
+    lines.append("    return p2\n")
+    lines.append(".end method\n\n")
+    return lines
+
+def _class_header(descriptor, super_class="Ljava/lang/Object;"):
+    return [
+        f".class public L{descriptor};\n",
+        f".super {super_class}\n",
+        f'.source "{descriptor.rsplit("/", 1)[-1]}.java"\n',
+        "\n\n",
+    ]
+
+def _pad(lines, target_bytes, body_lines, rng, start=0):
+    index = start
+    size = sum(len(line) for line in lines)
+    while size < target_bytes:
+        chunk = _filler_method(index, body_lines, rng)
+        lines.extend(chunk)
+        size += sum(len(line) for line in chunk)
+        index += 1
+    return lines
+
+def application_package_manager(target_bytes=400_000, body_lines=40, seed=0) -> str:
+    rng = random.Random(seed)
+    lines = _class_header("android/app/ApplicationPackageManager", "Landroid/content/pm/PackageManager;")
+    lines += ["# static fields\n", ".field private static final TAG:Ljava/lang/String; = \"ApplicationPackageManager\"\n\n"]
+    lines += [".field private static final mHasSystemFeatureCache:Landroid/app/PropertyInvalidatedCache;\n\n\n"]
+    lines += ["# direct methods\n", ".method constructor <init>(Landroid/app/ContextImpl;Landroid/content/pm/IPackageManager;)V\n",
+              "    .registers 3\n\n", "    invoke-direct {p0}, Landroid/content/pm/PackageManager;-><init>()V\n\n",
+              "    return-void\n", ".end method\n\n\n", "# virtual methods\n"]
+    _pad(lines, target_bytes // 2, body_lines, rng)
+    lines += [
+        ".method public hasSystemFeature(Ljava/lang/String;)Z\n",
+        "    .registers 3\n\n",
+        "    const/4 v0, 0x0\n\n",
+        "    invoke-virtual {p0, p1, v0}, Landroid/app/ApplicationPackageManager;->hasSystemFeature(Ljava/lang/String;I)Z\n\n",
+        "    move-result p0\n\n",
+        "    return p0\n",
+        ".end method\n\n",
+        ".method public hasSystemFeature(Ljava/lang/String;I)Z\n",
+        "    .registers 5\n\n",
+        "    sget-object v0, Landroid/app/ApplicationPackageManager;->mHasSystemFeatureCache:Landroid/app/PropertyInvalidatedCache;\n\n",
+        "    new-instance v1, Landroid/app/ApplicationPackageManager$HasSystemFeatureQuery;\n\n",
+        "    invoke-direct {v1, p1, p2}, Landroid/app/ApplicationPackageManager$HasSystemFeatureQuery;-><init>(Ljava/lang/String;I)V\n\n",
+        "    invoke-virtual {v0, v1}, Landroid/app/PropertyInvalidatedCache;->query(Ljava/lang/Object;)Ljava/lang/Object;\n\n",
+        "    move-result-object v0\n\n",
+        "    check-cast v0, Ljava/lang/Boolean;\n\n",
+        "    invoke-virtual {v0}, Ljava/lang/Boolean;->booleanValue()Z\n\n",
+        "    move-result v0\n\n",
+        "    return v0\n",
+        ".end method\n\n",
+    ]
+    _pad(lines, target_bytes, body_lines, rng, start=100_000)
+    return "".join(lines)
+
+def instrumentation(target_bytes=120_000, body_lines=30, seed=1) -> str:
+    rng = random.Random(seed)
+    lines = _class_header("android/app/Instrumentation")
+    lines += ["# direct methods\n"]
+    lines += [
+        ".method public static whitelist newApplication(Ljava/lang/Class;Landroid/content/Context;)Landroid/app/Application;\n",
+        "    .registers 3\n\n",
+        "    invoke-virtual {p0}, Ljava/lang/Class;->newInstance()Ljava/lang/Object;\n\n",
+        "    move-result-object v0\n\n",
+        "    check-cast v0, Landroid/app/Application;\n\n",
+        "    invoke-virtual {v0, p1}, Landroid/app/Application;->attach(Landroid/content/Context;)V\n\n",
+        "    return-object v0\n",
+        ".end method\n\n",
+        "# virtual methods\n",
+    ]
+    _pad(lines, target_bytes // 2, body_lines, rng)
+    lines += [
+        ".method public whitelist newApplication(Ljava/lang/ClassLoader;Ljava/lang/String;Landroid/content/Context;)Landroid/app/Application;\n",
+        "    .registers 6\n\n",
+        "    invoke-direct {p0, p3}, Landroid/app/Instrumentation;->getFactory(Ljava/lang/String;)Landroid/app/AppComponentFactory;\n\n",
+        "    move-result-object v0\n\n",
+        "    invoke-virtual {v0, p1, p2}, Landroid/app/AppComponentFactory;->instantiateApplication(Ljava/lang/ClassLoader;Ljava/lang/String;)Landroid/app/Application;\n\n",
+        "    move-result-object v0\n\n",
+        "    invoke-virtual {v0, p3}, Landroid/app/Application;->attach(Landroid/content/Context;)V\n\n",
+        "    return-object v0\n",
+        ".end method\n\n",
+    ]
+    _pad(lines, target_bytes, body_lines, rng, start=100_000)
+    return "".join(lines)
+
+def keystore2(target_bytes=60_000, body_lines=30, seed=2) -> str:
+    rng = random.Random(seed)
+    lines = _class_header("android/security/KeyStore2") + ["# virtual methods\n"]
+    _pad(lines, target_bytes // 2, body_lines, rng)
+    lines += [
+        ".method public blacklist getKeyEntry(Landroid/system/keystore2/KeyDescriptor;)Landroid/system/keystore2/KeyEntryResponse;\n",
+        "    .registers 3\n\n",
+        "    new-instance v0, Landroid/security/KeyStore2$$ExternalSyntheticLambda5;\n\n",
+        "    invoke-direct {v0, p1}, Landroid/security/KeyStore2$$ExternalSyntheticLambda5;-><init>(Landroid/system/keystore2/KeyDescriptor;)V\n\n",
+        "    invoke-direct {p0, v0}, Landroid/security/KeyStore2;->handleRemoteExceptionWithRetry(Landroid/security/KeyStore2$CheckedRemoteRequest;)Ljava/lang/Object;\n\n",
+        "    move-result-object v0\n\n",
+        "    check-cast v0, Landroid/system/keystore2/KeyEntryResponse;\n\n",
+        "    return-object v0\n",
+        ".end method\n\n",
+    ]
+    _pad(lines, target_bytes, body_lines, rng, start=100_000)
+    return "".join(lines)
+
+def android_keystore_spi(target_bytes=80_000, body_lines=30, seed=3) -> str:
+    rng = random.Random(seed)
+    lines = _class_header("android/security/keystore2/AndroidKeyStoreSpi", "Ljava/security/KeyStoreSpi;")
+    lines += ["# virtual methods\n"]
+    _pad(lines, target_bytes // 2, body_lines, rng)
+    lines += [
+        ".method public whitelist test-api engineGetCertificateChain(Ljava/lang/String;)[Ljava/security/cert/Certificate;\n",
+        "    .registers 9\n\n",
+        "    const/4 v0, 0x0\n\n",
+        "    return-object v0\n",
+        ".end method\n\n",
+    ]
+    _pad(lines, target_bytes, body_lines, rng, start=100_000)
+    return "".join(lines)
+
+def apk_signature_verifier(target_bytes=150_000, body_lines=40, seed=4) -> str:
+    rng = random.Random(seed)
+    lines = _class_header("android/util/apk/ApkSignatureVerifier") + ["# direct methods\n"]
+    _pad(lines, target_bytes // 2, body_lines, rng)
+    lines += [
+        ".method public static getMinimumSignatureSchemeVersionForTargetSdk(I)I\n",
+        "    .registers 2\n\n",
+        "    const/16 v0, 0x1e\n\n",
+        "    if-lt p0, v0, :cond_6\n\n",
+        "    const/4 v0, 0x2\n\n",
+        "    return v0\n\n",
+        "    :cond_6\n",
+        "    const/4 v0, 0x1\n\n",
+        "    return v0\n",
+        ".end method\n\n",
+    ]
+    _pad(lines, target_bytes, body_lines, rng, start=100_000)
+    return "".join(lines)
+
+def record_class(descriptor="android/hardware/input/PhysicalKeyLayout$EnterKey", fields=4,
+                 invoke_custom_sites=3, filler_methods=4, body_lines=20, seed=5) -> str:
+    """Class kiểu Java record: equals/hashCode/toString dùng invoke-custom (ObjectMethods)."""
+    rng = random.Random(seed)
+    lines = _class_header(descriptor, "Ljava/lang/Record;")
+    lines.append("# instance fields\n")
+    for n in range(fields):
+        lines.append(f".field private final f{n}:I\n\n")
+    lines.append("\n# virtual methods\n")
+    bootstrap = (
+        "call-site-{n}(\"{name}\", MethodType(Ljava/lang/String;), \"f0;f1\", "
+        f"L{descriptor};, MethodHandle(...))@Ljava/lang/runtime/ObjectMethods;->bootstrap"
+        "(Ljava/lang/invoke/MethodHandles$Lookup;Ljava/lang/String;Ljava/lang/invoke/TypeDescriptor;"
+        "Ljava/lang/Class;Ljava/lang/String;[Ljava/lang/invoke/MethodHandle;)Ljava/lang/Object;"
+    )
+    for name, proto, ret in (
+        ("equals", "(Ljava/lang/Object;)Z", "    move-result p1\n\n    return p1\n"),
+        ("hashCode", "()I", "    move-result p0\n\n    return p0\n"),
+        ("toString", "()Ljava/lang/String;", "    move-result-object p0\n\n    return-object p0\n"),
+    ):
+        lines.append(f".method public final {name}{proto}\n    .registers 2\n\n")
+        for n in range(invoke_custom_sites):
+            lines.append(f"    invoke-custom {{p0, p1}}, {bootstrap.format(n=n, name=name)}(L{descriptor};)Ljava/lang/Object;\n\n")
+        lines.append(ret)
+        lines.append(".end method\n\n")
+    for n in range(filler_methods):
+        lines.extend(_filler_method(n, body_lines, rng))
+    return "".join(lines)
+
+PATCH_TARGETS = {
+    "ApplicationPackageManager": application_package_manager,
+    "Instrumentation": instrumentation,
+    "KeyStore2": keystore2,
+    "AndroidKeyStoreSpi": android_keystore_spi,
+    "ApkSignatureVerifier": apk_signature_verifier,
+    "RecordClass": record_class,
+}
+
+def write_tree(root: Path, files=2000, packages=40, target_bytes=4000, seed=6) -> int:
+    """Sinh cây smali_classesN giả: `files` file rải đều trên `packages` package."""
+    rng = random.Random(seed)
+    total = 0
+    for n in range(files):
+        package = f"com/android/server/pkg{n % packages}"
+        descriptor = f"{package}/Class{n}"
+        lines = _class_header(descriptor) + ["# virtual methods\n"]
+        _pad(lines, target_bytes, 12, rng)
+        text = "".join(lines)
+        path = root / f"{descriptor}.smali"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+        total += len(text)
+    return total
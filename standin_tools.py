@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# standin_tools.py
+#
+# Thay thế nhẹ cho `java -jar baksmali.jar/smali.jar` khi benchmark pipeline.
+# Dùng qua KAORI_JAVA="python3 standin_tools.py":
+#   standin_tools.py -jar baksmali.jar d <file.dex> -o <smali_dir>
+#   standin_tools.py -jar smali.jar a <smali_dir> -o <file.dex> [--api N]
+# "DEX" giả = header dex thật (magic + version) nối với một zip STORED chứa các file smali.
+# Phần phóng to (KAORI_STANDIN_PAD) là một entry STORED trong zip, bị bỏ qua khi disassemble.
+# Điều chỉnh bằng biến môi trường:
+#   KAORI_STANDIN_LATENCY_MS   độ trễ giả lập mỗi lần gọi (mô phỏng JVM startup)
+#   KAORI_STANDIN_MS_PER_MB    độ trễ thêm theo dung lượng xử lý
+#   KAORI_STANDIN_PAD          hệ số phóng to dex output (mô phỏng dex lớn hơn smali)
+
+import io
+import os
+import sys
+import time
+import zipfile
+
+DEX_MAGIC = b"dex\n039\0"
+PAD_ENTRY = ".standin-pad"
+
+def _simulate(nbytes):
+    latency = float(os.getenv("KAORI_STANDIN_LATENCY_MS", "0"))
+    per_mb = float(os.getenv("KAORI_STANDIN_MS_PER_MB", "0"))
+    delay = (latency + per_mb * nbytes / (1 << 20)) / 1000
+    if delay > 0:
+        time.sleep(delay)
+
+def pack_dex(files: dict) -> bytes:
+    """files: {đường dẫn smali tương đối: bytes} -> bytes của DEX giả."""
+    pad = float(os.getenv("KAORI_STANDIN_PAD", "0"))
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for name in sorted(files):
+            info = zipfile.ZipInfo(name, (1980, 1, 1, 0, 0, 0))
+            zf.writestr(info, files[name])
+        if pad > 0:
+            # Padding nằm trong archive: đặt sau end-of-central-directory thì zip không mở được nữa
+            zf.writestr(zipfile.ZipInfo(PAD_ENTRY, (1980, 1, 1, 0, 0, 0)),
+                        b"\0" * int(sum(len(data) for data in files.values()) * pad))
+    return DEX_MAGIC + buf.getvalue()
+
+def disassemble(dex_path, out_dir):
+    data = open(dex_path, "rb").read()
+    if not data.startswith(b"dex\n"):
+        raise SystemExit(f"not a dex file: {dex_path}")
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        zf.extractall(out_dir, [name for name in zf.namelist() if name != PAD_ENTRY])
+    _simulate(len(data))
+
+def assemble(smali_dir, out_path):
+    files = {}
+    for root, _, names in os.walk(smali_dir):
+        for name in names:
+            path = os.path.join(root, name)
+            with open(path, "rb") as handle:
+                files[os.path.relpath(path, smali_dir).replace(os.sep, "/")] = handle.read()
+    data = pack_dex(files)
+    with open(out_path, "wb") as handle:
+        handle.write(data)
+    _simulate(len(data))
+
+def main(argv):
+    if len(argv) < 6 or argv[0] != "-jar" or "-o" not in argv:
+        raise SystemExit("usage: standin_tools.py -jar <tool.jar> d|a <input> -o <output> [--api N]")
+    command, source = argv[2], argv[3]
+    output = argv[argv.index("-o") + 1]
+    if command == "d":
+        disassemble(source, output)
+    elif command == "a":
+        assemble(source, output)
+    else:
+        raise SystemExit(f"unknown command {command}")
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
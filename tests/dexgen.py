@@ -0,0 +1,147 @@
+# tests/dexgen.py
+#
+# Ghi file DEX tối thiểu (string/type/proto/method ids, class_defs, class_data, code_item) cho test
+# đọc dex trực tiếp (dexfile.py, dexdiff.py). Không có field, annotation, debug info hay map_list.
+# classes: {descriptor: {"super": descriptor, "methods": {"name(params)ret": [lệnh]}}}
+# Lệnh: ("const/4", reg, value), ("const-string", reg, text), ("return", reg), ("return-void",)
+
+import struct
+
+HEADER_SIZE = 0x70
+ENDIAN_CONSTANT = 0x12345678
+NO_INDEX = 0xFFFFFFFF
+ACC_PUBLIC = 0x1
+
+def _uleb128(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _split_types(params: str) -> list:
+    types, pos = [], 0
+    while pos < len(params):
+        start = pos
+        while params[pos] == "[":
+            pos += 1
+        pos = params.index(";", pos) + 1 if params[pos] == "L" else pos + 1
+        types.append(params[start:pos])
+    return types
+
+def _proto(signature: str):
+    name, rest = signature.split("(", 1)
+    params, ret = rest.split(")", 1)
+    return name, tuple(_split_types(params)), ret
+
+def _shorty(params, ret) -> str:
+    return "".join("L" if t[0] in "L[" else t for t in (ret, *params))
+
+def _align(buf: bytearray, size: int):
+    buf.extend(b"\0" * (-len(buf) % size))
+
+def build_dex(classes: dict) -> bytes:
+    methods = []
+    strings, types, protos = set(), set(), set()
+    for descriptor, spec in classes.items():
+        types |= {descriptor, spec.get("super", "Ljava/lang/Object;")}
+        for signature, insns in spec.get("methods", {}).items():
+            name, params, ret = _proto(signature)
+            protos.add((params, ret))
+            types |= {ret, *params}
+            strings |= {name, _shorty(params, ret)}
+            strings |= {op[2] for op in insns if op[0] == "const-string"}
+            methods.append((descriptor, name, params, ret, insns))
+    strings |= types
+    string_list = sorted(strings, key=lambda s: s.encode("utf-8"))
+    string_idx = {s: n for n, s in enumerate(string_list)}
+    type_list = sorted(types, key=lambda t: string_idx[t])
+    type_idx = {t: n for n, t in enumerate(type_list)}
+    proto_list = sorted(protos, key=lambda p: (type_idx[p[1]], [type_idx[t] for t in p[0]]))
+    proto_idx = {p: n for n, p in enumerate(proto_list)}
+    method_list = sorted(methods, key=lambda m: (type_idx[m[0]], string_idx[m[1]], proto_idx[(m[2], m[3])]))
+    method_idx = {(m[0], m[1], m[2], m[3]): n for n, m in enumerate(method_list)}
+    class_list = sorted(classes, key=lambda d: type_idx[d])
+
+    string_ids_off = HEADER_SIZE
+    type_ids_off = string_ids_off + 4 * len(string_list)
+    proto_ids_off = type_ids_off + 4 * len(type_list)
+    method_ids_off = proto_ids_off + 12 * len(proto_list)
+    class_defs_off = method_ids_off + 8 * len(method_list)
+    data_off = class_defs_off + 32 * len(class_list)
+
+    data = bytearray()
+
+    def here():
+        return data_off + len(data)
+
+    string_offs = []
+    for value in string_list:
+        string_offs.append(here())
+        data += _uleb128(len(value)) + value.encode("utf-8") + b"\0"
+
+    params_offs = {}
+    for params, _ in proto_list:
+        if params and params not in params_offs:
+            _align(data, 4)
+            params_offs[params] = here()
+            data += struct.pack(f"<I{len(params)}H", len(params), *(type_idx[t] for t in params))
+            _align(data, 4)
+
+    code_offs = {}
+    for descriptor, name, params, ret, insns in method_list:
+        units = []
+        for op in insns:
+            if op[0] == "const/4":
+                units.append(0x12 | (op[1] << 8) | ((op[2] & 0xF) << 12))
+            elif op[0] == "const-string":
+                units += [0x1A | (op[1] << 8), string_idx[op[2]]]
+            elif op[0] == "return":
+                units.append(0x0F | (op[1] << 8))
+            elif op[0] == "return-void":
+                units.append(0x0E)
+            else:
+                raise ValueError(f"lệnh không hỗ trợ: {op[0]}")
+        ins = 1 + len(params)
+        registers = max([op[1] + 1 for op in insns if len(op) > 1] + [0]) + ins
+        _align(data, 4)
+        code_offs[(descriptor, name, params, ret)] = here()
+        data += struct.pack("<HHHHII", registers, ins, 0, 0, 0, len(units))
+        data += struct.pack(f"<{len(units)}H", *units)
+
+    class_data_offs = {}
+    for descriptor in class_list:
+        own = sorted((n, key) for key, n in method_idx.items() if key[0] == descriptor)
+        class_data_offs[descriptor] = here()
+        data += _uleb128(0) + _uleb128(0) + _uleb128(0) + _uleb128(len(own))
+        previous = 0
+        for n, key in own:
+            data += _uleb128(n - previous) + _uleb128(ACC_PUBLIC) + _uleb128(code_offs[key])
+            previous = n
+
+    out = bytearray(HEADER_SIZE)
+    for off in string_offs:
+        out += struct.pack("<I", off)
+    for value in type_list:
+        out += struct.pack("<I", string_idx[value])
+    for params, ret in proto_list:
+        out += struct.pack("<III", string_idx[_shorty(params, ret)], type_idx[ret], params_offs.get(params, 0))
+    for descriptor, name, params, ret, _ in method_list:
+        out += struct.pack("<HHI", type_idx[descriptor], proto_idx[(params, ret)], string_idx[name])
+    for descriptor in class_list:
+        superclass = classes[descriptor].get("super", "Ljava/lang/Object;")
+        out += struct.pack("<8I", type_idx[descriptor], ACC_PUBLIC, type_idx[superclass], 0, NO_INDEX, 0,
+                           class_data_offs[descriptor], 0)
+    out += data
+
+    struct.pack_into("<8s", out, 0, b"dex\n035\0")
+    struct.pack_into("<III", out, 0x20, len(out), HEADER_SIZE, ENDIAN_CONSTANT)
+    struct.pack_into("<14I", out, 0x38,
+                     len(string_list), string_ids_off, len(type_list), type_ids_off,
+                     len(proto_list), proto_ids_off, 0, 0, len(method_list), method_ids_off,
+                     len(class_list), class_defs_off, len(data), data_off)
+    return bytes(out)
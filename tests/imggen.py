@@ -0,0 +1,97 @@
+# tests/imggen.py
+#
+# Sinh image cho test imgread.py: EROFS không nén (inode compact, layout FLAT_PLAIN) viết tay,
+# ext4 qua mke2fs -d. Không có xattr, inline data hay chunk-based.
+# tree: {tên: bytes (file) | str (đích symlink) | dict (thư mục)}
+
+import shutil
+import struct
+import subprocess
+from pathlib import Path
+
+EROFS_MAGIC = 0xE0F5E1E2
+BLOCK_SIZE = 4096
+FIRST_NID = 1
+INODE_SIZE = 32
+FLAT_PLAIN = 0
+
+S_IFDIR = 0o040755
+S_IFREG = 0o100644
+S_IFLNK = 0o120777
+FILE_TYPES = {S_IFREG: 1, S_IFDIR: 2, S_IFLNK: 7}
+
+def _blocks(size: int) -> int:
+    return (size + BLOCK_SIZE - 1) // BLOCK_SIZE
+
+def build_erofs(tree: dict) -> bytes:
+    nodes = []
+
+    def walk(entry, parent):
+        nid = FIRST_NID + len(nodes)
+        node = {"nid": nid}
+        nodes.append(node)
+        if isinstance(entry, dict):
+            node["mode"] = S_IFDIR
+            node["parent"] = nid if parent is None else parent
+            node["children"] = [(name, walk(child, nid)) for name, child in sorted(entry.items())]
+        elif isinstance(entry, str):
+            node["mode"], node["data"] = S_IFLNK, entry.encode("utf-8")
+        else:
+            node["mode"], node["data"] = S_IFREG, bytes(entry)
+        return nid
+
+    root = walk(tree, None)
+    by_nid = {node["nid"]: node for node in nodes}
+    for node in nodes:
+        if node["mode"] != S_IFDIR:
+            continue
+        dirents = [(b".", node["nid"]), (b"..", node["parent"])]
+        dirents += [(name.encode("utf-8"), nid) for name, nid in node["children"]]
+        dirents.sort()
+        table, names = bytearray(), bytearray()
+        for name, nid in dirents:
+            table += struct.pack("<QHBB", nid, 12 * len(dirents) + len(names), FILE_TYPES[by_nid[nid]["mode"]], 0)
+            names += name
+        if len(table) + len(names) > BLOCK_SIZE:
+            raise ValueError("thư mục vượt một block")
+        node["data"] = bytes(table + names)
+
+    meta_blkaddr = 1
+    blkaddr = meta_blkaddr + _blocks((FIRST_NID + len(nodes)) * INODE_SIZE)
+    out = bytearray(blkaddr * BLOCK_SIZE)
+    for node in nodes:
+        data = node["data"]
+        off = meta_blkaddr * BLOCK_SIZE + node["nid"] * INODE_SIZE
+        struct.pack_into("<HHHHIII", out, off, FLAT_PLAIN << 1, 0, node["mode"], 1, len(data), 0, blkaddr)
+        struct.pack_into("<I", out, off + 20, node["nid"])
+        out += data + bytes(-len(data) % BLOCK_SIZE)
+        blkaddr += _blocks(len(data))
+
+    sb = 1024
+    struct.pack_into("<I", out, sb, EROFS_MAGIC)
+    out[sb + 12] = BLOCK_SIZE.bit_length() - 1
+    struct.pack_into("<HQ", out, sb + 14, root, len(nodes))
+    struct.pack_into("<II", out, sb + 36, len(out) // BLOCK_SIZE, meta_blkaddr)
+    return bytes(out)
+
+def _populate(root: Path, tree: dict):
+    root.mkdir(parents=True, exist_ok=True)
+    for name, entry in tree.items():
+        path = root / name
+        if isinstance(entry, dict):
+            _populate(path, entry)
+        elif isinstance(entry, str):
+            path.symlink_to(entry)
+        else:
+            path.write_bytes(entry)
+
+def build_ext4(tree: dict, image: Path, size="8M"):
+    """Ghi image ext4 từ tree bằng mke2fs -d. Trả về False nếu máy không có mke2fs."""
+    mke2fs = shutil.which("mke2fs") or shutil.which("mke2fs", path="/sbin:/usr/sbin")
+    if not mke2fs:
+        return False
+    source = image.with_name(f"{image.name}.d")
+    _populate(source, tree)
+    subprocess.run([mke2fs, "-q", "-F", "-t", "ext4", "-O", "^has_journal", "-b", str(BLOCK_SIZE),
+                    "-d", str(source), str(image), size], check=True, capture_output=True)
+    return True
@@ -0,0 +1,56 @@
+# tests/test_bench_pipeline.py
+#
+# Benchmark end-to-end (bench_pipeline.py) trên jar sinh giả rất nhỏ: báo cáo và exit code regression.
+#   python -m pytest -q tests
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import standin_tools
+
+TINY = ["--dex", "1", "--files", "5", "--resources", "2", "--repeat", "1"]
+
+def _bench(tmp_path, *args):
+    return subprocess.run([sys.executable, str(REPO_DIR / "bench_pipeline.py"), *TINY, *args],
+                          cwd=tmp_path, capture_output=True, text=True, timeout=300)
+
+def _baseline(path: Path, overhead: float) -> Path:
+    path.write_text(json.dumps({"result": {"python_overhead_s": overhead}}), encoding="utf-8")
+    return path
+
+def test_report_and_saved_baseline(tmp_path):
+    saved = tmp_path / "baseline.json"
+    res = _bench(tmp_path, "--save-baseline", str(saved))
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert "Pipeline benchmark (workflow, 1 dex × 5 class" in res.stdout
+    result = json.loads(saved.read_text(encoding="utf-8"))["result"]
+    assert result["wall_s"] > 0
+    assert result["jvm_s"] > 0
+    assert result["python_overhead_s"] == result["wall_s"] - result["jvm_s"]
+
+def test_regression_exit_code(tmp_path):
+    res = _bench(tmp_path, "--baseline", str(_baseline(tmp_path / "fast.json", 1e-6)))
+    assert res.returncode == 1
+    assert "Regression" in res.stdout
+
+    res = _bench(tmp_path, "--baseline", str(_baseline(tmp_path / "slow.json", 1e6)))
+    assert res.returncode == 0, res.stdout + res.stderr
+
+def test_padded_dex_round_trips(tmp_path, monkeypatch):
+    monkeypatch.setenv("KAORI_STANDIN_PAD", "20")
+    files = {"a/B.smali": b".class public La/B;\n" * 50}
+    dex = tmp_path / "classes.dex"
+    dex.write_bytes(standin_tools.pack_dex(files))
+    assert dex.stat().st_size > 20 * len(files["a/B.smali"])
+
+    standin_tools.disassemble(dex, tmp_path / "smali")
+    assert sorted(p.relative_to(tmp_path / "smali").as_posix() for p in (tmp_path / "smali").rglob("*")
+                  if p.is_file()) == ["a/B.smali"]
+    standin_tools.assemble(tmp_path / "smali", tmp_path / "again.dex")
+    standin_tools.disassemble(tmp_path / "again.dex", tmp_path / "again")
+    assert (tmp_path / "again" / "a" / "B.smali").read_bytes() == files["a/B.smali"]
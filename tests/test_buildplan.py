@@ -0,0 +1,59 @@
+# tests/test_buildplan.py
+#
+# buildplan.announce tôn trọng KAORI_QUIET và chế độ json: bảng từng class không lọt ra stdout.
+#   python -m pytest -q tests
+
+import io
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import buildplan
+import events
+
+RESULT = {
+    "profile": "aosp",
+    "api_level": 34,
+    "caches": {"build": None, "smali": {}},
+    "skipped": {},
+    "classes": {"kaori": [
+        {"class": "Landroid/app/ApplicationPackageManager;", "dex": "classes.dex", "plan_cache": True},
+        {"class": "Landroid/app/Missing;", "dex": None, "note": "không có trong jar"},
+    ]},
+    "jars": {},
+    "estimate": {"wall": 0, "total": 0, "module": 0, "complete": False},
+    "history_samples": 0,
+}
+
+@pytest.fixture(autouse=True)
+def restore_events(monkeypatch):
+    for name in ("_mode", "_quiet", "_stream"):
+        monkeypatch.setattr(events, name, getattr(events, name))
+    monkeypatch.delenv("KAORI_QUIET", raising=False)
+    monkeypatch.delenv("KAORI_EVENTS", raising=False)
+    events.configure(None)
+    events.set_quiet(False)
+
+def test_text_mode_prints_class_table(capsys):
+    buildplan.announce(RESULT)
+    out = capsys.readouterr().out
+    assert "Landroid/app/ApplicationPackageManager;" in out and "plan cache" in out
+    assert "không có trong jar" in out
+
+def test_quiet_prints_nothing(capsys):
+    events.set_quiet(True)
+    buildplan.announce(RESULT)
+    assert capsys.readouterr().out == ""
+
+def test_json_mode_emits_only_events(capsys):
+    stream = io.StringIO()
+    events.configure("json", stream=stream)
+    buildplan.announce(RESULT)
+    assert capsys.readouterr().out == ""
+    [record] = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert record["event"] == "plan"
+    assert record["classes"]["kaori"][0]["class"] == "Landroid/app/ApplicationPackageManager;"
@@ -0,0 +1,81 @@
+# tests/test_dexdiff.py
+#
+# dexdiff so sánh hai dex nhỏ sinh bằng dexgen: thay đổi index pool không tính là sửa method.
+#   python -m pytest -q tests
+
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import dexdiff
+from dexfile import mapped
+from dexgen import build_dex
+
+ORIGINAL = {
+    "Landroid/app/A;": {
+        "methods": {
+            "greet()Ljava/lang/String;": [("const-string", 0, "hello"), ("return", 0)],
+            "flag()Z": [("const/4", 0, 0), ("return", 0)],
+        },
+    },
+    "Landroid/app/C;": {"methods": {"run()V": [("return-void",)]}},
+}
+
+def _patched():
+    classes = json.loads(json.dumps(ORIGINAL))
+    classes["Landroid/app/A;"]["methods"]["flag()Z"] = [("const/4", 0, 1), ("return", 0)]
+    # Class và string mới sắp trước "hello" trong pool: index của const-string trong greet() đổi
+    classes["Landroid/app/B;"] = {"methods": {"aaa()Ljava/lang/String;": [("const-string", 0, "aaa"),
+                                                                           ("return", 0)]}}
+    del classes["Landroid/app/C;"]
+    return classes
+
+def _write(path: Path, classes: dict) -> Path:
+    path.write_bytes(build_dex({name: {**spec, "methods": {sig: [tuple(op) for op in ops]
+                                                             for sig, ops in spec["methods"].items()}}
+                                for name, spec in classes.items()}))
+    return path
+
+def test_fixture_is_readable(tmp_path):
+    with mapped(_write(tmp_path / "classes.dex", ORIGINAL)) as dex:
+        assert dex.class_descriptors() == ["Landroid/app/A;", "Landroid/app/C;"]
+        assert dex.has_method("Landroid/app/A;", "greet", "()Ljava/lang/String;")
+
+def test_diff_pair_reports_class_and_method_changes(tmp_path):
+    old = _write(tmp_path / "old.dex", ORIGINAL)
+    new = _write(tmp_path / "new.dex", _patched())
+    diff = dexdiff.diff_pair(str(old), str(new))
+    assert diff == {
+        "added": ["Landroid/app/B;"],
+        "removed": ["Landroid/app/C;"],
+        "changed": {"Landroid/app/A;": {"class": False, "added": [], "removed": [], "changed": ["flag()Z"]}},
+    }
+    assert dexdiff.violations(diff, {"Landroid/app/A;"}, {"Landroid/app/B"}) == ["Landroid/app/C;"]
+
+def test_cli_compares_two_dex_files(tmp_path):
+    old = _write(tmp_path / "old.dex", ORIGINAL)
+    same = _write(tmp_path / "same.dex", ORIGINAL)
+    new = _write(tmp_path / "new.dex", _patched())
+    script = str(REPO_DIR / "dexdiff.py")
+
+    res = subprocess.run([sys.executable, script, "--dex", str(old), str(same)], capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    assert json.loads(res.stdout) == {"added": [], "removed": [], "changed": {}}
+
+    res = subprocess.run([sys.executable, script, "--dex", str(old), str(new)], capture_output=True, text=True)
+    assert res.returncode == 1
+    assert json.loads(res.stdout)["added"] == ["Landroid/app/B;"]
+
+def test_cli_arguments(tmp_path):
+    script = str(REPO_DIR / "dexdiff.py")
+    res = subprocess.run([sys.executable, script, "--help"], capture_output=True, text=True)
+    assert res.returncode == 0 and "--dex OLD NEW" in res.stdout
+    res = subprocess.run([sys.executable, script, "boot.jar"], capture_output=True, text=True, cwd=tmp_path)
+    assert res.returncode == 2 and "jar không hợp lệ" in res.stderr
+    res = subprocess.run([sys.executable, script, "framework.jar"], capture_output=True, text=True, cwd=tmp_path)
+    assert res.returncode == 0, res.stderr
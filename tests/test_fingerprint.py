@@ -0,0 +1,50 @@
+# tests/test_fingerprint.py
+#
+# CLI của fingerprint.py: --help và --dry-run không ghi đè run report.
+#   python -m pytest -q tests
+
+import json
+import subprocess
+import sys
+import zipfile
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fingerprint
+from dexgen import build_dex
+
+SCRIPT = str(REPO_DIR / "fingerprint.py")
+
+def _run(cwd: Path, *args):
+    return subprocess.run([sys.executable, SCRIPT, *args], cwd=cwd, capture_output=True, text=True)
+
+def _jar(base: Path):
+    with zipfile.ZipFile(base / "framework.jar", "w") as jar:
+        jar.writestr("classes.dex", build_dex({"Landroid/app/A;": {"methods": {"run()V": [("return-void",)]}}}))
+
+def test_help_does_not_touch_report(tmp_path):
+    _jar(tmp_path)
+    report = tmp_path / fingerprint.REPORT_NAME
+    report.write_text('{"keep": true}', encoding="utf-8")
+    res = _run(tmp_path, "--help")
+    assert res.returncode == 0 and "--dry-run" in res.stdout
+    assert json.loads(report.read_text(encoding="utf-8")) == {"keep": True}
+    assert _run(tmp_path, "--bogus").returncode == 2
+
+def test_dry_run_and_save(tmp_path):
+    _jar(tmp_path)
+    report = tmp_path / fingerprint.REPORT_NAME
+    res = _run(tmp_path, "--dry-run")
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert not report.exists()
+    res = _run(tmp_path)
+    assert res.returncode == 0, res.stdout + res.stderr
+    assert "selection" in json.loads(report.read_text(encoding="utf-8"))
+
+def test_no_jars(tmp_path):
+    res = _run(tmp_path)
+    assert res.returncode == 1
+    assert not (tmp_path / fingerprint.REPORT_NAME).exists()
@@ -0,0 +1,75 @@
+# tests/test_imgread.py
+#
+# imgread trên image EROFS và ext4 nhỏ: symlink tương đối (../system_ext, ../../framework/x.jar)
+# phải giải được như trên thiết bị.
+#   python -m pytest -q tests
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import imgread
+from imggen import build_erofs, build_ext4
+
+FRAMEWORK = b"PK\x05\x06framework" + bytes(5000)
+MIUI = b"PK\x05\x06miui-framework"
+
+# system-as-root: system/system_ext trỏ ngược ra system_ext ở gốc image
+TREE = {
+    "system": {
+        "framework": {"framework.jar": FRAMEWORK},
+        "system_ext": "../system_ext",
+        "app": {"Demo": {"framework.jar": "../../framework/framework.jar"}},
+        "etc": {"self": "./../etc/.."},
+    },
+    "system_ext": {"framework": {"miui-framework.jar": MIUI}},
+    "abs": "/system/framework",
+}
+
+@pytest.fixture(params=["erofs", "ext4"])
+def image(request, tmp_path):
+    path = tmp_path / f"system.{request.param}.img"
+    if request.param == "erofs":
+        path.write_bytes(build_erofs(TREE))
+    elif not build_ext4(TREE, path):
+        pytest.skip("không có mke2fs")
+    return path
+
+def _read(path: Path, inner: str):
+    mm, reader = imgread.open_image(path)
+    try:
+        ino = reader.lookup(inner)
+        return None if ino is None else reader.read(ino)
+    finally:
+        mm.close()
+
+def test_reader_type(image):
+    mm, reader = imgread.open_image(image)
+    mm.close()
+    expected = imgread.ErofsImage if "erofs" in image.name else imgread.Ext4Image
+    assert type(reader) is expected
+
+@pytest.mark.parametrize("inner", [
+    "system/framework/framework.jar",
+    "system/app/Demo/framework.jar",
+    "system/etc/self/framework/framework.jar",
+    "abs/framework.jar",
+    "system/app/../framework/framework.jar",
+])
+def test_lookup_follows_relative_symlinks(image, inner):
+    assert _read(image, inner) == FRAMEWORK
+
+def test_lookup_missing(image):
+    assert _read(image, "system/framework/services.jar") is None
+    assert _read(image, "system/app/Demo/missing/framework.jar") is None
+
+def test_extract_jars_through_system_ext_symlink(image, tmp_path):
+    out = tmp_path / "out"
+    out.mkdir()
+    found = imgread.extract_jars([image], out, jars=["framework.jar", "miui-framework.jar"])
+    assert found == {"framework.jar": len(FRAMEWORK), "miui-framework.jar": len(MIUI)}
+    assert (out / "miui-framework.jar").read_bytes() == MIUI
@@ -0,0 +1,92 @@
+# tests/test_kaori_feature_cache.py
+#
+# Biến thể hook hasSystemFeature có cache (KAORI_FEATURE_CACHE=1) trên ApplicationPackageManager giả lập.
+#   python -m pytest -q tests
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import smaligen
+from kaori import (
+    FEATURE_CACHE_CLASS, feature_cache_smali, modify_application_package_manager_kaori_cached, patch_targets,
+)
+from patchlog import PatchManifest, apply_once
+from smalicheck import changed_methods, check_text, iter_methods
+
+INVALIDATE_METHOD = (
+    ".method public static invalidateHasSystemFeatureCache()V\n"
+    "    .registers 1\n\n"
+    "    sget-object v0, Landroid/app/ApplicationPackageManager;->mHasSystemFeatureCache:Landroid/app/PropertyInvalidatedCache;\n\n"
+    "    invoke-virtual {v0}, Landroid/app/PropertyInvalidatedCache;->invalidateCache()V\n\n"
+    "    return-void\n"
+    ".end method\n\n"
+)
+
+def _fixture(tmp_path: Path) -> Path:
+    text = smaligen.application_package_manager(target_bytes=40_000, body_lines=10)
+    text = text.replace("# virtual methods\n", INVALIDATE_METHOD + "\n# virtual methods\n", 1)
+    path = tmp_path / "ApplicationPackageManager.smali"
+    path.write_text(text, encoding="utf-8")
+    return path
+
+def _method(text: str, signature: str) -> str:
+    return next("\n".join(lines) for key, lines, _ in iter_methods(text) if signature in key)
+
+def test_cached_patcher_routes_returns_through_feature_cache(tmp_path):
+    path = _fixture(tmp_path)
+    before = path.read_text(encoding="utf-8")
+    assert modify_application_package_manager_kaori_cached(path)
+    after = path.read_text(encoding="utf-8")
+
+    method = _method(after, "hasSystemFeature(Ljava/lang/String;I)Z")
+    assert ".registers 8" in method
+    assert "move-object/from16 v2, p1" in method
+    assert "move/from16 v3, p2" in method
+    assert (f"invoke-static/range {{v2 .. v4}}, {FEATURE_CACHE_CLASS}->hasSystemFeature(Ljava/lang/String;IZ)Z"
+            in method)
+    # Danh sách feature nằm trong KaoriFeatureCache, không nạp lại mỗi lần gọi
+    assert "getFeatures" not in method
+    assert "isToggleEnabled" not in method
+
+    assert f"{FEATURE_CACHE_CLASS}->invalidate()V" in _method(after, "invalidateHasSystemFeatureCache()V")
+    assert check_text(after, changed_methods(before, after)) == []
+
+def test_feature_cache_class_passes_smalicheck():
+    text = feature_cache_smali()
+    assert check_text(text) == []
+    lookup = _method(text, "hasSystemFeature(Ljava/lang/String;IZ)Z")
+    assert "ToolboxUtils;->KaoriosFeaturesV1(Ljava/lang/String;IZ)Z" in lookup
+    assert "SettingsHelper;->isBootCompleted()Z" in lookup
+
+def _apm_patcher():
+    return next(func for descriptor, _, func in patch_targets()
+                if descriptor == "Landroid/app/ApplicationPackageManager;")
+
+def test_toggling_feature_cache_does_not_stack_hooks(tmp_path, monkeypatch):
+    unpack_root = tmp_path / "framework_unpacked"
+    target_dir = unpack_root / "smali_classes" / "android" / "app"
+    target_dir.mkdir(parents=True)
+    path = _fixture(target_dir)
+
+    monkeypatch.setenv("KAORI_FEATURE_CACHE", "0")
+    manifest = PatchManifest(unpack_root)
+    assert apply_once(manifest, path, _apm_patcher())
+    manifest.save()
+    plain = path.read_text(encoding="utf-8")
+
+    monkeypatch.setenv("KAORI_FEATURE_CACHE", "1")
+    assert _apm_patcher() is modify_application_package_manager_kaori_cached
+    assert apply_once(PatchManifest(unpack_root), path, _apm_patcher()) is None
+    assert path.read_text(encoding="utf-8") == plain
+
+    # Chiều ngược lại: bản có cache đã vá, tắt cache cũng không vá thêm hook thường
+    path = _fixture(target_dir)
+    manifest = PatchManifest(unpack_root)
+    assert apply_once(manifest, path, _apm_patcher())
+    manifest.save()
+    cached = path.read_text(encoding="utf-8")
+    monkeypatch.setenv("KAORI_FEATURE_CACHE", "0")
+    assert apply_once(PatchManifest(unpack_root), path, _apm_patcher()) is None
+    assert path.read_text(encoding="utf-8") == cached
@@ -0,0 +1,84 @@
+# tests/test_multidex.py
+#
+# Planner của multidex với KAORI_DEX_LIMIT rất nhỏ: payload kaorios bị đẩy sang smali_classesN mới.
+#   python -m pytest -q tests
+
+import json
+import sys
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import fingerprint
+import multidex
+from dexgen import build_dex
+
+PAYLOAD = "com/android/internal/util/kaorios"
+
+def _methods(count: int) -> dict:
+    return {f"m{n}()V": [("return-void",)] for n in range(count)}
+
+def _payload_class(name: str, calls: int) -> str:
+    lines = [f".class public final L{PAYLOAD}/{name};\n", ".super Ljava/lang/Object;\n\n"]
+    for n in range(calls):
+        lines += [f".method public static call{n}()V\n", "    .registers 0\n\n",
+                  f"    invoke-static {{}}, Landroid/app/A;->m{n}()V\n\n", "    return-void\n", ".end method\n\n"]
+    return "".join(lines)
+
+def _workspace(tmp_path: Path) -> Path:
+    dexes = {
+        "classes.dex": build_dex({"Landroid/app/A;": {"methods": _methods(6)}}),
+        "classes5.dex": build_dex({"Landroid/app/E;": {"methods": _methods(5)}}),
+    }
+    with zipfile.ZipFile(tmp_path / "framework.jar", "w") as jar:
+        for name, data in dexes.items():
+            jar.writestr(name, data)
+    root = tmp_path / "framework_unpacked"
+    (root / "smali_classes" / "android" / "app").mkdir(parents=True)
+    (root / "smali_classes" / "android" / "app" / "A.smali").write_text(
+        ".class public Landroid/app/A;\n.super Ljava/lang/Object;\n", encoding="utf-8")
+    for name, data in dexes.items():
+        (root / name).write_bytes(data)
+    payload = root / "smali_classes5" / PAYLOAD
+    payload.mkdir(parents=True)
+    (payload / "Toolbox.smali").write_text(_payload_class("Toolbox", 2), encoding="utf-8")
+    (payload / "Features.smali").write_text(_payload_class("Features", 1), encoding="utf-8")
+    return tmp_path
+
+def test_payload_moves_to_fresh_dex_and_is_recorded(tmp_path, monkeypatch):
+    base = _workspace(tmp_path)
+    # classes5: 5 method gốc + 3 method payload + A->m0, A->m1 vượt 8; classes (6 method) cũng không đủ chỗ
+    monkeypatch.setenv("KAORI_DEX_LIMIT", "8")
+    ok, touched = multidex.plan_jar(base, "framework.jar")
+
+    assert ok
+    assert touched == {"smali_classes5", "smali_classes6"}
+    root = base / "framework_unpacked"
+    assert sorted(p.name for p in (root / "smali_classes6" / PAYLOAD).iterdir()) == \
+        ["Features.smali", "Toolbox.smali"]
+    assert not any((root / "smali_classes5").rglob("*.smali"))
+
+    report = json.loads((base / fingerprint.REPORT_NAME).read_text(encoding="utf-8"))
+    section = report["multidex"]["framework.jar"]
+    assert section["limit"] == 8
+    [move] = section["moves"]
+    assert move["unit"] == PAYLOAD
+    assert (move["from"], move["to"], move["classes"]) == ("classes5.dex", "classes6.dex", 2)
+    assert all(count <= 8 for count in move["after"].values())
+
+def test_dry_run_does_not_move_files(tmp_path, monkeypatch):
+    base = _workspace(tmp_path)
+    monkeypatch.setenv("KAORI_DEX_LIMIT", "8")
+    ok, _ = multidex.plan_jar(base, "framework.jar", apply=False)
+    assert ok
+    assert (base / "framework_unpacked" / "smali_classes5" / PAYLOAD / "Toolbox.smali").is_file()
+    assert not (base / "framework_unpacked" / "smali_classes6").exists()
+
+def test_no_move_under_default_limit(tmp_path):
+    base = _workspace(tmp_path)
+    ok, touched = multidex.plan_jar(base, "framework.jar")
+    assert ok and touched == set()
+    report = json.loads((base / fingerprint.REPORT_NAME).read_text(encoding="utf-8"))
+    assert report["multidex"]["framework.jar"]["moves"] == []
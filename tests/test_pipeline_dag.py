@@ -0,0 +1,54 @@
+# tests/test_pipeline_dag.py
+#
+# DagScheduler: budget của node chỉ cảnh báo, nhưng node quá budget làm run() thất bại, dừng lập lịch
+# và run() chỉ trả về khi thread của node đó đã xong.
+#   python -m pytest -q tests
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from pipeline import DagScheduler
+
+def test_independent_nodes_run_after_dependencies():
+    order = []
+    dag = DagScheduler(workers=2)
+    dag.add("a", lambda: order.append("a") or True)
+    dag.add("b", lambda: order.append("b") or True, ["a"])
+    dag.add("c", lambda: False, ["a"])
+    dag.add("d", lambda: True, ["c"])
+    assert not dag.run()
+    assert order == ["a", "b"]
+    assert [dag.nodes[n].status for n in "abcd"] == ["done", "done", "failed", "skipped"]
+
+def test_overdue_node_fails_run_and_is_waited_for():
+    finished = threading.Event()
+
+    def slow():
+        time.sleep(0.6)
+        finished.set()
+        return True
+
+    started = []
+    dag = DagScheduler(workers=1)
+    dag.add("slow", slow, budget=0.1)
+    dag.add("after", lambda: started.append("after") or True, ["slow"])
+    # Đã submit cùng lúc với "slow" nhưng phải chờ thread duy nhất: bị huỷ khi "slow" quá budget
+    dag.add("queued", lambda: started.append("queued") or True)
+
+    begin = time.monotonic()
+    assert not dag.run()
+    # run() không trả về khi thread của node quá budget còn đang chạy (có thể còn ghi vào workspace)
+    assert finished.is_set()
+    assert time.monotonic() - begin >= 0.6
+    assert started == []
+
+    slow_node = dag.nodes["slow"]
+    assert slow_node.status == "timeout"
+    assert "vượt budget" in slow_node.error
+    assert dag.nodes["after"].status == "skipped"
+    assert dag.nodes["queued"].status == "skipped"
+    assert slow_node.duration >= 0.6
@@ -0,0 +1,68 @@
+# tests/test_pristine.py
+#
+# Snapshot gốc của *_unpacked → write_patched → reset.
+#   python -m pytest -q tests
+
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import pristine
+from patchlog import PatchManifest
+from utils import META_DIR
+
+def _unpacked(tmp_path: Path) -> Path:
+    root = tmp_path / "framework_unpacked"
+    for rel, text in {
+        "smali_classes/android/app/A.smali": ".class public Landroid/app/A;\n",
+        "smali_classes/android/app/B.smali": ".class public Landroid/app/B;\n",
+        "smali_classes2/android/os/C.smali": ".class public Landroid/os/C;\n",
+    }.items():
+        path = root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(text, encoding="utf-8")
+    return root
+
+def test_snapshot_is_opt_in(monkeypatch):
+    monkeypatch.delenv("KAORI_PRISTINE", raising=False)
+    assert not pristine.enabled()
+    monkeypatch.setenv("KAORI_PRISTINE", "1")
+    assert pristine.enabled()
+
+def test_write_patched_then_reset_restores_originals(tmp_path):
+    root = _unpacked(tmp_path)
+    original = root / "smali_classes/android/app/A.smali"
+    untouched = root / "smali_classes/android/app/B.smali"
+    assert pristine.snapshot(root) == 3
+    inode = original.stat().st_ino
+
+    pristine.write_patched(original, ".class public Landroid/app/A;\n# patched\n")
+    added = root / "smali_classes5/com/android/internal/util/kaorios/Payload.smali"
+    added.parent.mkdir(parents=True)
+    pristine.mark_dirty(root / "smali_classes5")
+    added.write_text(".class public Lcom/android/internal/util/kaorios/Payload;\n", encoding="utf-8")
+    manifest = PatchManifest(root)
+    manifest.record(original, "modify_a", "v1")
+    manifest.save()
+
+    # Bản gốc trong snapshot không bị ghi đè (file đã vá là inode mới)
+    snapshot_copy = pristine.pristine_dir(root) / "smali_classes/android/app/A.smali"
+    assert "# patched" not in snapshot_copy.read_text(encoding="utf-8")
+    assert original.stat().st_ino != inode
+    assert pristine.dirty_paths(root) == ["smali_classes/android/app/A.smali", "smali_classes5"]
+
+    assert pristine.reset(root) == 2
+    assert original.read_text(encoding="utf-8") == ".class public Landroid/app/A;\n"
+    assert untouched.read_text(encoding="utf-8") == ".class public Landroid/app/B;\n"
+    assert not (root / "smali_classes5").exists()
+    assert pristine.dirty_paths(root) == []
+    assert not (root / META_DIR / pristine.JOURNAL_NAME).exists()
+    assert PatchManifest(root).entries == {}
+
+def test_reset_without_snapshot(tmp_path):
+    root = _unpacked(tmp_path)
+    pristine.write_patched(root / "smali_classes/android/app/A.smali", "patched\n")
+    assert pristine.reset(root) is None
+    assert not os.path.exists(root / META_DIR / pristine.JOURNAL_NAME)
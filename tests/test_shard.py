@@ -0,0 +1,178 @@
+# tests/test_shard.py
+#
+# shard.py với worker thật (subprocess) và KAORI_JAVA trỏ vào standin_tools.py: hai worker TCP,
+# một worker thư mục dùng chung, worker khác phiên bản tool bị bỏ, không còn worker thì chạy local.
+#   python -m pytest -q tests
+
+import os
+import shlex
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(REPO_DIR))
+
+import shard
+import standin_tools
+import utils
+
+JAVA = f"{shlex.quote(sys.executable)} {shlex.quote(str(REPO_DIR / 'standin_tools.py'))}"
+SMALI = {
+    "android/app/A.smali": b".class public Landroid/app/A;\n.super Ljava/lang/Object;\n",
+    "android/app/B.smali": b".class public Landroid/app/B;\n.super Landroid/app/A;\n",
+}
+
+def _tools(root: Path, version=b"v1") -> Path:
+    root.mkdir(parents=True, exist_ok=True)
+    for name in ("baksmali.jar", "smali.jar"):
+        (root / name).write_bytes(b"PK stand-in " + name.encode() + version)
+    return root
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind((shard.DEFAULT_HOST, 0))
+        return sock.getsockname()[1]
+
+def _wait(condition, what: str, limit=15.0):
+    deadline = time.monotonic() + limit
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"hết giờ chờ {what}")
+        time.sleep(0.05)
+
+def _listening(port: int) -> bool:
+    try:
+        socket.create_connection((shard.DEFAULT_HOST, port), timeout=0.2).close()
+        return True
+    except OSError:
+        return False
+
+@pytest.fixture
+def workers(tmp_path):
+    """start(kind, version) chạy worker trong thư mục tool riêng; dừng theo PID khi test xong."""
+    procs = []
+    env = {**os.environ, "KAORI_JAVA": JAVA, "PYTHONDONTWRITEBYTECODE": "1"}
+
+    def start(kind: str, version=b"v1", shared: Path = None):
+        home = _tools(tmp_path / f"worker{len(procs)}", version)
+        if kind == "tcp":
+            port = _free_port()
+            args = ["--listen", f":{port}", "--store", str(home / "store")]
+        else:
+            args = ["--dir", str(shared)]
+        proc = subprocess.Popen([sys.executable, str(REPO_DIR / "shard.py"), "worker", *args], cwd=home, env=env,
+                                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        procs.append(proc)
+        if kind == "tcp":
+            _wait(lambda: _listening(port), f"worker TCP :{port}")
+            return f"{shard.DEFAULT_HOST}:{port}", home / "store"
+        _wait(lambda: any((shared / "workers").glob(f"*.{proc.pid}")), "heartbeat")
+        return proc, shared
+
+    yield start
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        proc.wait(timeout=10)
+
+@pytest.fixture
+def coordinator(tmp_path, monkeypatch):
+    """Phía coordinator trong tiến trình test: tool v1, local cũng chạy standin_tools."""
+    monkeypatch.setattr(utils, "JAVA_CMD", shlex.split(JAVA))
+    monkeypatch.setattr(shard, "_coordinator", None)
+    monkeypatch.setenv("KAORI_SHARD_TIMEOUT", "60")
+    tools = _tools(tmp_path / "coordinator")
+
+    def use(spec: str):
+        monkeypatch.setenv("KAORI_SHARD", spec)
+        monkeypatch.setattr(shard, "_coordinator", None)
+        return shard.coordinator()
+
+    use.tools = tools
+    return use
+
+def _roundtrip(tools: Path, work: Path):
+    """baksmali rồi smali qua shard.run_java; trả về cây smali thu được."""
+    work.mkdir()
+    dex = work / "classes.dex"
+    dex.write_bytes(standin_tools.pack_dex(SMALI))
+    out = work / "smali"
+    res = shard.run_java(tools / "baksmali.jar", ["d", dex, "-o", out], capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    rebuilt = work / "rebuilt.dex"
+    res = shard.run_java(tools / "smali.jar", ["a", out, "-o", rebuilt, "--api", "34"],
+                         capture_output=True, text=True)
+    assert res.returncode == 0, res.stderr
+    assert rebuilt.read_bytes() == dex.read_bytes()
+    return {p.relative_to(out).as_posix(): p.read_bytes() for p in out.rglob("*.smali")}
+
+def _results(store: Path) -> int:
+    return len(list((store / "results").glob("*")))
+
+def test_two_tcp_workers_share_jobs(tmp_path, workers, coordinator):
+    (first, first_store), (second, second_store) = workers("tcp"), workers("tcp")
+    pool = coordinator(f"{first},{second}")
+    assert pool.alive == 2 and shard.parallel() == 2
+
+    assert _roundtrip(coordinator.tools, tmp_path / "a") == SMALI
+    # Worker được trả về cuối hàng đợi: baksmali và smali rơi vào hai worker khác nhau
+    assert _results(first_store) == 1 and _results(second_store) == 1
+    # Cùng input, cùng tool: kết quả đã cache trên worker, không chạy lại
+    _roundtrip(coordinator.tools, tmp_path / "b")
+    assert _results(first_store) + _results(second_store) == 2
+    assert pool.alive == 2
+
+def test_dir_worker(tmp_path, workers, coordinator, monkeypatch):
+    shared = tmp_path / "shared"
+    workers("dir", shared=shared)
+    monkeypatch.setenv("KAORI_SHARD_SLOTS", "2")
+    pool = coordinator(f"dir:{shared}")
+    assert pool.alive == 2
+
+    assert _roundtrip(coordinator.tools, tmp_path / "a") == SMALI
+    assert _results(shared) == 2
+    for name in ("jobs", "running", "done"):
+        assert not any((shared / name).glob("*.json")), name
+
+def test_worker_with_other_tool_version_is_dropped(tmp_path, workers, coordinator, capsys):
+    stale, stale_store = workers("tcp", version=b"v0")
+    good, good_store = workers("tcp")
+    pool = coordinator(f"{stale},{good}")
+
+    assert _roundtrip(coordinator.tools, tmp_path / "a") == SMALI
+    assert pool.alive == 1
+    assert _results(good_store) == 2 and not (stale_store / "results").exists()
+    assert f"Bỏ worker {stale}" in capsys.readouterr().out
+
+def test_dir_worker_with_other_tool_version_falls_back_to_local(tmp_path, workers, coordinator, capsys):
+    shared = tmp_path / "shared"
+    workers("dir", version=b"v0", shared=shared)
+    pool = coordinator(f"dir:{shared}")
+
+    assert _roundtrip(coordinator.tools, tmp_path / "a") == SMALI
+    assert pool.alive == 0
+    assert not (shared / "results").exists()
+    assert not any((shared / "jobs").glob("*.json"))
+    assert "không worker nào cùng phiên bản baksmali" in capsys.readouterr().out
+
+@pytest.mark.parametrize("kind", ["tcp", "dir"])
+def test_no_live_worker_runs_locally(tmp_path, coordinator, kind, capsys):
+    shared = tmp_path / "shared"
+    (shared / "workers").mkdir(parents=True)
+    if kind == "dir":
+        # Heartbeat đã cũ: worker coi như đã chết
+        beat = shared / "workers" / "gone.1"
+        beat.write_text("{}", encoding="utf-8")
+        os.utime(beat, (time.time() - 3600,) * 2)
+    spec = f"{shard.DEFAULT_HOST}:{_free_port()}" if kind == "tcp" else f"dir:{shared}"
+    pool = coordinator(spec)
+
+    assert _roundtrip(coordinator.tools, tmp_path / "a") == SMALI
+    assert pool.alive == 0 and shard.parallel() == 1
+    assert "Bỏ" in capsys.readouterr().out
+    assert not (shared / "blobs").exists()
@@ -0,0 +1,133 @@
+# tests/test_shrink.py
+#
+# Với tới được của shrink.py trên payload smali tổng hợp nhỏ: dispatch qua interface, class có supertype
+# ngoài payload giữ nguyên, <clinit> luôn được giữ, entry point lạ thì không shrink.
+#   python -m pytest -q tests
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import shrink
+
+PKG = "com/android/internal/util/kaorios"
+
+def _method(header: str, *body: str) -> str:
+    lines = "".join(f"    {line}\n" for line in body)
+    return f".method {header}\n    .registers 4\n\n{lines}.end method\n\n"
+
+def _class(name: str, *methods: str, super_="Ljava/lang/Object;", implements=(), interface=False) -> str:
+    flags = "public interface abstract" if interface else "public"
+    head = f".class {flags} L{PKG}/{name};\n.super {super_}\n"
+    head += "".join(f".implements {iface}\n" for iface in implements)
+    return head + "\n" + "".join(methods)
+
+def _payload(tmp_path: Path, classes: dict) -> Path:
+    root = tmp_path / "kaorios"
+    root.mkdir()
+    for name, text in classes.items():
+        (root / f"{name}.smali").write_text(text, encoding="utf-8")
+    return root
+
+def _entry(tmp_path: Path, *calls: str) -> Path:
+    path = tmp_path / "Patched.smali"
+    body = _method("public run()V", *(f"invoke-static {{}}, L{PKG}/{call}" for call in calls), "return-void")
+    path.write_text(f".class public Landroid/app/Patched;\n.super Ljava/lang/Object;\n\n{body}", encoding="utf-8")
+    return path
+
+def _kept(root: Path, name: str) -> str:
+    path = root / f"{name}.smali"
+    return path.read_text(encoding="utf-8") if path.exists() else None
+
+CTOR = _method("public constructor <init>()V", "invoke-direct {p0}, Ljava/lang/Object;-><init>()V", "return-void")
+
+def test_disabled_by_default(monkeypatch):
+    monkeypatch.delenv("KAORI_SHRINK", raising=False)
+    assert not shrink.enabled()
+    monkeypatch.setenv("KAORI_SHRINK", "1")
+    assert shrink.enabled()
+
+def test_interface_dispatch(tmp_path):
+    root = _payload(tmp_path, {
+        "Task": _class("Task", _method("public abstract run()V"), interface=True),
+        "Base": _class("Base", CTOR, _method("public run()V", "return-void"),
+                       _method("public unused()V", "return-void")),
+        # run() chỉ kế thừa từ Base: Base.run() là bản thực thi Task.run()
+        "Impl": _class("Impl", _method("public constructor <init>()V",
+                                       f"invoke-direct {{p0}}, L{PKG}/Base;-><init>()V", "return-void"),
+                       super_=f"L{PKG}/Base;", implements=[f"L{PKG}/Task;"]),
+        "Direct": _class("Direct", CTOR, _method("public run()V", "return-void"),
+                         implements=[f"L{PKG}/Task;"]),
+        "Api": _class("Api", _method(
+            "public static start()V",
+            f"new-instance v0, L{PKG}/Impl;", f"invoke-direct {{v0}}, L{PKG}/Impl;-><init>()V",
+            f"invoke-static {{v0}}, L{PKG}/Api;->call(L{PKG}/Task;)V",
+            f"new-instance v0, L{PKG}/Direct;", f"invoke-direct {{v0}}, L{PKG}/Direct;-><init>()V",
+            f"invoke-static {{v0}}, L{PKG}/Api;->call(L{PKG}/Task;)V", "return-void"),
+            _method(f"private static call(L{PKG}/Task;)V", f"invoke-interface {{p0}}, L{PKG}/Task;->run()V",
+                    "return-void")),
+        "Unused": _class("Unused", CTOR, implements=[f"L{PKG}/Task;"]),
+    })
+    result = shrink.shrink(root, [_entry(tmp_path, "Api;->start()V")])
+
+    assert result["drop"] == [f"L{PKG}/Unused;"]
+    assert result["trim"] == {f"L{PKG}/Base;": ["unused()V"]}
+    assert "run()V" in _kept(root, "Base") and "unused()V" not in _kept(root, "Base")
+    assert "run()V" in _kept(root, "Direct")
+    assert _kept(root, "Unused") is None
+
+def test_external_supertypes_keep_every_method(tmp_path):
+    root = _payload(tmp_path, {
+        "Cache": _class("Cache", CTOR, _method("public recompute(Ljava/lang/Object;)Ljava/lang/Object;",
+                                               "const/4 v0, 0x0", "return-object v0"),
+                        _method("private helper()V", "return-void"),
+                        super_="Landroid/app/PropertyInvalidatedCache;"),
+        # Supertype ngoài payload qua interface trong payload: vẫn tính là ngoài
+        "Listener": _class("Listener", interface=True, implements=["Ljava/util/EventListener;"]),
+        "Handler": _class("Handler", CTOR, _method("public onEvent()V", "return-void"),
+                          implements=[f"L{PKG}/Listener;"]),
+        "Plain": _class("Plain", CTOR, _method("public toString()Ljava/lang/String;", "const/4 v0, 0x0",
+                                               "return-object v0"),
+                        _method("public unused()V", "return-void")),
+        "Api": _class("Api", _method("public static start()V", f"new-instance v0, L{PKG}/Cache;",
+                                     f"new-instance v1, L{PKG}/Handler;", f"new-instance v2, L{PKG}/Plain;",
+                                     "return-void")),
+    })
+    result = shrink.shrink(root, [_entry(tmp_path, "Api;->start()V")], apply=False)
+
+    assert result["drop"] == []
+    assert f"L{PKG}/Cache;" not in result["trim"]
+    assert f"L{PKG}/Handler;" not in result["trim"]
+    # Chỉ kế thừa Object: giữ override của Object, method không ai gọi bị bỏ
+    assert result["trim"][f"L{PKG}/Plain;"] == ["<init>()V", "unused()V"]
+
+def test_clinit_is_kept_with_what_it_calls(tmp_path):
+    root = _payload(tmp_path, {
+        "Config": _class("Config", _method("static constructor <clinit>()V",
+                                           f"invoke-static {{}}, L{PKG}/Loader;->load()V", "return-void"),
+                         _method("public static unused()V", "return-void"),
+                         super_=f"L{PKG}/Parent;"),
+        "Parent": _class("Parent", _method("static constructor <clinit>()V", "return-void")),
+        "Loader": _class("Loader", _method("public static load()V", "return-void"),
+                         _method("public static other()V", "return-void")),
+        # Chỉ được tham chiếu qua field tĩnh: class vẫn phải khởi tạo được
+        "Api": _class("Api", _method("public static flag()Z",
+                                     f"sget-boolean v0, L{PKG}/Config;->ENABLED:Z", "return v0")),
+    })
+    result = shrink.shrink(root, [_entry(tmp_path, "Api;->flag()Z")])
+
+    assert result["drop"] == []
+    assert result["trim"] == {f"L{PKG}/Config;": ["unused()V"], f"L{PKG}/Loader;": ["other()V"]}
+    assert "<clinit>()V" in _kept(root, "Config") and "<clinit>()V" in _kept(root, "Parent")
+    assert "load()V" in _kept(root, "Loader")
+
+def test_unknown_entry_point_keeps_payload(tmp_path):
+    root = _payload(tmp_path, {
+        "Api": _class("Api", _method("public static start()V", "return-void")),
+        "Other": _class("Other", _method("public static run()V", "return-void")),
+    })
+    before = {path.name: path.read_bytes() for path in root.iterdir()}
+    # Patcher gọi method payload không có (lệch phiên bản): không được xoá gì
+    assert shrink.shrink(root, [_entry(tmp_path, "Api;->init()V", "Api;->start()V")]) is None
+    assert {path.name: path.read_bytes() for path in root.iterdir()} == before
@@ -2,63 +2,139 @@
 # 1_unpack.py
 
 import shutil
-import subprocess
 import zipfile
 import sys
+from concurrent.futures import ThreadPoolExecutor
+import fingerprint
+import pristine
+import ramspace
+import shard
+import smali_store
+from cache import StoreCache, hash_file
+from events import Progress
+from profiling import span
+from ziputil import COPY_CHUNK, DEX_ENTRY_RE
 from utils import (
-    CURRENT_DIR, TARGET_JARS, UNPACK_DIRS, BAKSMALI_JAR, 
-    check_tools, log, delete_dir, ensure_dir
+    CURRENT_DIR, TARGET_JARS, UNPACK_DIRS, BAKSMALI_JAR,
+    check_tools, log, delete_dir, ensure_dir, stage
 )
 
-def unpack_jar(jar_file):
-    jar_path = CURRENT_DIR / jar_file
-    out_dir = CURRENT_DIR / UNPACK_DIRS[jar_file]
+def decompile_dex(dex_path, smali_dir, cache=None):
+    with span(f"{smali_dir.parent.name}/{dex_path.name}", "dex", bytes=dex_path.stat().st_size) as sp:
+        key = hash_file(dex_path) if cache else None
+        if cache and cache.get(key, smali_dir):
+            sp.set(cache="hit")
+            log(f"Cache hit {dex_path.name} -> {smali_dir.name}", "SUCCESS")
+            return
+
+        delete_dir(smali_dir)
+        ensure_dir(smali_dir)
+        shard.run_java(BAKSMALI_JAR, ["d", dex_path, "-o", smali_dir], check=True, capture_output=True, text=True)
+        if cache:
+            cache.put(key, smali_dir)
+        log(f"Decompiled {dex_path.name} -> {smali_dir.name}", "SUCCESS")
+
+def decompile_dex_packed(dex_path, out_dir, cache=None):
+    """Decompile rồi gom cây smali vào container của smali_store; cache lưu luôn container."""
+    container = smali_store.container_path(out_dir, dex_path.stem)
+    with span(f"{out_dir.name}/{dex_path.name}", "dex", bytes=dex_path.stat().st_size, store="packed") as sp:
+        key = hash_file(dex_path) if cache else None
+        if cache and cache.get(key, container):
+            sp.set(cache="hit")
+            log(f"Cache hit {dex_path.name} -> {container.name}", "SUCCESS")
+            return
+
+        smali_dir = out_dir / f"smali_{dex_path.stem}"
+        decompile_dex(dex_path, smali_dir)
+        sp.set(files=smali_store.pack(smali_dir, container))
+        delete_dir(smali_dir)
+        if cache:
+            cache.put(key, container)
+
+def unpack_jar(jar_file, base=CURRENT_DIR, cache=None) -> bool:
+    jar_path = base / jar_file
+    out_dir = base / UNPACK_DIRS[jar_file]
 
     log(f"Đang giải nén {jar_file}...", "PROCESS")
     delete_dir(out_dir)
-    ensure_dir(out_dir)
 
     try:
-        with zipfile.ZipFile(jar_path, "r") as zip_ref:
-            zip_ref.extractall(out_dir)
-        
-        # Decompile DEX files
-        dex_files = list(out_dir.rglob("*.dex"))
-        if not dex_files:
-            log(f"Không tìm thấy file DEX trong {jar_file}", "WARN")
-            return
+        if ramspace.enabled():
+            target, footprint, left = ramspace.place(out_dir, jar_path)
+            if target:
+                log(f"{out_dir.name} -> RAM {target} (ước tính {footprint >> 20} MB)", "INFO")
+            else:
+                log(f"{out_dir.name}: ước tính {footprint >> 20} MB > budget RAM còn {max(left, 0) >> 20} MB, dùng đĩa",
+                    "WARN")
+        ensure_dir(out_dir)
+
+        with stage(f"unpack {jar_file}", bytes=jar_path.stat().st_size):
+            ok = _unpack_jar(jar_file, jar_path, out_dir, cache)
+        ramspace.account(out_dir)
+        return ok
+    except Exception as e:
+        log(f"Lỗi giải nén {jar_file}: {e}", "ERROR", file=jar_file)
+        return False
 
-        for dex_path in dex_files:
-            dex_name = dex_path.stem
-            smali_dir = out_dir / f"smali_{dex_name}"
-            delete_dir(smali_dir)
-            ensure_dir(smali_dir)
+def _unpack_jar(jar_file, jar_path, out_dir, cache) -> bool:
+    # Chỉ giải nén classes*.dex làm đầu vào cho baksmali; resource và META-INF nằm yên trong jar
+    # gốc, repack_jars copy raw chúng sang jar mới
+    dex_files = []
+    with zipfile.ZipFile(jar_path, "r") as zip_ref:
+        for info in zip_ref.infolist():
+            if not DEX_ENTRY_RE.match(info.filename):
+                continue
+            dex_path = out_dir / info.filename
+            with span(f"extract {jar_file}", "zip", entry=info.filename, bytes=info.file_size), \
+                    zip_ref.open(info) as src, open(dex_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, COPY_CHUNK)
+            dex_files.append(dex_path)
 
-            cmd = [
-                "java", "-jar", str(BAKSMALI_JAR), 
-                "d", str(dex_path), "-o", str(smali_dir)
-            ]
-            subprocess.run(cmd, check=True, capture_output=True, text=True)
-            log(f"Decompiled {dex_path.name} -> {smali_dir.name}", "SUCCESS")
+    # Decompile DEX files
+    if not dex_files:
+        log(f"Không tìm thấy file DEX trong {jar_file}", "WARN")
+        return True
 
-    except Exception as e:
-        log(f"Lỗi giải nén {jar_file}: {e}", "ERROR")
-        sys.exit(1)
+    packed = smali_store.enabled()
+    if packed and cache:
+        cache = StoreCache()
+    def decompile(dex_path):
+        if packed:
+            decompile_dex_packed(dex_path, out_dir, cache)
+        else:
+            decompile_dex(dex_path, out_dir / f"smali_{dex_path.stem}", cache)
+        return dex_path
+
+    progress = Progress(f"decompile {jar_file}", len(dex_files), "dex")
+    # Có worker shard thì các dex được gửi đi song song, không thì tuần tự như cũ
+    with ThreadPoolExecutor(max_workers=shard.parallel()) as pool:
+        for dex_path in pool.map(decompile, dex_files):
+            progress.advance(1, dex_path.stat().st_size)
+
+    # Bản gốc để `reset` khôi phục sau khi patch mà không cần decompile lại
+    if pristine.enabled():
+        pristine.snapshot(out_dir)
+    return True
 
 def main():
     if not check_tools():
         sys.exit(1)
 
+    if any((CURRENT_DIR / jar).exists() for jar in TARGET_JARS):
+        fingerprint.preflight()
+
     found_any = False
     for jar in TARGET_JARS:
         if (CURRENT_DIR / jar).exists():
-            unpack_jar(jar)
+            if not unpack_jar(jar):
+                sys.exit(1)
             found_any = True
-    
+
     if not found_any:
         log("Không tìm thấy file JAR nào để giải nén.", "ERROR")
         sys.exit(1)
+    ramspace.report()
 
 if __name__ == "__main__":
     main()
-  
+
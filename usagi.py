@@ -2,6 +2,7 @@
 
 from __future__ import annotations
 
+import argparse
 import os
 import re
 import shutil
@@ -11,6 +12,15 @@ import zipfile
 from pathlib import Path
 from typing import Callable, Dict, List
 
+import events
+import imgread
+import pipeline
+import pristine
+import ramspace
+from events import Progress
+from pristine import mark_dirty, write_patched
+from utils import CURRENT_DIR, check_tools, log
+
 
 class KaoriosToolkit:
     """Self-contained subset of the original FrameworkUnpacker."""
@@ -46,10 +56,10 @@ class KaoriosToolkit:
     # ------------------------------------------------------------------ helpers
     def check_tools(self) -> bool:
         if not self.smali_jar.exists():
-            print("❌ smali.jar không tồn tại.")
+            log("smali.jar không tồn tại.", "ERROR")
             return False
         if not self.baksmali_jar.exists():
-            print("❌ baksmali.jar không tồn tại.")
+            log("baksmali.jar không tồn tại.", "ERROR")
             return False
         return True
 
@@ -59,29 +69,29 @@ class KaoriosToolkit:
             jar_path = self.current_dir / jar
             if jar_path.exists():
                 existing_files.append(jar)
-                print(f"✅ {jar} đã tìm thấy")
+                log(f"{jar} đã tìm thấy", "SUCCESS")
             else:
-                print(f"❌ {jar} không tồn tại")
+                log(f"{jar} không tồn tại", "ERROR")
         return existing_files
 
     # ---------------------------------------------------------------- unpacking
     def unpack_all(self, existing_files: List[str]) -> None:
         if not existing_files:
-            print("❌ Không có file JAR để giải nén.")
+            log("Không có file JAR để giải nén.", "ERROR")
             return
 
-        print(f"\n🚀 Bắt đầu giải nén {len(existing_files)} file JAR...")
+        log(f"Bắt đầu giải nén {len(existing_files)} file JAR...", "PROCESS")
         success = 0
         for jar_file in existing_files:
             if self.unpack_jar(jar_file):
                 success += 1
-        print(f"\n🎉 Hoàn tất! {success}/{len(existing_files)} file OK.")
+        log(f"Hoàn tất! {success}/{len(existing_files)} file OK.", "SUCCESS")
 
     def unpack_jar(self, jar_file: str) -> bool:
         jar_path = self.current_dir / jar_file
         out_dir = self.current_dir / self.unpack_dirs[jar_file]
 
-        print(f"\n📦 Đang giải nén {jar_file}...")
+        log(f"Đang giải nén {jar_file}...", "PROCESS")
         if out_dir.exists():
             shutil.rmtree(out_dir)
         out_dir.mkdir(parents=True, exist_ok=True)
@@ -89,20 +99,20 @@ class KaoriosToolkit:
         try:
             with zipfile.ZipFile(jar_path, "r") as zip_ref:
                 zip_ref.extractall(out_dir)
-            print(f"✅ Đã giải nén vào {out_dir}")
+            log(f"Đã giải nén vào {out_dir}", "SUCCESS")
             self.unpack_dex_files(out_dir, jar_file)
             return True
         except Exception as exc:
-            print(f"❌ Lỗi khi giải nén {jar_file}: {exc}")
+            log(f"Lỗi khi giải nén {jar_file}: {exc}", "ERROR")
             return False
 
     def unpack_dex_files(self, jar_dir: Path, jar_name: str) -> None:
         dex_files = list(jar_dir.rglob("*.dex"))
         if not dex_files:
-            print("ℹ️  Không tìm thấy file DEX.")
+            log("Không tìm thấy file DEX.", "INFO")
             return
 
-        print(f"🔍 Tìm thấy {len(dex_files)} file DEX trong {jar_name}")
+        log(f"Tìm thấy {len(dex_files)} file DEX trong {jar_name}", "INFO")
         for dex_file in dex_files:
             self.unpack_dex(dex_file, jar_name)
 
@@ -115,7 +125,7 @@ class KaoriosToolkit:
             shutil.rmtree(smali_dir)
         smali_dir.mkdir(parents=True, exist_ok=True)
 
-        print(f"📱 Đang decompile {dex_path.name}...")
+        log(f"Đang decompile {dex_path.name}...", "PROCESS")
         cmd = [
             "java",
             "-jar",
@@ -127,13 +137,13 @@ class KaoriosToolkit:
         ]
         try:
             subprocess.run(cmd, check=True, capture_output=True, text=True)
-            print(f"✅ {dex_path.name} → {smali_dir}")
+            log(f"{dex_path.name} → {smali_dir}", "SUCCESS")
         except subprocess.CalledProcessError as exc:
-            print(f"❌ Lỗi decompile {dex_path.name}: {exc.stderr}")
+            log(f"Lỗi decompile {dex_path.name}: {exc.stderr}", "ERROR", file=str(dex_path))
 
     # ----------------------------------------------------------- bootloop fix
     def fix_bootloop_a15(self) -> None:
-        print("\n🔧 Fix bootloop (A15)...")
+        log("Fix bootloop (A15)...", "PROCESS")
         target_files: Dict[str, List[str]] = {
             "framework_unpacked/smali_classes2": [
                 "android/hardware/input/KeyboardLayoutPreviewDrawable$GlyphDrawable.smali",
@@ -164,26 +174,25 @@ class KaoriosToolkit:
         for rel_dir, rel_files in target_files.items():
             dir_path = self.current_dir / rel_dir
             if not dir_path.exists():
-                print(f"❌ Thư mục {rel_dir} không tồn tại.")
+                log(f"Thư mục {rel_dir} không tồn tại.", "ERROR")
                 continue
 
-            print(f"\n📁 Xử lý: {rel_dir}")
+            log(f"Xử lý: {rel_dir}", "INFO")
             for rel_file in rel_files:
                 file_path = dir_path.joinpath(*rel_file.split("/"))
                 if not file_path.exists():
-                    print(f"  ⚠️  Không có: {rel_file}")
+                    log(f"Không có: {rel_file}", "WARN")
                     continue
                 if self.fix_specific_smali_file(file_path):
-                    print(f"  ✅ Đã sửa {rel_file}")
+                    log(f"Đã sửa {rel_file}", "SUCCESS")
                     fixed += 1
                 else:
-                    print(f"  ℹ️  Không cần sửa {rel_file}")
+                    log(f"Không cần sửa {rel_file}", "INFO")
 
-        print(f"\n🎉 Hoàn tất fix bootloop. Tổng file sửa: {fixed}")
-        input("Nhấn Enter để tiếp tục...")
+        log(f"Hoàn tất fix bootloop. Tổng file sửa: {fixed}", "SUCCESS")
 
     def apk_protection(self) -> None:
-        print("\n🛡️ Apk Protection...")
+        log("Apk Protection...", "PROCESS")
         target = (
             self.current_dir
             / "framework_unpacked"
@@ -195,15 +204,13 @@ class KaoriosToolkit:
         )
 
         if not target.exists():
-            print("❌ Không tìm thấy ApkSignatureVerifier.smali.")
-            input("Nhấn Enter để tiếp tục...")
+            log("Không tìm thấy ApkSignatureVerifier.smali.", "ERROR")
             return
 
         if self.patch_apk_signature_verifier(target):
-            print("✅ Đã vá ApkSignatureVerifier.smali.")
+            log("Đã vá ApkSignatureVerifier.smali.", "SUCCESS")
         else:
-            print("ℹ️ Không cần thay đổi hoặc lỗi khi vá.")
-        input("Nhấn Enter để tiếp tục...")
+            log("Không cần thay đổi hoặc lỗi khi vá.", "INFO")
 
     def patch_apk_signature_verifier(self, file_path: Path) -> bool:
         method_key = "getMinimumSignatureSchemeVersionForTargetSdk"
@@ -252,10 +259,10 @@ class KaoriosToolkit:
                 i += 1
 
             if replaced:
-                file_path.write_text("".join(new_lines), encoding="utf-8")
+                write_patched(file_path, "".join(new_lines))
             return replaced
         except Exception as exc:
-            print(f"    ❌ Lỗi sửa {file_path.name}: {exc}")
+            log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path))
             return False
 
     def fix_specific_smali_file(self, smali_file: Path) -> bool:
@@ -322,35 +329,35 @@ class KaoriosToolkit:
                     new_lines.append(line)
 
             if modified:
-                smali_file.write_text("".join(new_lines), encoding="utf-8")
+                write_patched(smali_file, "".join(new_lines))
             return modified
         except Exception as exc:
-            print(f"    ❌ Lỗi xử lý {smali_file.name}: {exc}")
+            log(f"Lỗi xử lý {smali_file.name}: {exc}", "ERROR", file=str(smali_file))
             return False
 
     # --------------------------------------------------------------- kaori kit
     def kaori_toolbox(self) -> None:
-        print("\n🎨 Usagi mod...")
+        log("Usagi mod...", "PROCESS")
         operations = 0
 
         if self.copy_kaorios_folder():
             operations += 1
-            print("    ✅ Copy kaorios hoàn tất")
+            log("Copy kaorios hoàn tất", "SUCCESS")
 
         app_pkg_mgr = self.current_dir / "framework_unpacked" / "smali_classes" / "android" / "app" / "ApplicationPackageManager.smali"
         if app_pkg_mgr.exists() and self.modify_application_package_manager_kaori(app_pkg_mgr):
             operations += 1
-            print("    ✅ ApplicationPackageManager OK")
+            log("ApplicationPackageManager OK", "SUCCESS")
 
         instrumentation = self.current_dir / "framework_unpacked" / "smali_classes" / "android" / "app" / "Instrumentation.smali"
         if instrumentation.exists() and self.modify_instrumentation_kaori(instrumentation):
             operations += 1
-            print("    ✅ Instrumentation OK")
+            log("Instrumentation OK", "SUCCESS")
 
         keystore2 = self.current_dir / "framework_unpacked" / "smali_classes3" / "android" / "security" / "KeyStore2.smali"
         if keystore2.exists() and self.modify_keystore2_kaori(keystore2):
             operations += 1
-            print("    ✅ KeyStore2 OK")
+            log("KeyStore2 OK", "SUCCESS")
 
         android_keystore_spi = (
             self.current_dir
@@ -363,10 +370,9 @@ class KaoriosToolkit:
         )
         if android_keystore_spi.exists() and self.modify_android_keystore_spi_kaori(android_keystore_spi):
             operations += 1
-            print("    ✅ AndroidKeyStoreSpi OK")
+            log("AndroidKeyStoreSpi OK", "SUCCESS")
 
-        print(f"\n🎉 Hoàn tất Usagi mod ({operations} thao tác).")
-        input("Nhấn Enter để tiếp tục...")
+        log(f"Hoàn tất Usagi mod ({operations} thao tác).", "SUCCESS")
 
     def copy_kaorios_folder(self) -> bool:
         try:
@@ -382,16 +388,17 @@ class KaoriosToolkit:
                 / "kaorios"
             )
             if not source.exists():
-                print(f"    ❌ Không có thư mục nguồn {source}")
+                log(f"Không có thư mục nguồn {source}", "ERROR")
                 return False
 
+            mark_dirty(target)
             if target.exists():
                 shutil.rmtree(target)
             target.parent.mkdir(parents=True, exist_ok=True)
             shutil.copytree(source, target)
             return True
         except Exception as exc:
-            print(f"    ❌ Lỗi copy kaorios: {exc}")
+            log(f"Lỗi copy kaorios: {exc}", "ERROR")
             return False
 
     def modify_application_package_manager_kaori(self, file_path: Path) -> bool:
@@ -534,11 +541,11 @@ class KaoriosToolkit:
                 i += 1
 
             if any(modifications.values()):
-                file_path.write_text("".join(new_lines), encoding="utf-8")
+                write_patched(file_path, "".join(new_lines))
                 return True
             return False
         except Exception as exc:
-            print(f"    ❌ Lỗi sửa {file_path.name}: {exc}")
+            log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path))
             return False
 
     def modify_instrumentation_kaori(self, file_path: Path) -> bool:
@@ -579,11 +586,11 @@ class KaoriosToolkit:
                 new_lines.append(line)
 
             if method1_patched or method2_patched:
-                file_path.write_text("".join(new_lines), encoding="utf-8")
+                write_patched(file_path, "".join(new_lines))
                 return True
             return False
         except Exception as exc:
-            print(f"    ❌ Lỗi sửa {file_path.name}: {exc}")
+            log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path))
             return False
 
     def modify_keystore2_kaori(self, file_path: Path) -> bool:
@@ -613,11 +620,11 @@ class KaoriosToolkit:
                 new_lines.append(line)
 
             if patched:
-                file_path.write_text("".join(new_lines), encoding="utf-8")
+                write_patched(file_path, "".join(new_lines))
                 return True
             return False
         except Exception as exc:
-            print(f"    ❌ Lỗi sửa {file_path.name}: {exc}")
+            log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path))
             return False
 
     def modify_android_keystore_spi_kaori(self, file_path: Path) -> bool:
@@ -648,16 +655,16 @@ class KaoriosToolkit:
                 new_lines.append(line)
 
             if patched:
-                file_path.write_text("".join(new_lines), encoding="utf-8")
+                write_patched(file_path, "".join(new_lines))
                 return True
             return False
         except Exception as exc:
-            print(f"    ❌ Lỗi sửa {file_path.name}: {exc}")
+            log(f"Lỗi sửa {file_path.name}: {exc}", "ERROR", file=str(file_path))
             return False
 
     # -------------------------------------------------------------- repack ops
     def repack_all_classes(self) -> None:
-        print("\n=== REPACK ALL CLASSES ===")
+        log("REPACK ALL CLASSES", "PROCESS")
         smali_dirs: List[Path] = []
         for folder in [
             "framework_unpacked",
@@ -672,7 +679,7 @@ class KaoriosToolkit:
                         smali_dirs.append(child)
 
         if not smali_dirs:
-            print("❌ Không tìm thấy thư mục smali.")
+            log("Không tìm thấy thư mục smali.", "ERROR")
             return
 
         for directory in smali_dirs:
@@ -689,18 +696,18 @@ class KaoriosToolkit:
                 "--api",
                 "33",
             ]
-            print(f"\n🔄 Đang repack {directory.name} → {dex_name}")
+            log(f"Đang repack {directory.name} → {dex_name}", "PROCESS")
             result = subprocess.run(cmd, capture_output=True, text=True)
             if result.returncode == 0:
-                print("    ✅ Thành công")
+                log("Thành công", "SUCCESS")
                 shutil.rmtree(directory)
             else:
-                print(f"    ❌ Lỗi: {result.stderr}")
+                log(f"Lỗi: {result.stderr}", "ERROR")
 
-        print("\n🎉 Repack classes hoàn tất.")
+        log("Repack classes hoàn tất.", "SUCCESS")
 
     def repack_all_jar_files(self) -> None:
-        print("\n=== REPACK ALL JAR FILES ===")
+        log("REPACK ALL JAR FILES", "PROCESS")
         candidates = [
             ("framework.jar", "framework_unpacked"),
             ("services.jar", "services_unpacked"),
@@ -714,24 +721,24 @@ class KaoriosToolkit:
             if not dir_path.exists():
                 continue
 
-            print(f"\n🔄 Đang repack {directory} → {jar_name}")
+            log(f"Đang repack {directory} → {jar_name}", "PROCESS")
             cmd = f'jar cfM "{jar_name}" -C "{dir_path}" .'
             result = subprocess.run(cmd, shell=True, capture_output=True, text=True)
             if result.returncode == 0:
-                print("    ✅ Thành công")
+                log("Thành công", "SUCCESS")
                 shutil.rmtree(dir_path)
                 any_repacked = True
             else:
-                print(f"    ❌ Lỗi: {result.stderr}")
+                log(f"Lỗi: {result.stderr}", "ERROR")
 
         if not any_repacked:
-            print("❌ Không có thư mục unpacked để repack.")
+            log("Không có thư mục unpacked để repack.", "ERROR")
         else:
-            print("\n🎉 Repack JAR hoàn tất.")
+            log("Repack JAR hoàn tất.", "SUCCESS")
 
     # -------------------------------------------------------------- module zip
     def create_test_module(self) -> None:
-        print("\n📦 Tạo Test Module...")
+        log("Tạo Test Module...", "PROCESS")
         module_root = self.module_dir
         framework_dir = module_root / "system" / "framework"
         system_ext_dir = module_root / "system" / "system_ext" / "framework"
@@ -748,24 +755,26 @@ class KaoriosToolkit:
         for src, dst in copies:
             if src.exists():
                 shutil.copy2(src, dst)
-                print(f"   ✅ Copy {src.name}")
+                log(f"Copy {src.name}", "SUCCESS")
             else:
-                print(f"   ⚠️  Thiếu {src.name}")
+                log(f"Thiếu {src.name}", "WARN")
 
         zip_path = self.current_dir / "Module-framework-test.zip"
+        progress = Progress("module", unit="files")
         with zipfile.ZipFile(zip_path, "w", zipfile.ZIP_DEFLATED) as zipf:
             for root, _, files in os.walk(module_root):
                 for file in files:
                     file_path = Path(root) / file
                     arcname = file_path.relative_to(module_root)
                     zipf.write(file_path, arcname)
-                    print(f"   ➕ {arcname}")
+                    progress.advance(1, file_path.stat().st_size)
+        progress.finish()
 
         for _, dst in copies:
             if dst.exists():
                 dst.unlink()
 
-        print("🎉 Đã tạo Module-framework-test.zip thành công.")
+        log("Đã tạo Module-framework-test.zip thành công.", "SUCCESS")
 
 
 # ==============================================================================
@@ -773,12 +782,19 @@ class KaoriosToolkit:
 # ==============================================================================
 
 class KaoriosCLI:
+    # Chỉ menu tương tác mới dừng chờ Enter; các hàm của toolkit không hỏi gì
+    pause_after = {"2", "3", "4"}
+
     def __init__(self) -> None:
         self.toolkit = KaoriosToolkit()
 
     def run(self) -> None:
+        # Menu cần stdin/stdout dạng text; wrapper dùng subcommand để nhận sự kiện JSON
+        if events.json_mode():
+            log("Menu tương tác không hỗ trợ KAORI_EVENTS=json, hãy dùng subcommand (vd. usagi.py all).", "ERROR")
+            return
         if not self.toolkit.check_tools():
-            print("\n❌ Thiếu smali/baksmali. Thoát Usagi mod.")
+            log("Thiếu smali/baksmali. Thoát Usagi mod.", "ERROR")
             return
 
         while True:
@@ -802,9 +818,11 @@ class KaoriosCLI:
 
             action = actions.get(choice)
             if not action:
-                print("❌ Lựa chọn không hợp lệ.")
+                log("Lựa chọn không hợp lệ.", "ERROR")
                 continue
             action()
+            if choice in self.pause_after:
+                input("Nhấn Enter để tiếp tục...")
 
     def _unpack_all_jars(self) -> None:
         files = self.toolkit.check_target_files()
@@ -829,10 +847,115 @@ class KaoriosCLI:
         print()
 
 
-def main() -> None:
-    KaoriosCLI().run()
+# ==============================================================================
+# Subcommands (không tương tác)
+# ==============================================================================
+
+EXIT_OK = 0
+EXIT_FAILED = 1        # có node thất bại / quá budget
+EXIT_USAGE = 2         # tham số không hợp lệ (giống argparse)
+EXIT_MISSING = 3       # thiếu smali/baksmali hoặc không có gì để xử lý
+
+SUBCOMMANDS: Dict[str, List[str]] = {
+    "unpack": ["unpack"],
+    "patch": ["bootloop", "apk", "kaori"],
+    "repack": ["repack"],
+    "module": ["module"],
+    "all": list(pipeline.STAGES),
+}
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="Usagi mod. Không có tham số: mở menu tương tác.",
+    )
+    commands = parser.add_subparsers(dest="command", required=True, metavar="COMMAND")
+    for name, stages in SUBCOMMANDS.items():
+        sub = commands.add_parser(name, help=f"Chạy: {', '.join(stages)}")
+        sub.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="Số node chạy song song")
+        sub.add_argument("--only", nargs="+", choices=stages, metavar="STAGE",
+                         help=f"Chỉ chạy các bước này ({', '.join(stages)})")
+        sub.add_argument("--skip", nargs="+", choices=stages, metavar="STAGE", help="Bỏ qua các bước này")
+        sub.add_argument("--budget", action="append", metavar="KIND=SECONDS",
+                         help=f"Budget cho loại node ({', '.join(pipeline.DEFAULT_BUDGETS)}); chỉ cảnh báo: "
+                              "node quá budget làm pipeline thất bại và dừng lập lịch, nhưng vẫn chạy nốt")
+        sub.add_argument("--events", choices=["json"], help="Xuất sự kiện tiến độ dạng JSON thay cho log text")
+        if "unpack" in stages:
+            sub.add_argument("--image", action="append", metavar="IMG",
+                             help="Lấy jar trực tiếp từ system/system_ext image (ext4/EROFS)")
+
+    reset = commands.add_parser("reset", help="Khôi phục file đã patch về bản gốc sau unpack")
+    reset.add_argument("jars", nargs="*", metavar="JAR", help="Mặc định: mọi jar có snapshot")
+    reset.add_argument("--events", choices=["json"], help="Xuất sự kiện tiến độ dạng JSON thay cho log text")
+    return parser
+
+
+def select_stages(command: str, only: List[str] | None, skip: List[str] | None) -> List[str]:
+    stages = SUBCOMMANDS[command]
+    if only:
+        stages = [stage for stage in stages if stage in only]
+    return [stage for stage in stages if stage not in (skip or [])]
+
+
+def run_command(args: argparse.Namespace) -> int:
+    events.configure(args.events)
+    if args.command == "reset":
+        return run_reset(args.jars)
+
+    stages = select_stages(args.command, args.only, args.skip)
+    if not stages:
+        log("Không còn bước nào để chạy sau --only/--skip.", "ERROR")
+        return EXIT_USAGE
+    try:
+        budgets = pipeline.parse_budgets(args.budget)
+    except ValueError as exc:
+        log(str(exc), "ERROR")
+        return EXIT_USAGE
+
+    # Chỉ unpack/repack mới gọi tới smali/baksmali
+    if {"unpack", "repack"} & set(stages) and not check_tools():
+        return EXIT_MISSING
+    if getattr(args, "image", None) and "unpack" in stages:
+        try:
+            imgread.extract_jars(args.image)
+        except (OSError, imgread.ImageError) as exc:
+            log(str(exc), "ERROR")
+            return EXIT_MISSING
+
+    key, hit = pipeline.restore_build(CURRENT_DIR, stages, args.jobs)
+    if hit:
+        return EXIT_OK
+    outputs = pipeline.build_outputs(CURRENT_DIR)
+    stages = pipeline.preflight(CURRENT_DIR, stages)
+    dag = pipeline.build_graph(stages=stages, workers=max(1, args.jobs), budgets=budgets)
+    if not dag.nodes:
+        log("Không tìm thấy file JAR hoặc thư mục *_unpacked nào để xử lý.", "ERROR")
+        return EXIT_MISSING
+
+    log(f"{args.command}: {', '.join(stages)} ({len(dag.nodes)} node, {dag.workers} luồng)", "PROCESS")
+    ok = dag.run()
+    dag.report()
+    ramspace.report()
+    if ok:
+        pipeline.store_build(CURRENT_DIR, key, outputs)
+    return EXIT_OK if ok else EXIT_FAILED
+
+
+def run_reset(jars: List[str]) -> int:
+    unknown = [jar for jar in jars if jar not in KaoriosToolkit.unpack_dirs]
+    if unknown:
+        log(f"Jar không hỗ trợ: {', '.join(unknown)}", "ERROR")
+        return EXIT_USAGE
+    return EXIT_OK if pristine.reset_jars(jars=jars or None) else EXIT_MISSING
+
+
+def main(argv: List[str] | None = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        KaoriosCLI().run()
+        return
+    sys.exit(run_command(build_parser().parse_args(argv)))
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,16 +1,29 @@
 #!/usr/bin/env python3
 # utils.py
 
+import argparse
 import os
+import shlex
 import shutil
+import subprocess
 import zipfile
 from pathlib import Path
+import events
+import ramspace
+import resources
+from contextlib import contextmanager
+from profiling import span
 
 CURRENT_DIR = Path.cwd()
 SMALI_JAR = CURRENT_DIR / "smali.jar"
 BAKSMALI_JAR = CURRENT_DIR / "baksmali.jar"
 USAGI_DIR = CURRENT_DIR / "USAGI"
 MODULE_DIR = CURRENT_DIR / "module"
+CACHE_DIR = CURRENT_DIR / ".kaori_cache"
+# Thư mục metadata của công cụ bên trong mỗi *_unpacked (không đóng vào jar)
+META_DIR = ".kaori"
+# Lệnh chạy JVM; có thể thay bằng công cụ giả lập khi benchmark (xem standin_tools.py)
+JAVA_CMD = shlex.split(os.getenv("KAORI_JAVA", "java"))
 
 TARGET_JARS = [
     "framework.jar",
@@ -26,21 +39,55 @@ UNPACK_DIRS = {
     "miui-services.jar": "miui_services_unpacked",
 }
 
+def jar_arg(value: str) -> str:
+    """type= cho tham số argparse là tên jar (nargs="*" kèm choices= lỗi khi không truyền jar nào)."""
+    if value not in TARGET_JARS:
+        raise argparse.ArgumentTypeError(f"jar không hợp lệ: {value} (chọn trong {', '.join(TARGET_JARS)})")
+    return value
+
 def check_tools():
     if not SMALI_JAR.exists() or not BAKSMALI_JAR.exists():
-        print("❌ Lỗi: Thiếu smali.jar hoặc baksmali.jar")
+        log("Lỗi: Thiếu smali.jar hoặc baksmali.jar", "ERROR")
         return False
     return True
 
-def log(msg, level="INFO"):
+def log(msg, level="INFO", **fields):
+    if events.json_mode():
+        if level == "ERROR":
+            events.error(msg, **fields)
+        else:
+            events.emit("log", level=level, message=msg, **fields)
+        return
+    if not events.text_enabled():
+        return
     icons = {"INFO": "ℹ️", "SUCCESS": "✅", "ERROR": "❌", "WARN": "⚠️", "PROCESS": "📦"}
     print(f"{icons.get(level, '')} {msg}")
 
+@contextmanager
+def stage(name, **attrs):
+    """Span profiling + sự kiện stage_start/stage_end cho một bước."""
+    with events.stage(name), span(name, "stage", **attrs) as sp:
+        yield sp
+
 def ensure_dir(path: Path):
     if not path.exists():
         path.mkdir(parents=True, exist_ok=True)
 
 def delete_dir(path: Path):
+    # *_unpacked có thể là symlink tới workspace trên RAM (ramspace.py)
+    if path.is_symlink():
+        ramspace.release(path)
+        return
     if path.exists():
         shutil.rmtree(path)
-      
+
+def run_java(jar: Path, args, **kwargs):
+    cmd = [*JAVA_CMD, "-jar", str(jar), *[str(arg) for arg in args]]
+    target = Path(str(args[1]))
+    target = f"{target.parent.name}/{target.name}"
+    with span(f"{Path(jar).stem} {args[0]}", "jvm", target=target) as sp:
+        if not resources.enabled():
+            return subprocess.run(cmd, **kwargs)
+        result, usage = resources.run_sampled(cmd, target, **kwargs)
+        sp.set(**usage)
+        return result
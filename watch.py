@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# watch.py
+#
+# Chế độ watch khi sửa payload USAGI/kaorios hoặc patcher (bootloop.py, apk.py, kaori.py).
+# framework_unpacked được giữ lại giữa các lần build; mỗi thay đổi chỉ assemble lại dex bị ảnh hưởng
+# rồi thay đúng entry đó trong framework.jar và module zip (các entry khác copy raw, không nén lại).
+#   KAORI_PRISTINE=1 python usagi.py unpack   một lần, từ framework.jar gốc (snapshot gốc để áp lại patcher)
+#   python watch.py               build lần đầu rồi theo dõi thay đổi
+#   python watch.py --once        build một lần rồi thoát
+# Payload đổi: chép lại kaorios (shrink theo các file đã vá) và assemble smali_classes5.
+# Patcher đổi: reload module, reset các file đã vá về bản gốc, vá lại, assemble các dex liên quan.
+
+import argparse
+import importlib
+import os
+import sys
+import time
+from pathlib import Path
+
+import apk
+import bootloop
+import events
+import fingerprint
+import kaori
+import multidex
+import pipeline
+import pristine
+import repack
+from cache import DexCache
+from smali_store import prepare_assembly
+from ziputil import replace_entries
+from utils import CURRENT_DIR, UNPACK_DIRS, check_tools, log, stage
+
+FRAMEWORK = "framework.jar"
+PATCH_MODULES = [bootloop, apk, kaori]
+
+def snapshot_sources() -> dict:
+    """{đường dẫn: (mtime_ns, size)} của payload và các file patcher."""
+    files = {}
+    for root, _, names in os.walk(kaori.KAORIOS_SOURCE):
+        for name in names:
+            path = os.path.join(root, name)
+            st = os.stat(path)
+            files[path] = (st.st_mtime_ns, st.st_size)
+    for module in PATCH_MODULES:
+        st = os.stat(module.__file__)
+        files[module.__file__] = (st.st_mtime_ns, st.st_size)
+    return files
+
+def smali_dirs(unpack_root: Path) -> set:
+    return {child.name for child in unpack_root.iterdir() if child.is_dir() and child.name.startswith("smali_classes")}
+
+def refresh_payload(base) -> set:
+    if kaori.copy_kaorios_folder(base):
+        kaori.shrink_kaorios(base)
+    return {kaori.KAORIOS_TARGET.parts[1]}
+
+def repatch(base) -> set:
+    """Áp lại mọi patcher từ bản gốc. Trả về các thư mục smali_classesN bị ảnh hưởng."""
+    unpack_root = base / UNPACK_DIRS[FRAMEWORK]
+    before = pristine.dirty_paths(unpack_root)
+    has_snapshot = pristine.reset(unpack_root) is not None
+    for module in PATCH_MODULES:
+        importlib.reload(module)
+    pipeline.patch_jar(base, FRAMEWORK, pipeline.PATCH_STAGES)
+    if not has_snapshot:
+        log("Không có snapshot gốc: patcher đã đổi chỉ áp lên file chưa vá, cần unpack lại với KAORI_PRISTINE=1",
+            "WARN")
+        return smali_dirs(unpack_root)
+    touched = before + pristine.dirty_paths(unpack_root)
+    return {rel.split("/")[0] for rel in touched if rel.startswith("smali_classes")}
+
+def build(base, dex_dirs, cache) -> bool:
+    """Assemble các dex trong dex_dirs và thay vào framework.jar + module zip."""
+    unpack_root = base / UNPACK_DIRS[FRAMEWORK]
+    if multidex.enabled():
+        # Payload chép lại vào smali_classes5 được chuyển tiếp sang dex đã chọn ở lần trước nếu cần
+        planned, moved = multidex.plan_jar(base, FRAMEWORK)
+        if not planned:
+            return False
+        dex_dirs = set(dex_dirs) | moved
+    prepare_assembly(unpack_root)
+    api = fingerprint.api_level(base)
+    replacements = {}
+    for name in sorted(dex_dirs):
+        directory = unpack_root / name
+        if not directory.is_dir():
+            continue
+        output = unpack_root / (name.replace("smali_", "") + ".dex")
+        if not repack.assemble_dex(directory, output, cache, api):
+            return False
+        replacements[output.name] = output
+    if not replacements:
+        return True
+
+    jar = base / FRAMEWORK
+    with stage("hot-swap", entries=",".join(replacements)):
+        replace_entries(jar, replacements)
+        module = base / repack.MODULE_ZIP
+        if module.exists():
+            replace_entries(module, {repack.MODULE_JARS[FRAMEWORK]: jar})
+        else:
+            repack.create_module(base)
+    return True
+
+def changed_paths(old: dict, new: dict) -> set:
+    return {path for path in old.keys() | new.keys() if old.get(path) != new.get(path)}
+
+def watch(base, interval, cache):
+    seen = snapshot_sources()
+    log(f"Đang theo dõi {kaori.KAORIOS_SOURCE} và patcher (Ctrl+C để thoát)", "PROCESS")
+    while True:
+        time.sleep(interval)
+        current = snapshot_sources()
+        if current == seen:
+            continue
+        # Chờ editor ghi xong (hai lần quét liên tiếp giống nhau)
+        while True:
+            time.sleep(interval)
+            settled = snapshot_sources()
+            if settled == current:
+                break
+            current = settled
+
+        changed = changed_paths(seen, current)
+        seen = current
+        started = time.perf_counter()
+        with stage("watch rebuild", files=len(changed)):
+            if changed & {module.__file__ for module in PATCH_MODULES}:
+                dex_dirs = repatch(base) | {kaori.KAORIOS_TARGET.parts[1]}
+            else:
+                dex_dirs = refresh_payload(base)
+            ok = build(base, dex_dirs, cache)
+        elapsed = time.perf_counter() - started
+        if ok:
+            log(f"Đã cập nhật {', '.join(sorted(dex_dirs))} trong {elapsed:.1f}s", "SUCCESS")
+        else:
+            log(f"Build lỗi sau {elapsed:.1f}s, chờ thay đổi tiếp theo", "ERROR")
+
+def main():
+    parser = argparse.ArgumentParser(description="Theo dõi payload kaorios / patcher và hot-swap dex")
+    parser.add_argument("--interval", type=float, default=1.0, help="Chu kỳ quét (giây)")
+    parser.add_argument("--once", action="store_true", help="Build một lần rồi thoát")
+    parser.add_argument("--events", choices=["json"], help="Xuất sự kiện tiến độ dạng JSON thay cho log text")
+    args = parser.parse_args()
+    events.configure(args.events)
+
+    base = CURRENT_DIR
+    unpack_root = base / UNPACK_DIRS[FRAMEWORK]
+    if not check_tools():
+        sys.exit(1)
+    if not unpack_root.exists() or not (base / FRAMEWORK).exists():
+        log(f"Cần {FRAMEWORK} và {unpack_root.name} (chạy unpack trước)", "ERROR")
+        sys.exit(1)
+
+    cache = DexCache()
+    started = time.perf_counter()
+    # Lần đầu: vá (idempotent) và assemble mọi dex đang có smali để jar khớp với workspace
+    dex_dirs = repatch(base) | smali_dirs(unpack_root)
+    if not build(base, dex_dirs, cache):
+        sys.exit(1)
+    log(f"Build đầu tiên xong trong {time.perf_counter() - started:.1f}s", "SUCCESS")
+    if args.once:
+        return
+    try:
+        watch(base, args.interval, cache)
+    except KeyboardInterrupt:
+        log("Dừng watch.", "INFO")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+# ziputil.py
+
+import os
+import re
+import shutil
+import struct
+import zipfile
+from pathlib import Path
+
+LOCAL_HEADER_SIZE = 30
+FLAG_DATA_DESCRIPTOR = 0x08
+# Timestamp cố định cho mọi entry (giống AOSP): cùng đầu vào thì zip giống hệt từng byte
+ZIP_EPOCH = (2008, 1, 1, 0, 0, 0)
+COPY_CHUNK = 1 << 20
+# Dex ở gốc jar: unpack chỉ giải nén các entry này, các entry khác được copy raw khi repack
+DEX_ENTRY_RE = re.compile(r"classes\d*\.dex$")
+
+def entry_data_offset(fp, info: zipfile.ZipInfo) -> int:
+    """Offset của dữ liệu entry (sau local header, có thể khác central directory)."""
+    fp.seek(info.header_offset)
+    header = fp.read(LOCAL_HEADER_SIZE)
+    name_len, extra_len = struct.unpack("<HH", header[26:30])
+    return info.header_offset + LOCAL_HEADER_SIZE + name_len + extra_len
+
+def read_raw_entry(src: zipfile.ZipFile, info: zipfile.ZipInfo) -> bytes:
+    """Đọc dữ liệu đã nén của một entry mà không giải nén."""
+    src.fp.seek(entry_data_offset(src.fp, info))
+    return src.fp.read(info.compress_size)
+
+def write_raw_entry(dst: zipfile.ZipFile, info: zipfile.ZipInfo, raw: bytes, arcname=None, date_time=None):
+    """
+    Ghi entry đã nén sẵn vào dst (không nén lại); date_time thay timestamp gốc nếu có.
+    Dựa vào cách ZipFile ghi central directory khi close: chỉ cần thêm ZipInfo
+    vào filelist và cập nhật start_dir.
+    """
+    zinfo = zipfile.ZipInfo(arcname or info.filename, date_time or info.date_time)
+    zinfo.compress_type = info.compress_type
+    zinfo.external_attr = info.external_attr
+    zinfo.create_system = info.create_system
+    zinfo.flag_bits = info.flag_bits & ~FLAG_DATA_DESCRIPTOR
+    zinfo.CRC = info.CRC
+    zinfo.compress_size = len(raw)
+    zinfo.file_size = info.file_size
+    zinfo.header_offset = dst.fp.tell()
+    dst.fp.write(zinfo.FileHeader())
+    dst.fp.write(raw)
+    dst.start_dir = dst.fp.tell()
+    dst.filelist.append(zinfo)
+    dst.NameToInfo[zinfo.filename] = zinfo
+
+def write_file(dst: zipfile.ZipFile, path, arcname: str, compress_type=None):
+    """Như ZipFile.write nhưng timestamp và permission cố định, không phụ thuộc máy build."""
+    st = os.stat(path)
+    info = zipfile.ZipInfo(arcname, ZIP_EPOCH)
+    info.external_attr = (0o100755 if st.st_mode & 0o111 else 0o100644) << 16
+    info.compress_type = dst.compression if compress_type is None else compress_type
+    info.file_size = st.st_size
+    with open(path, "rb") as src, dst.open(info, "w") as out:
+        shutil.copyfileobj(src, out, COPY_CHUNK)
+
+def sorted_files(root: Path, exclude=()):
+    """(đường dẫn, arcname) của mọi file trong cây theo thứ tự cố định; exclude: tên bỏ qua ở cấp gốc."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        if Path(dirpath) == root:
+            dirnames[:] = [name for name in dirnames if name not in exclude]
+        dirnames.sort()
+        for name in sorted(filenames):
+            file_path = Path(dirpath) / name
+            yield file_path, file_path.relative_to(root).as_posix()
+
+def walk_order(arcname: str) -> list:
+    """Key sắp arcname đúng thứ tự sorted_files (file của một thư mục đứng trước thư mục con)."""
+    *dirs, name = arcname.split("/")
+    return [(1, part) for part in dirs] + [(0, name)]
+
+def copy_entries_raw(src: zipfile.ZipFile, dst: zipfile.ZipFile, skip=None, prefix=""):
+    count = 0
+    for info in src.infolist():
+        if info.is_dir() or (skip and skip(info.filename)):
+            continue
+        write_raw_entry(dst, info, read_raw_entry(src, info), prefix + info.filename)
+        count += 1
+    return count
+
+def replace_entries(zip_path: Path, replacements: dict, compression=zipfile.ZIP_DEFLATED) -> int:
+    """
+    Thay (hoặc thêm) các entry {arcname: Path} trong zip_path: entry khác được copy raw,
+    chỉ entry thay thế bị nén lại. Ghi ra file tạm rồi os.replace. Trả về số entry copy raw.
+    """
+    tmp = zip_path.with_name(f".{zip_path.name}.{os.getpid()}.tmp")
+    try:
+        with zipfile.ZipFile(zip_path, "r") as src, zipfile.ZipFile(tmp, "w", compression) as dst:
+            copied = copy_entries_raw(src, dst, skip=lambda name: name in replacements)
+            for arcname, path in replacements.items():
+                write_file(dst, path, arcname)
+        os.replace(tmp, zip_path)
+    finally:
+        Path(tmp).unlink(missing_ok=True)
+    return copied